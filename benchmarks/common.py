@@ -0,0 +1,65 @@
+from typing import Callable, Dict, List, Optional
+import json
+import subprocess
+import time
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def summarize(latencies: List[float], elapsed: float, cpu: float, total_bytes: int = 0) -> Dict:
+    frames = len(latencies)
+    return {
+        "frames": frames,
+        "fps": round(frames / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "bytes_per_frame": round(total_bytes / frames) if frames else 0,
+        "cpu_s": round(cpu, 3),
+        "cpu_ms_per_frame": round(cpu / frames * 1000, 3) if frames else 0.0,
+    }
+
+
+def measure(func: Callable[[], Optional[int]], iterations: int) -> Dict:
+    latencies: List[float] = []
+    total_bytes = 0
+    cpu_start, start = time.thread_time(), time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        size = func()
+        latencies.append(time.perf_counter() - t0)
+        total_bytes += size or 0
+    return summarize(latencies, time.perf_counter() - start, time.thread_time() - cpu_start, total_bytes)
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def write_results(path: str, results: Dict) -> None:
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump({"revision": git_revision(), "created": time.time(), **results}, file, indent=2, sort_keys=True)
+    print(f"Results written to {path}")
+
+
+def compare_results(old_path: str, new: Dict, prefix: str = "") -> None:
+    with open(old_path, encoding="utf-8") as file:
+        old = json.load(file)
+
+    def walk(old_node: Dict, new_node: Dict, path: str) -> None:
+        for key, value in new_node.items():
+            if isinstance(value, dict) and isinstance(old_node.get(key), dict):
+                walk(old_node[key], value, f"{path}{key}.")
+            elif key in ("fps", "p50_ms", "p95_ms", "p99_ms", "cpu_ms_per_frame") and old_node.get(key):
+                print(f"{path}{key}: {old_node[key]} -> {value} ({value / old_node[key] - 1:+.1%})")
+
+    walk(old, new, prefix)
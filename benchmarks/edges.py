@@ -0,0 +1,121 @@
+"""
+Gauge edge/mask micro-benchmark: legacy full-frame implementation vs. the buffered ROI pipeline.
+
+    python -m benchmarks.edges --output bench_edges.json
+"""
+from typing import Callable, Dict
+import argparse
+import math
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from lib import barometer_recognition, circle_division
+from .common import measure, write_results
+
+
+def synthetic_gauge(width: int = 1920, height: int = 1080, circle=(960, 540, 250)) -> np.ndarray:
+    image = np.full((height, width, 3), 200, dtype=np.uint8)
+    x, y, r = circle
+    cv2.circle(image, (x, y), r, (30, 30, 30), 6)
+    for step in range(0, 360, 9):
+        angle = math.radians(step)
+        outer = (int(x + r * math.cos(angle)), int(y + r * math.sin(angle)))
+        inner = (int(x + 0.85 * r * math.cos(angle)), int(y + 0.85 * r * math.sin(angle)))
+        cv2.line(image, inner, outer, (30, 30, 30), 2)
+    cv2.line(image, (x, y), (x + int(0.7 * r), y - int(0.4 * r)), (0, 0, 180), 5)
+    return image
+
+
+def legacy_detect_edges(image: np.ndarray, circle) -> np.ndarray:
+    # Baseline implementation: full-frame mask, discarded GaussianBlur+Canny pass, two painted copies
+    x, y, r = circle
+    mask = np.zeros_like(image)
+    cv2.circle(mask, (x, y), r, (255, 255, 255), -1)
+    masked_image = cv2.bitwise_and(image, mask)
+    gray_masked = cv2.cvtColor(masked_image, cv2.COLOR_BGR2GRAY)
+    blurred_masked = cv2.GaussianBlur(gray_masked, (15, 15), 2)
+    edges = cv2.Canny(blurred_masked, 50, 150)
+    blurred_masked = cv2.medianBlur(gray_masked, 5)
+    edges = cv2.Canny(blurred_masked, 50, 150)
+    edges = cv2.morphologyEx(edges, cv2.MORPH_CLOSE, np.ones((3, 3), np.uint8))
+    image_with_edges = np.copy(image)
+    image_with_edges[edges != 0] = [0, 0, 255]
+    cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    image_with_edges = np.copy(image)
+    image_with_edges[edges != 0] = [0, 0, 255]
+    return image_with_edges
+
+
+def buffered_detect_edges(image: np.ndarray, circle) -> np.ndarray:
+    edges, (x0, y0) = barometer_recognition.find_edges(image, circle)
+    cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    image_with_edges = np.copy(image)
+    height, width = edges.shape
+    image_with_edges[y0 : y0 + height, x0 : x0 + width][edges != 0] = [0, 0, 255]
+    return image_with_edges
+
+
+def legacy_detect_arrow(image: np.ndarray):
+    # Baseline implementation: a full-frame mask and a full-frame AND for every candidate circle
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    edges = cv2.Canny(cv2.GaussianBlur(gray, (5, 5), 0), 50, 150)
+    circles = cv2.HoughCircles(edges, cv2.HOUGH_GRADIENT, dp=1.2, minDist=100, param1=50, param2=30)
+    if circles is None:
+        return None, None, None
+    for x, y, r in np.round(circles[0, :]).astype("int"):
+        mask = np.zeros_like(gray)
+        cv2.circle(mask, (x, y), r, 255, -1)
+        contours, _ = cv2.findContours(
+            cv2.bitwise_and(edges, edges, mask=mask), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
+        )
+        if contours:
+            longest = max(contours, key=lambda contour: cv2.arcLength(contour, True))
+            bx, by, bw, bh = cv2.boundingRect(longest)
+            if len(longest) < 5:
+                continue
+            return (bx + bw // 2, by + bh // 2), cv2.fitEllipse(longest)[-1], (int(x), int(y), int(r))
+    return None, None, None
+
+
+def profile(func: Callable[[], object], iterations: int) -> Dict:
+    func()  # warm up caches and buffers
+    result = measure(lambda: (func(), 0)[1], iterations)
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before, _ = tracemalloc.get_traced_memory()
+    func()
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result["alloc_peak_bytes_per_frame"] = peak - before
+    result["alloc_retained_bytes_per_frame"] = after - before
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--output", default="bench_edges.json")
+    args = parser.parse_args()
+
+    image = synthetic_gauge()
+    circle = (960, 540, 250)
+    results = {
+        "detect_edges": {
+            "legacy": profile(lambda: legacy_detect_edges(image, circle), args.iterations),
+            "buffered": profile(lambda: buffered_detect_edges(image, circle), args.iterations),
+        },
+        "detect_arrow": {
+            "legacy": profile(lambda: legacy_detect_arrow(image), args.iterations),
+            "buffered": profile(lambda: circle_division.detect_arrow(image), args.iterations),
+        },
+    }
+    for stage, variants in results.items():
+        for name, stats in variants.items():
+            print(f"{stage:20} {name:9} p50={stats['p50_ms']:8.3f} ms  peak alloc={stats['alloc_peak_bytes_per_frame']}")
+    write_results(args.output, results)
+
+
+if __name__ == "__main__":
+    main()
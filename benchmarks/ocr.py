@@ -0,0 +1,68 @@
+"""
+OCR throughput benchmark: the legacy image_to_string + image_to_boxes pass over the full frame vs. the TextRecognizer
+stage, on a static scene (sensor noise only) and on a scene whose reading changes every frame. Needs tesseract.
+
+    python -m benchmarks.ocr --output bench_ocr.json
+"""
+from typing import Callable, Dict, List
+import argparse
+
+import cv2
+import numpy as np
+import pytesseract
+
+from lib.text_recognition import TESSERACT_CONFIG, TextRecognizer
+from .common import measure, write_results
+
+
+def synthetic_display(value: int, width: int = 1280, height: int = 720) -> np.ndarray:
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    image[:] = np.linspace(150, 230, width, dtype=np.uint8)[None, :, None]
+    cv2.putText(image, f"PRESSURE {value} hPa", (100, 200), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (20, 20, 20), 3)
+    cv2.putText(image, "TEMP 21.5 C", (700, 500), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (20, 20, 20), 2)
+    cv2.circle(image, (640, 360), 100, (50, 50, 50), 3)
+    return image
+
+
+def with_noise(image: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    noise = rng.integers(-6, 7, image.shape, dtype=np.int16)
+    return np.clip(image.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+
+def legacy_ocr(image: np.ndarray) -> None:
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    pytesseract.image_to_string(gray, config=TESSERACT_CONFIG)
+    pytesseract.image_to_boxes(gray, config=TESSERACT_CONFIG)
+
+
+def run(func: Callable[[np.ndarray], object], frames: List[np.ndarray], iterations: int) -> Dict:
+    index = iter(range(iterations))
+    return measure(lambda: (func(frames[next(index) % len(frames)]), 0)[1], iterations)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=60)
+    parser.add_argument("--output", default="bench_ocr.json")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    scenes = {
+        "static": [with_noise(synthetic_display(1013), rng) for _ in range(10)],
+        "changing": [with_noise(synthetic_display(1000 + value), rng) for value in range(10)],
+    }
+    results = {
+        scene: {
+            "legacy": run(legacy_ocr, frames, args.iterations),
+            "recognizer": run(TextRecognizer().recognize, frames, args.iterations),
+        }
+        for scene, frames in scenes.items()
+    }
+    for scene, variants in results.items():
+        for name, stats in variants.items():
+            print(f"{scene:9} {name:11} fps={stats['fps']:8.1f}  p50={stats['p50_ms']:8.3f} ms")
+    write_results(args.output, results)
+
+
+if __name__ == "__main__":
+    main()
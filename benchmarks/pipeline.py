@@ -0,0 +1,194 @@
+"""
+Capture -> encode -> multipart -> client decode benchmark.
+
+    python -m benchmarks.pipeline --output bench_results.json [--compare old.json]
+"""
+from typing import Dict, List
+import argparse
+import os
+import resource
+import socket
+import subprocess
+import sys
+import threading
+import time
+import cv2
+
+from lib import camera, encoders, receiver, sources
+from lib.jpeg_cache import PART_HEADER
+from .common import compare_results, measure, percentile, summarize, write_results
+
+RESOLUTIONS = {"360p": (640, 360), "720p": (1280, 720), "1080p": (1920, 1080)}
+QUALITIES = (60, 80, 95)
+
+
+def bench_capture(resolution: str, iterations: int) -> Dict:
+    width, height = RESOLUTIONS[resolution]
+    cam = camera.BaseWebCamera(source=sources.SyntheticSource(width, height, fps=0))
+    try:
+        return measure(lambda: cam.get_frame().nbytes, iterations)
+    finally:
+        # Threads and metric collectors of one run must not leak into the next measurements
+        cam.close()
+
+
+def bench_encode(encoder: encoders.JpegEncoder, resolution: str, quality: int, iterations: int) -> Dict:
+    width, height = RESOLUTIONS[resolution]
+    _, frame = sources.SyntheticSource(width, height, fps=0).read()
+    result = measure(lambda: len(encoder.encode(frame, quality)), iterations)
+    result["bytes"] = len(encoder.encode(frame, quality))
+    return result
+
+
+def bench_multipart(resolution: str, iterations: int) -> Dict:
+    width, height = RESOLUTIONS[resolution]
+    _, frame = sources.SyntheticSource(width, height, fps=0).read()
+    jpeg = cv2.imencode(".jpg", frame)[1].tobytes()
+    return measure(lambda: len(b"".join((PART_HEADER % (len(jpeg), 0, 0.0), jpeg, b"\r\n"))), iterations)
+
+
+def bench_parser(resolution: str, iterations: int, chunk_size: int = 64 * 1024) -> Dict:
+    width, height = RESOLUTIONS[resolution]
+    _, frame = sources.SyntheticSource(width, height, fps=0).read()
+    jpeg = cv2.imencode(".jpg", frame)[1].tobytes()
+    # Strip Content-Length so the parser has to scan for boundaries, the worst case
+    part = b"".join((b"--frame\r\nContent-Type: image/jpeg\r\n\r\n", jpeg, b"\r\n"))
+    stream = part * 16
+    chunks = [stream[offset : offset + chunk_size] for offset in range(0, len(stream), chunk_size)]
+    parser = receiver.MultipartParser()
+
+    def parse() -> int:
+        parsed = 0
+        for chunk in chunks:
+            parsed += sum(len(payload) for payload in parser.feed(chunk))
+        return parsed
+
+    result = measure(parse, max(iterations // 16, 1))
+    result["frames_per_s"] = round(16 / (result["p50_ms"] / 1000), 1) if result["p50_ms"] else 0.0
+    return result
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _start_server(source: str, port: int) -> subprocess.Popen:
+    env = {**os.environ, "CAMERA_SOURCE": source}
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"], env=env
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("Server did not start")
+
+
+def _client_worker(url: str, duration: float, stats: Dict, barrier: threading.Barrier) -> None:
+    client = receiver.ClientReceiver(url, reconnect=False)
+    # Capture (server frame timestamp) to decoded frame in the client, and the client's decode time alone
+    latencies: List[float] = []
+    decode_times: List[float] = []
+    total_bytes = 0
+    barrier.wait()
+    deadline = time.monotonic() + duration
+    for _, timestamp, payload in client._get_parts():  # pylint: disable=protected-access
+        t0 = time.perf_counter()
+        frame = client._decode(payload)  # pylint: disable=protected-access
+        if frame is not None:
+            decode_times.append(time.perf_counter() - t0)
+            latencies.append(time.time() - timestamp)
+            total_bytes += len(payload)
+        if time.monotonic() >= deadline:
+            break
+    client.close()
+    stats["latencies"] = latencies
+    stats["decode_times"] = decode_times
+    stats["bytes"] = total_bytes
+
+
+def bench_clients(source: str, clients: int, duration: float) -> Dict:
+    port = _free_port()
+    server_cpu_start = resource.getrusage(resource.RUSAGE_CHILDREN)
+    server = _start_server(source, port)
+    try:
+        url = f"http://127.0.0.1:{port}"
+        workers_stats: List[Dict] = [{} for _ in range(clients)]
+        barrier = threading.Barrier(clients + 1)
+        workers = [
+            threading.Thread(target=_client_worker, args=(url, duration, stats, barrier), daemon=True)
+            for stats in workers_stats
+        ]
+        for worker in workers:
+            worker.start()
+        cpu_start = time.process_time()
+        barrier.wait()
+        start = time.perf_counter()
+        for worker in workers:
+            worker.join(duration + 30)
+        elapsed = time.perf_counter() - start
+        client_cpu = time.process_time() - cpu_start
+    finally:
+        server.terminate()
+        server.wait()
+    server_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    server_cpu = (server_usage.ru_utime - server_cpu_start.ru_utime) + (
+        server_usage.ru_stime - server_cpu_start.ru_stime
+    )
+
+    latencies = [latency for stats in workers_stats for latency in stats.get("latencies", [])]
+    total_bytes = sum(stats.get("bytes", 0) for stats in workers_stats)
+    result = summarize(latencies, elapsed, client_cpu, total_bytes)
+    decode_times = [decode for stats in workers_stats for decode in stats.get("decode_times", [])]
+    # p50/p95/p99_ms are capture to decoded frame; both ends share the host clock
+    result["decode_p50_ms"] = round(percentile(decode_times, 50) * 1000, 3)
+    result["decode_p95_ms"] = round(percentile(decode_times, 95) * 1000, 3)
+    result["fps_per_client"] = round(result["fps"] / clients, 2)
+    result["server_cpu_s"] = round(server_cpu, 3)
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--source", default="synthetic:1280x720@30")
+    parser.add_argument("--encoders", nargs="+", default=encoders.available_encoders())
+    parser.add_argument("--subsampling", default="420", choices=encoders.SUBSAMPLING)
+    parser.add_argument("--fast-dct", action="store_true")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare")
+    args = parser.parse_args()
+
+    results: Dict = {"source": args.source, "capture": {}, "encode": {}, "multipart": {}, "parser": {}, "clients": {}}
+    # Only libjpeg-turbo exposes the fast DCT
+    backends = [
+        encoders.create_encoder(name, subsampling=args.subsampling, fast_dct=args.fast_dct and name == "turbojpeg")
+        for name in args.encoders
+    ]
+    for resolution in RESOLUTIONS:
+        results["capture"][resolution] = bench_capture(resolution, args.iterations)
+        results["multipart"][resolution] = bench_multipart(resolution, args.iterations)
+        results["parser"][resolution] = bench_parser(resolution, args.iterations)
+        for encoder in backends:
+            for quality in QUALITIES:
+                key = f"{encoder.name}_{resolution}_q{quality}"
+                results["encode"][key] = bench_encode(encoder, resolution, quality, args.iterations)
+                print(f"encode {key:24} p50={results['encode'][key]['p50_ms']:8.3f} ms")
+    for clients in args.clients:
+        results["clients"][str(clients)] = bench_clients(args.source, clients, args.duration)
+
+    write_results(args.output, results)
+    if args.compare:
+        compare_results(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
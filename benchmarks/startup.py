@@ -0,0 +1,143 @@
+"""
+Server startup benchmark: `import main` in a fresh interpreter, time until `uvicorn main:app` answers, and time
+to the first frame of a camera opened on demand.
+
+    python -m benchmarks.startup --output bench_startup.json [--compare old.json]
+"""
+from typing import Dict, List
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+from .common import compare_results, percentile, write_results
+
+# Modules that must not be loaded just by importing the server
+HEAVY_MODULES = ("cv2", "ffmpeg", "requests", "pytesseract", "turbojpeg", "PIL")
+
+
+def timings(samples: List[float]) -> Dict:
+    return {
+        "runs": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 1),
+        "p95_ms": round(percentile(samples, 95) * 1000, 1),
+        "max_ms": round(max(samples) * 1000, 1) if samples else 0.0,
+    }
+
+
+def bench_import(runs: int) -> Dict:
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "import main"], check=True)
+        samples.append(time.perf_counter() - start)
+    interpreter = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], check=True)
+        interpreter.append(time.perf_counter() - start)
+
+    check = f"import sys, main; print(','.join(name for name in {HEAVY_MODULES!r} if name in sys.modules))"
+    loaded = subprocess.run([sys.executable, "-c", check], check=True, capture_output=True, text=True).stdout.strip()
+    return {
+        **timings(samples),
+        "interpreter": timings(interpreter),
+        "heavy_modules_loaded": loaded.split(",") if loaded else [],
+    }
+
+
+def slowest_imports(count: int = 10) -> List[Dict]:
+    # -X importtime reports "self | cumulative | module" per import on stderr, nested imports indented by two
+    # spaces per level and listed before the module that imported them
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"], check=True, capture_output=True, text=True
+    ).stderr
+    rows: List[Dict] = []
+    children: List[Dict] = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:") :].split("|")
+        name = module[1:]
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth == 1:
+            children.append({"module": name.strip(), "cumulative_ms": int(cumulative) / 1000})
+        elif depth == 0:
+            # What main imports directly, each with everything it pulled in
+            if name == "main":
+                rows = children
+            children = []
+    return sorted(rows, key=lambda row: row["cumulative_ms"], reverse=True)[:count]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url: str, timeout: float) -> bytes:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with urllib.request.urlopen(url, timeout=timeout) as response:
+                return response.read(1)
+        except (urllib.error.URLError, ConnectionError):
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.005)
+
+
+def bench_ready(runs: int, source: str, timeout: float) -> Dict:
+    ready, first_frame = [], []
+    env = {**os.environ, "CAMERAS": f"default={source}"}
+    for _ in range(runs):
+        port = free_port()
+        start = time.perf_counter()
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"], env=env
+        )
+        try:
+            wait_for(f"http://127.0.0.1:{port}/cams", timeout)
+            ready.append(time.perf_counter() - start)
+            # The camera opens with the first stream request, not at startup
+            opened = time.perf_counter()
+            wait_for(f"http://127.0.0.1:{port}/cams/default/frames", timeout)
+            first_frame.append(time.perf_counter() - opened)
+        finally:
+            server.terminate()
+            server.wait()
+    return {**timings(ready), "first_frame": timings(first_frame)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--source", default="synthetic:1280x720@30")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--output", default="bench_startup.json")
+    parser.add_argument("--compare")
+    args = parser.parse_args()
+
+    results = {
+        "import": bench_import(args.runs),
+        "slowest_imports": slowest_imports(),
+        "ready": bench_ready(args.runs, args.source, args.timeout),
+    }
+    print(f"import main    p50={results['import']['p50_ms']:8.1f} ms")
+    print(f"server ready   p50={results['ready']['p50_ms']:8.1f} ms")
+    print(f"first frame    p50={results['ready']['first_frame']['p50_ms']:8.1f} ms")
+    if results["import"]["heavy_modules_loaded"]:
+        print(f"loaded at import: {', '.join(results['import']['heavy_modules_loaded'])}")
+
+    write_results(args.output, results)
+    if args.compare:
+        compare_results(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,16 +6,17 @@ from fastapi.responses import Response as FastResponse
 from flask import Response as FlaskResponse
 
 from server import server_fastapi, server_flaskapi
-from lib import camera
+from lib import registry
 
 MIMETYPE: str = "multipart/x-mixed-replace; boundary=frame"
 
+cameras = registry.CameraRegistry({"default": "0"})
 fastapi_app = server_fastapi.fastapi_app()
 
 
 @fastapi_app.api_route("/", methods=["GET", "HEAD"])
 def raw():
-    stream = camera.WebCameraStream()
+    stream = cameras.get()
     return StreamingResponse(stream.stream_frame_bytes(), headers=stream.get_metadata(), media_type=MIMETYPE)
 
 
@@ -24,8 +25,11 @@ flask_app = server_flaskapi.flask_app()
 
 @flask_app.route("/")
 def video():
-    stream = camera.WebCameraStream()
-    return FlaskResponse(stream.stream_img_bytes(), headers=stream.get_metadata(), mimetype=MIMETYPE)
+    stream = cameras.get()
+    flip, client_flip = stream.resolve_mirror()
+    return FlaskResponse(
+        stream.stream_img_bytes(mirror=flip), headers=stream.get_metadata(mirror=client_flip), mimetype=MIMETYPE
+    )
 
 
 if __name__ == "__main__":
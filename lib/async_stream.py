@@ -0,0 +1,214 @@
+from typing import TYPE_CHECKING, AsyncGenerator, Dict, List, Optional, Sequence, Set, Tuple
+import asyncio
+import itertools
+import logging
+import time
+
+from .frame_buffer import Frame
+from .framing import KIND_JPEG, pack_frame, pack_image
+from .renditions import RENDITIONS, find_rendition, scaled_size
+
+if TYPE_CHECKING:
+    from .camera import BaseWebCamera
+
+logger = logging.getLogger(__name__)
+
+# quality, output size, mirrored
+RenditionKey = Tuple[Optional[int], Optional[Tuple[int, int]], bool]
+# "multipart" parts, or binary frames (see framing.py) carrying a "jpeg" or "raw" payload
+FRAMINGS = ("multipart", "jpeg", "raw")
+
+_subscriber_ids = itertools.count()
+
+
+class AsyncSubscriber:
+    # Fraction of the frame interval spent sending one chunk above/below which an adaptive client moves on the ladder
+    STEP_DOWN_LOAD = 0.8
+    STEP_UP_LOAD = 0.3
+    STEP_UP_AFTER_S = 5.0
+
+    def __init__(
+        self,
+        key: RenditionKey,
+        queue_size: int = 2,
+        ladder: Sequence[RenditionKey] = (),
+        index: int = 0,
+        rendition: str = "custom",
+        framing: str = "multipart",
+        flags: int = 0,
+    ) -> None:
+        self.key = key
+        self.rendition = rendition
+        self.framing = framing
+        self.flags = flags
+        self.client_id = next(_subscriber_ids)
+        # (capture timestamp, chunk), a None chunk ends the stream
+        self.queue: "asyncio.Queue[Tuple[float, Optional[bytes]]]" = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.ladder = ladder
+        self.index = index
+        self.throughput = 0.0
+        self.load = 0.0
+        self._dropped_seen = 0
+        self._good_frames = 0
+
+    def observe_send(self, size: int, elapsed: float, fps: float) -> None:
+        elapsed = max(elapsed, 1e-6)
+        self.throughput = 0.8 * self.throughput + 0.2 * size / elapsed if self.throughput else size / elapsed
+        self.load = 0.8 * self.load + 0.2 * elapsed * fps
+        if not self.ladder:
+            return
+
+        dropped, self._dropped_seen = self.dropped > self._dropped_seen, self.dropped
+        if (dropped or self.load > self.STEP_DOWN_LOAD) and self.index < len(self.ladder) - 1:
+            self._switch(self.index + 1)
+        elif self.load < self.STEP_UP_LOAD and self.index > 0:
+            self._good_frames += 1
+            if self._good_frames >= fps * self.STEP_UP_AFTER_S:
+                self._switch(self.index - 1)
+        else:
+            self._good_frames = 0
+
+    def _switch(self, index: int) -> None:
+        self.index = index
+        self.key = self.ladder[index]
+        self.rendition = RENDITIONS[index].name
+        # Start the new rendition from a neutral estimate so one measurement can't bounce it straight back
+        self.load = (self.STEP_DOWN_LOAD + self.STEP_UP_LOAD) / 2
+        self._good_frames = 0
+
+    def push(self, chunk: Optional[bytes], timestamp: float = 0.0) -> bool:
+        # Slow clients lose their oldest queued chunk instead of holding back everyone else
+        dropped = self.queue.full()
+        if dropped:
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait((timestamp, chunk))
+        return dropped
+
+
+class AsyncFrameHub:
+    def __init__(self, camera: "BaseWebCamera", loop: asyncio.AbstractEventLoop) -> None:
+        self.camera = camera
+        self.loop = loop
+        self.subscribers: Set[AsyncSubscriber] = set()
+        self._pending: Optional[Frame] = None
+        self._dispatcher: Optional["asyncio.Task[None]"] = None
+        camera.frames.add_listener(self._on_frame)
+
+    def close(self) -> None:
+        self.camera.frames.remove_listener(self._on_frame)
+        self.end_of_stream()
+
+    def end_of_stream(self) -> None:
+        # Safe from any thread: the capture ended, so every current stream finishes once its queued chunks are sent
+        if not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._end_streams)
+
+    def ladder(self, mirror: bool = False) -> List[RenditionKey]:
+        return [
+            (rendition.quality, scaled_size(rendition.height, self.camera.width, self.camera.height), mirror)
+            for rendition in RENDITIONS
+        ]
+
+    def subscribe(
+        self,
+        rendition: Optional[str] = None,
+        quality: Optional[int] = None,
+        height: Optional[int] = None,
+        queue_size: int = 2,
+        mirror: bool = False,
+        framing: str = "multipart",
+        flags: int = 0,
+    ) -> AsyncSubscriber:
+        if framing not in FRAMINGS:
+            raise ValueError(f"Unknown framing {framing!r}, expected one of {', '.join(FRAMINGS)}")
+        options = {"framing": framing, "flags": flags}
+        if framing == "raw":
+            # Capture frames as they are: no rendition, no mirroring
+            return AsyncSubscriber((None, None, False), queue_size, rendition="raw", **options)
+        # Explicit quality/height pins a custom rendition, a rendition name pins a ladder step, otherwise adapt
+        if quality is not None or height is not None:
+            size = scaled_size(height, self.camera.width, self.camera.height)
+            return AsyncSubscriber((quality, size, mirror), queue_size, **options)
+        ladder = self.ladder(mirror)
+        if rendition is not None:
+            index = find_rendition(rendition)
+            return AsyncSubscriber(ladder[index], queue_size, rendition=rendition, **options)
+        return AsyncSubscriber(ladder[0], queue_size, ladder=ladder, rendition=RENDITIONS[0].name, **options)
+
+    async def stream(self, subscriber: Optional[AsyncSubscriber] = None) -> AsyncGenerator[bytes, None]:
+        subscriber = subscriber or self.subscribe()
+        self.subscribers.add(subscriber)
+        self.camera.start()
+        fps = self.camera.fps or 30
+        try:
+            while True:
+                timestamp, chunk = await subscriber.queue.get()
+                if chunk is None:
+                    break
+                # Resuming after yield means the server accepted the chunk: that time is our send throughput
+                started = self.loop.time()
+                yield chunk
+                self.camera.bytes_sent.inc(len(chunk))
+                self.camera.glass_to_client.observe(time.time() - timestamp)
+                subscriber.observe_send(len(chunk), self.loop.time() - started, fps)
+        finally:
+            self.subscribers.discard(subscriber)
+
+    def get_stats(self) -> Dict:
+        subscribers = list(self.subscribers)
+        return {
+            "async_subscribers": len(subscribers),
+            "async_dropped_chunks": [subscriber.dropped for subscriber in subscribers],
+            "async_renditions": [subscriber.rendition for subscriber in subscribers],
+            "async_throughput_bps": [round(subscriber.throughput) for subscriber in subscribers],
+        }
+
+    def _on_frame(self, frame: Frame) -> None:
+        # Runs on the capture thread: only hand the frame over to the event loop
+        if self.subscribers and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._schedule, frame)
+
+    def _end_streams(self) -> None:
+        for subscriber in list(self.subscribers):
+            subscriber.push(None)
+
+    def _schedule(self, frame: Frame) -> None:
+        self._pending = frame
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = self.loop.create_task(self._dispatch())
+
+    async def _dispatch(self) -> None:
+        # If encoding falls behind capture, only the newest pending frame is encoded
+        while self._pending is not None:
+            frame, self._pending = self._pending, None
+            groups: Dict[Tuple[RenditionKey, str, int], List[AsyncSubscriber]] = {}
+            for subscriber in list(self.subscribers):
+                groups.setdefault((subscriber.key, subscriber.framing, subscriber.flags), []).append(subscriber)
+
+            chunks = await asyncio.gather(
+                *(self.loop.run_in_executor(self.camera.encode_pool, self._render, frame, *group) for group in groups),
+                return_exceptions=True,
+            )
+            for subscribers, chunk in zip(groups.values(), chunks):
+                if isinstance(chunk, BaseException):
+                    # A rendition that can't be encoded ends its streams, rather than leaving them waiting for frames
+                    logger.error("Encoding a frame of camera %s failed", self.camera.name, exc_info=chunk)
+                    for subscriber in subscribers:
+                        self.subscribers.discard(subscriber)
+                        subscriber.push(None)
+                    continue
+                for subscriber in subscribers:
+                    if subscriber.push(chunk, frame.timestamp):
+                        self.camera.dropped_frames.inc()
+
+    def _render(self, frame: Frame, key: RenditionKey, framing: str, flags: int) -> bytes:
+        # Runs on the encode pool; both framings of a rendition share one cached encode
+        if framing == "multipart":
+            return self.camera.jpeg_cache.get_chunk(frame, *key)
+        if framing == "raw":
+            return pack_image(frame.seq, frame.timestamp, frame.image, flags)
+        width, height = key[1] or (self.camera.width, self.camera.height)
+        jpeg = self.camera.jpeg_cache.get_jpeg(frame, *key)
+        return pack_frame(KIND_JPEG, frame.seq, frame.timestamp, width, height, jpeg, flags)
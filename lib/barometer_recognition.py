@@ -2,6 +2,80 @@ import cv2
 import numpy as np
 import threading
 
+from .roi_tracker import CircleTracker
+from .vision_buffers import CLOSE_KERNEL, BufferPool, circle_mask, circle_roi
+
+# Промежуточные изображения переиспользуются между кадрами вместо выделения памяти на каждом кадре
+_buffers = BufferPool()
+
+
+def find_barometer(image, min_radius=50, max_radius=300):
+    shape = image.shape[:2]
+
+    # Преобразование изображения в оттенки серого и применение размытия для снижения шума
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=_buffers.get("search_gray", shape))
+    blurred = cv2.GaussianBlur(gray, (15, 15), 2, dst=_buffers.get("search_blurred", shape))
+
+    # Применение операции Canny для выделения границ
+    edges = cv2.Canny(blurred, 50, 150, edges=_buffers.get("search_edges", shape))
+
+    # Поиск кругов на изображении с помощью метода HoughCircles
+    circles = cv2.HoughCircles(edges, cv2.HOUGH_GRADIENT, dp=1, minDist=100, param1=50, param2=60, minRadius=min_radius, maxRadius=max_radius)
+
+    if circles is not None:
+        x, y, r = np.round(circles[0, 0]).astype("int")
+        return (int(x), int(y), int(r))
+    return None
+
+
+def track_barometer(image, tracker):
+    # Между полными поисками ищем круг только в окрестности последнего найденного положения
+    region = tracker.search_region(image.shape)
+    if region is not None:
+        x0, y0, x1, y1, min_radius, max_radius = region
+        circle = find_barometer(image[y0:y1, x0:x1], min_radius, max_radius)
+        if circle is not None:
+            circle = (circle[0] + x0, circle[1] + y0, circle[2])
+        if tracker.confirm(circle):
+            return tracker.circle
+    return tracker.reset(find_barometer(image))
+
+
+def find_edges(image, circle):
+    # Возвращает грани внутри круга для вырезанной области и смещение этой области (x0, y0)
+    x, y, r = circle
+
+    # Обрабатываем только квадрат вокруг барометра, а не весь кадр
+    x0, y0, x1, y1 = circle_roi(circle, image.shape)
+    roi = image[y0:y1, x0:x1]
+    shape = roi.shape[:2]
+
+    # Маска круга кэшируется по (r, размер, центр) и не создается заново на каждом кадре
+    gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY, dst=_buffers.get("edges_gray", shape))
+    gray_masked = np.bitwise_and(gray, circle_mask(r, shape, (x - x0, y - y0)), out=_buffers.get("edges_masked", shape))
+
+    # Применение медианного фильтра для уменьшения шумов
+    blurred_masked = cv2.medianBlur(gray_masked, 5, dst=_buffers.get("edges_blurred", shape))
+    edges = cv2.Canny(blurred_masked, 50, 150, edges=_buffers.get("edges_canny", shape))
+
+    # Морфологическая операция закрытия
+    closed = cv2.morphologyEx(edges, cv2.MORPH_CLOSE, CLOSE_KERNEL, dst=_buffers.get("edges_closed", shape))
+    return closed, (x0, y0)
+
+
+_tracker = CircleTracker()
+
+
+def analyze(image):
+    # Функция для конвейера распознавания: ничего не рисует и не открывает окон
+    circle = track_barometer(image, _tracker)
+    if circle is None:
+        return {"circle": None}
+    edges, _ = find_edges(image, circle)
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    return {"circle": circle, "edges_detected": bool(contours)}
+
+
 class RealTimeTextRecognition:
     def __init__(self):
         # Инициализация видеозахвата с веб-камеры
@@ -11,6 +85,7 @@ class RealTimeTextRecognition:
 
         self.running = True
         self.capture_triggered = False  # Флаг для фиксации изображения
+        self.tracker = CircleTracker()  # Отслеживание барометра между кадрами
 
     def __del__(self):
         # Освобождение ресурсов
@@ -19,48 +94,15 @@ class RealTimeTextRecognition:
         cv2.destroyAllWindows()
 
     def detect_barometer(self, image):
-        # Преобразование изображения в оттенки серого и применение размытия для снижения шума
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        blurred = cv2.GaussianBlur(gray, (15, 15), 2)
-
-        # Применение операции Canny для выделения границ
-        edges = cv2.Canny(blurred, 50, 150)
-
-        # Поиск кругов на изображении с помощью метода HoughCircles
-        circles = cv2.HoughCircles(edges, cv2.HOUGH_GRADIENT, dp=1, minDist=100, param1=50, param2=60, minRadius=50, maxRadius=300)
-
-        if circles is not None:
-            circles = np.round(circles[0, :]).astype("int")
-            for (x, y, r) in circles:
-                # Нарисовать круг на изображении
-                cv2.circle(image, (x, y), r, (0, 255, 0), 2)
-                return (x, y, r)
-        return None
+        circle = track_barometer(image, self.tracker)
+        if circle is not None:
+            # Нарисовать круг на изображении
+            x, y, r = circle
+            cv2.circle(image, (x, y), r, (0, 255, 0), 2)
+        return circle
 
     def detect_edges(self, image, circle):
-        x, y, r = circle
-
-        # Создаем маску для зеленой окружности ROI
-        mask = np.zeros_like(image)
-        cv2.circle(mask, (x, y), r, (255, 255, 255), -1)
-
-        # Применяем маску к изображению и выделяем границы
-        masked_image = cv2.bitwise_and(image, mask)
-        gray_masked = cv2.cvtColor(masked_image, cv2.COLOR_BGR2GRAY)
-
-        blurred_masked = cv2.GaussianBlur(gray_masked, (15, 15), 2)  # Увеличен размер ядра для размытия
-        edges = cv2.Canny(blurred_masked, 50, 150)
-
-        # Применение медианного фильтра для дальнейшего уменьшения шумов
-        blurred_masked = cv2.medianBlur(gray_masked, 5)
-        edges = cv2.Canny(blurred_masked, 50, 150)
-
-        kernel = np.ones((3, 3), np.uint8)  # Морфологическое ядро
-        edges = cv2.morphologyEx(edges, cv2.MORPH_CLOSE, kernel)  # Морфологическая операция закрытия
-       # edges = cv2.morphologyEx(edges, cv2.MORPH_OPEN, kernel)   # Морфологическая операция открытия
-
-        image_with_edges = np.copy(image)
-        image_with_edges[edges != 0] = [0, 0, 255]  # Красный цвет для граней
+        edges, (x0, y0) = find_edges(image, circle)
 
         # Проверяем наличие контуров
         contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
@@ -71,7 +113,8 @@ class RealTimeTextRecognition:
 
         # Отображение граней на исходном изображении
         image_with_edges = np.copy(image)
-        image_with_edges[edges != 0] = [0, 0, 255]  # Красный цвет для граней
+        height, width = edges.shape
+        image_with_edges[y0:y0 + height, x0:x0 + width][edges != 0] = [0, 0, 255]  # Красный цвет для граней
         cv2.imshow('Edges', image_with_edges)
 
     def capture_and_process_image(self):
@@ -1,72 +1,428 @@
-from typing import Generator, Optional
-import cv2
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, AsyncGenerator, Dict, Generator, Optional, Set, Tuple, Union
+import asyncio
+import logging
+import threading
+import time
 import numpy as np
 
+from .async_stream import AsyncFrameHub
+from .encoders import JpegEncoder
+from .frame_buffer import Frame, FrameCursor, FrameRing
+from .jpeg_cache import JpegCache
+from .lazy import lazy_import
+from .metrics import REGISTRY, SIZE_BUCKETS
+from .recorder import VideoRecorder
+from .renditions import RENDITIONS, scaled_size
+from .shm_transport import SharedFrameWriter
 from .singleton import Singleton
-#from .text_recognition import RealTimeTextRecognition
-#from .circle_division import RealTimeTextRecognition
-#from .barometer_recognition import RealTimeTextRecognition
-from .test_opencv import CameraCapture
+from .sources import DeviceSource, FrameSource, create_source
+
+if TYPE_CHECKING:
+    import cv2
+else:
+    cv2 = lazy_import("cv2")
+
+logger = logging.getLogger(__name__)
+
+# Where the selfie-view mirror of the JPEG streams happens: "encode" flips the (downscaled) rendition on the server,
+# "client" only sends a Mirror header so the viewer flips it (e.g. CSS transform: scaleX(-1)), "none" disables it.
+# "auto" is "client" for sources that hand out ready JPEGs (mjpeg:N, encoded shm rings, relays), whose frames would
+# otherwise be decoded, flipped and encoded again, and "encode" for the others.
+# Captured frames are never flipped: raw, shared memory, recording and recognition consumers get them as they are.
+MIRROR_MODES = ("auto", "encode", "client", "none")
+
+# How long stop() waits for the capture thread to finish its current grab
+STOP_TIMEOUT_S = 5.0
+
+# Backoff between attempts to reopen a device that stopped delivering frames
+REOPEN_MIN_S = 0.5
+REOPEN_MAX_S = 10.0
+
 
 class BaseWebCamera:
-    def __init__(self, cam_id: int = 0) -> None:
+    def __init__(
+        self,
+        cam_id: int = 0,
+        buffer_size: int = 16,
+        source: Union[FrameSource, str, None] = None,
+        encoder: Optional[JpegEncoder] = None,
+        encode_workers: int = 2,
+        mirror: str = "auto",
+        low_latency: bool = False,
+        stall_timeout: float = 2.0,
+    ) -> None:
+        if mirror not in MIRROR_MODES:
+            raise ValueError(f"Unknown mirror mode {mirror!r}, expected one of {', '.join(MIRROR_MODES)}")
         self.cam_id = cam_id
-        self.cam = cv2.VideoCapture(self.cam_id)
-        self.cam.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc("M", "J", "P", "G"))
-        self.cam.set(cv2.CAP_PROP_FRAME_WIDTH, 1920)
-        self.cam.set(cv2.CAP_PROP_FRAME_HEIGHT, 1080)
-        self.width = int(self.cam.get(3))
-        self.height = int(self.cam.get(4))
-        self.fps = int(self.cam.get(5))
-
-    def get_metadata(self) -> dict:
+        self.mirror = mirror
+        self.name = source if isinstance(source, str) else str(cam_id)
+        if source is None:
+            source = DeviceSource(self.cam_id, low_latency=low_latency)
+        elif isinstance(source, str):
+            source = create_source(source, low_latency=low_latency)
+        self.cam = source
+        if self.mirror == "auto":
+            self.mirror = "client" if self.cam.compressed else "encode"
+        # Seconds without a frame after which the device is considered stalled and reopened
+        self.stall_timeout = stall_timeout
+        self.width = self.cam.width
+        self.height = self.cam.height
+        self.fps = self.cam.fps
+
+        labels = {"camera": self.name}
+        self.read_seconds = REGISTRY.histogram(
+            "webcam_read_seconds", "Time spent grabbing and retrieving a frame"
+        ).labels(**labels)
+        self.frames_captured = REGISTRY.counter("webcam_frames_captured_total", "Captured frames").labels(**labels)
+        self.read_failures = REGISTRY.counter("webcam_read_failures_total", "Failed frame reads").labels(**labels)
+        self.reopens = REGISTRY.counter("webcam_reopens_total", "Device reopens after a stall").labels(**labels)
+        self.glass_to_client = REGISTRY.histogram(
+            "webcam_glass_to_client_seconds", "Capture (grab) to stream chunk handed to the client"
+        ).labels(**labels)
+        self.bytes_sent = REGISTRY.counter("webcam_bytes_sent_total", "Stream bytes handed to clients").labels(**labels)
+        self.dropped_frames = REGISTRY.counter(
+            "webcam_dropped_frames_total", "Frames skipped by clients that fell behind"
+        ).labels(**labels)
+        self._unregister_collectors = [
+            REGISTRY.collector("webcam_capture_fps", "Measured capture frame rate", self._collect_fps),
+            REGISTRY.collector("webcam_subscribers", "Active stream subscribers", self._collect_subscribers),
+            REGISTRY.collector("webcam_client_lag_frames", "Frames waiting per client", self._collect_lag),
+            REGISTRY.collector("webcam_client_dropped_frames", "Frames dropped per client", self._collect_dropped),
+            REGISTRY.collector("webcam_jpeg_cache_hit_ratio", "Encoded chunk cache hit ratio", self._collect_cache),
+            REGISTRY.collector(
+                "webcam_drained_frames_total",
+                "Stale frames skipped by low-latency capture",
+                self._collect_drained,
+                kind="counter",
+            ),
+        ]
+
+        self.frames = FrameRing(buffer_size)
+        self.cursors: Set[FrameCursor] = set()
+        self.jpeg_cache = JpegCache(
+            encoder=encoder,
+            encode_seconds=REGISTRY.histogram("webcam_encode_seconds", "JPEG encode time").labels(**labels),
+            encoded_bytes=REGISTRY.histogram(
+                "webcam_encoded_bytes", "Encoded JPEG size", buckets=SIZE_BUCKETS
+            ).labels(**labels),
+        )
+        # Encoders release the GIL, so a few threads encode renditions of one frame in parallel
+        self.encode_pool = ThreadPoolExecutor(encode_workers, thread_name_prefix=f"encode-{self.name}")
+        self.async_hub: Optional[AsyncFrameHub] = None
+        self.shm_writer: Optional[SharedFrameWriter] = None
+        self._shm_pending: Optional[Frame] = None
+        self._shm_encoding = False
+        self._shm_lock = threading.Lock()
+        self.recorder: Optional[VideoRecorder] = None
+        self.capture_fps = 0.0
+        self._capture_thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def get_metadata(self, mirror: bool = False) -> dict:
+        # mirror tells the client to flip the frames itself, they are sent unmirrored
         frame_transform = ",".join(map(str, (self.height, self.width, 3)))
-        return {
+        metadata = {
             "Frame-Transform": frame_transform,
             "Chunk-Size": "1024,1024",
             "FPS": str(self.fps),
         }
+        if mirror:
+            metadata["Mirror"] = "1"
+        return metadata
+
+    def resolve_mirror(self, mirror: Optional[bool] = None) -> Tuple[bool, bool]:
+        # (flip while encoding, ask the client to flip) for a JPEG stream; an explicit mirror overrides the camera mode
+        if mirror is not None:
+            return mirror, False
+        return self.mirror == "encode", self.mirror == "client"
 
-    def get_frame(self) -> np.ndarray:
-        _, frame = self.cam.read()
-        frame = cv2.flip(frame, 1)
-        return frame
+    def get_frame(self, mirror: bool = False) -> np.ndarray:
+        # The newest captured frame while the capture thread runs, otherwise a fresh one from the source
+        latest = self.frames.latest() if self.capturing else None
+        if latest is not None:
+            frame = latest.image
+        else:
+            ret, frame = self.cam.retrieve() if self.cam.grab() else (False, None)
+            if not ret or frame is None:
+                raise RuntimeError(f"Failed to read a frame from camera {self.name}")
+        return cv2.flip(frame, 1) if mirror else frame
 
+    def start(self) -> None:
+        with self._lock:
+            if self._capture_thread is not None and self._capture_thread.is_alive():
+                return
+            self.frames.reopen()
+            self._capture_thread = threading.Thread(target=self._capture_loop, daemon=True)
+            self._capture_thread.start()
 
-class WebCameraStream(BaseWebCamera, metaclass=Singleton):
+    def stop(self) -> None:
+        with self._lock:
+            self.frames.close()
+            thread, self._capture_thread = self._capture_thread, None
+        if thread is not None and thread is not threading.current_thread():
+            # Sources wait at most about a second per grab, a device stuck in its driver is left behind
+            thread.join(STOP_TIMEOUT_S)
+            if thread.is_alive():
+                logger.warning("Capture thread of camera %s did not stop within %s s", self.name, STOP_TIMEOUT_S)
+        if self.recorder is not None:
+            self.recorder.stop()
+            self.recorder = None
+        if self.shm_writer is not None:
+            self.frames.remove_listener(self._share_jpeg if self.shm_writer.encoded else self.shm_writer.write)
+            # The lock keeps an encode pool thread from writing into the ring while it is unmapped
+            with self._shm_lock:
+                writer, self.shm_writer = self.shm_writer, None
+            writer.close()
+
+    def close(self) -> None:
+        self.stop()
+        self.cam.release()
+        self.encode_pool.shutdown(wait=False)
+        for unregister in self._unregister_collectors:
+            unregister()
+        self._unregister_collectors = []
+
+    @property
+    def capturing(self) -> bool:
+        thread = self._capture_thread
+        return thread is not None and thread.is_alive()
+
+    @property
+    def active(self) -> bool:
+        hub_subscribers = self.async_hub.subscribers if self.async_hub is not None else ()
+        return bool(self.cursors or hub_subscribers or self.shm_writer is not None or self.recorder is not None)
+
+    def share_memory(self, name: str, slots: int = 8, encoded: bool = False) -> None:
+        # Publish every captured frame into a shared memory ring for same-host consumers. An encoded ring carries
+        # the top rendition's JPEG instead of pixels, for HTTP workers serving the camera from other processes.
+        if self.shm_writer is None:
+            self.shm_writer = SharedFrameWriter(
+                name, slot_size=self.width * self.height * 3, slots=slots, fps=self.fps, encoded=encoded
+            )
+            self.frames.add_listener(self._share_jpeg if encoded else self.shm_writer.write)
+        self.start()
+
+    def record(
+        self, path: str, segment_seconds: int = 300, retention: int = 288, codec: str = "libx264"
+    ) -> VideoRecorder:
+        # Record the shared feed into <path>_<timestamp>.mp4 segments alongside any live streams
+        if self.recorder is None:
+            self.recorder = VideoRecorder(self, path, segment_seconds=segment_seconds, retention=retention, codec=codec)
+            self.recorder.start()
+        return self.recorder
+
+    def subscribe(self) -> FrameCursor:
+        self.start()
+        cursor = FrameCursor(self.frames, dropped_counter=self.dropped_frames)
+        self.cursors.add(cursor)
+        return cursor
+
+    def unsubscribe(self, cursor: FrameCursor) -> None:
+        self.cursors.discard(cursor)
+
+    def get_async_hub(self) -> AsyncFrameHub:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self.async_hub is None or self.async_hub.loop is not loop:
+                if self.async_hub is not None:
+                    self.async_hub.close()
+                self.async_hub = AsyncFrameHub(self, loop)
+            return self.async_hub
+
+    def get_stats(self) -> Dict:
+        hub_stats = self.async_hub.get_stats() if self.async_hub is not None else {}
+        recorder_stats = self.recorder.get_stats() if self.recorder is not None else {}
+        return {
+            "capture_fps": round(self.capture_fps, 2),
+            "last_seq": self.frames.last_seq,
+            "read_failures": self.read_failures.value,
+            "reopens": self.reopens.value,
+            "subscribers": len(self.cursors),
+            "dropped_frames": [cursor.dropped for cursor in list(self.cursors)],
+            **hub_stats,
+            **recorder_stats,
+            **self.jpeg_cache.get_stats(),
+        }
+
+    def _share_jpeg(self, frame: Frame) -> None:
+        # Runs on the capture thread: encoding happens on the pool, which only ever picks up the newest frame
+        with self._shm_lock:
+            self._shm_pending = frame
+            if self._shm_encoding:
+                return
+            self._shm_encoding = True
+        self.encode_pool.submit(self._write_shared_jpeg)
+
+    def _write_shared_jpeg(self) -> None:
+        top = RENDITIONS[0]
+        size = scaled_size(top.height, self.width, self.height)
+        while True:
+            with self._shm_lock:
+                frame, self._shm_pending = self._shm_pending, None
+                if frame is None or self.shm_writer is None:
+                    self._shm_encoding = False
+                    return
+            try:
+                jpeg = self.jpeg_cache.get_jpeg(frame, top.quality, size)
+            except Exception:  # pylint: disable=broad-except
+                continue
+            with self._shm_lock:
+                if self.shm_writer is not None:
+                    self.shm_writer.write_jpeg(frame, jpeg, size or (self.width, self.height))
+
+    def _collect_fps(self):
+        yield {"camera": self.name}, self.capture_fps
+
+    def _collect_subscribers(self):
+        hub_subscribers = len(self.async_hub.subscribers) if self.async_hub is not None else 0
+        yield {"camera": self.name}, len(self.cursors) + hub_subscribers
+
+    def _clients(self):
+        for cursor in list(self.cursors):
+            yield {"camera": self.name, "client": f"sync-{cursor.client_id}"}, cursor
+        if self.async_hub is not None:
+            for subscriber in list(self.async_hub.subscribers):
+                yield {"camera": self.name, "client": f"async-{subscriber.client_id}"}, subscriber
+
+    def _collect_lag(self):
+        for labels, client in self._clients():
+            yield labels, client.lag if isinstance(client, FrameCursor) else client.queue.qsize()
+
+    def _collect_dropped(self):
+        for labels, client in self._clients():
+            yield labels, client.dropped
+
+    def _collect_cache(self):
+        yield {"camera": self.name}, self.jpeg_cache.hit_ratio
+
+    def _collect_drained(self):
+        yield {"camera": self.name}, getattr(self.cam, "drained", 0)
+
+    def _capture_loop(self) -> None:
+        try:
+            self._capture_frames()
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Capture of camera %s failed", self.name)
+        finally:
+            self.capture_fps = 0.0
+            # Whatever ended the capture, streams finish instead of waiting for frames that will never come
+            self.frames.close()
+            hub = self.async_hub
+            if hub is not None:
+                hub.end_of_stream()
+
+    def _capture_frames(self) -> None:
+        window_start, window_frames = time.monotonic(), 0
+        last_frame, attempts = time.monotonic(), 0
+        while not self.frames.closed:
+            # grab() stamps the frame, only then is it decoded (or its native JPEG copied out)
+            started = time.perf_counter()
+            frame, jpeg, failed = None, None, False
+            try:
+                ret = self.cam.isOpened() and self.cam.grab()
+                if ret:
+                    if self.cam.compressed:
+                        ret, jpeg = self.cam.retrieve_jpeg()
+                    else:
+                        ret, frame = self.cam.retrieve()
+            except Exception:  # pylint: disable=broad-except
+                # A source that raises is reopened right away, with backoff, rather than retried in a loop
+                logger.exception("Reading from camera %s failed", self.name)
+                ret, failed = False, True
+            self.read_seconds.observe(time.perf_counter() - started)
+            if not ret:
+                self.read_failures.inc()
+                if failed or not self.cam.isOpened() or time.monotonic() - last_frame >= self.stall_timeout:
+                    if not self._reopen(attempts):
+                        break
+                    attempts += 1
+                else:
+                    # Don't spin on a device that fails fast, it is reopened once the stall timeout passes
+                    time.sleep(0.01)
+                continue
+            last_frame, attempts = time.monotonic(), 0
+            self.frames.publish(frame, timestamp=self.cam.timestamp, jpeg=jpeg)
+            self.frames_captured.inc()
+
+            window_frames += 1
+            elapsed = time.monotonic() - window_start
+            if elapsed >= 1.0:
+                self.capture_fps = window_frames / elapsed
+                window_start, window_frames = time.monotonic(), 0
+
+    def _reopen(self, attempt: int) -> bool:
+        # The first attempt is immediate, later ones back off while checking for stop()
+        delay = min(REOPEN_MIN_S * 2 ** (attempt - 1), REOPEN_MAX_S) if attempt else 0.0
+        deadline = time.monotonic() + delay
+        while time.monotonic() < deadline:
+            if self.frames.closed:
+                return False
+            time.sleep(0.1)
+        if not self.cam.reopen():
+            return False
+        self.reopens.inc()
+        return True
+
+
+class WebCameraStream(BaseWebCamera):
     def stream_frame_bytes(self) -> Generator[bytes, None, None]:
-        while self.cam.isOpened():
-            yield self.get_frame().tobytes()
-
-    def stream_img_bytes(self) -> Generator[bytes, None, None]:
-        while self.cam.isOpened():
-            _, buffer = cv2.imencode(".jpg", self.get_frame())
-            img_frame = buffer.tobytes()
-            yield b"--frame\r\nContent-Type: image/jpeg\r\n\r\n" + img_frame + b"\r\n"
-    # ------------------------------------------------------------------------------------------------
-    # Provide the path to the Tesseract executable
-
-    #tesseract_cmd_path = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
-    #recognizer = RealTimeTextRecognition(tesseract_cmd_path)
-    #recognizer.capture_and_process_image()
-    #recognizer.start()
-
-    # recognizer = RealTimeTextRecognition()
-    # recognizer.start()
-    
-    camera = CameraCapture()
-    camera.start_capture()
-
-    # ------------------------------------------------------------------------------------------------
+        cursor = self.subscribe()
+        frame_size = self.width * self.height * 3
+        try:
+            while self.cam.isOpened() and not self.frames.closed:
+                frame = cursor.read(timeout=1.0)
+                if frame is not None:
+                    if frame.image.nbytes != frame_size:
+                        # Raw frames are unframed: end the stream so clients reconnect with the new Frame-Transform
+                        break
+                    chunk = frame.image.tobytes()
+                    yield chunk
+                    self.bytes_sent.inc(len(chunk))
+        finally:
+            self.unsubscribe(cursor)
+
+    def stream_img_bytes(self, mirror: bool = False) -> Generator[bytes, None, None]:
+        cursor = self.subscribe()
+        try:
+            while self.cam.isOpened() and not self.frames.closed:
+                frame = cursor.read(timeout=1.0, latest=True)
+                if frame is None:
+                    continue
+                chunk = self.jpeg_cache.get_chunk(frame, mirror=mirror)
+                yield chunk
+                self.bytes_sent.inc(len(chunk))
+                self.glass_to_client.observe(time.time() - frame.timestamp)
+        finally:
+            self.unsubscribe(cursor)
+
+    def stream_img_bytes_async(
+        self,
+        rendition: Optional[str] = None,
+        quality: Optional[int] = None,
+        height: Optional[int] = None,
+        mirror: bool = False,
+        framing: str = "multipart",
+        flags: int = 0,
+    ) -> AsyncGenerator[bytes, None]:
+        hub = self.get_async_hub()
+        subscriber = hub.subscribe(
+            rendition=rendition, quality=quality, height=height, mirror=mirror, framing=framing, flags=flags
+        )
+        return hub.stream(subscriber)
+
 
 class WebCameraRecoder(BaseWebCamera, metaclass=Singleton):
-    def __init__(self, video_name: Optional[str] = None, cam_id: int = 0):
+    def __init__(
+        self, video_name: Optional[str] = None, cam_id: int = 0, source: Union[FrameSource, str, None] = None
+    ):
         self.video_name = video_name
-        super().__init__(cam_id)
-
-    def record_video(self) -> None:
-        fourcc = cv2.VideoWriter_fourcc("m", "p", "4", "v")
-        self.video_writer = cv2.VideoWriter(f"{self.video_name}.mp4", fourcc, self.fps, (self.width, self.height))
+        super().__init__(cam_id, source=source)
 
-        while self.cam.isOpened():
-            self.video_writer.write(self.get_frame())
+    def record_video(self, segment_seconds: int = 300, retention: int = 288) -> None:
+        self.record(self.video_name or "output", segment_seconds=segment_seconds, retention=retention)
+        try:
+            while self.cam.isOpened() and not self.frames.closed:
+                time.sleep(1.0)
+        finally:
+            self.stop()
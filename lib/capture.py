@@ -0,0 +1,99 @@
+"""
+Capture process for multi-worker deployments: a camera can only be opened by one process, so this one owns the
+devices, encodes each frame once and publishes it into a shared memory ring per camera. Any number of stateless
+HTTP workers then serve those rings (CAPTURE_SHM_PREFIX in main.py) without opening a device. Workers forward the
+top rendition's JPEGs as they are as long as they don't flip them: STREAM_MIRROR "auto" (the default), "client"
+or "none", never "encode":
+
+    CAMERAS=default=1 CAPTURE_SHM_PREFIX=webcam python -m lib.capture
+    CAMERAS=default=1 CAPTURE_SHM_PREFIX=webcam uvicorn main:app --workers 4
+"""
+from typing import Any, Dict, Optional
+import argparse
+import os
+import signal
+import threading
+
+from .camera import BaseWebCamera
+from .encoders import create_encoder
+from .registry import parse_cameras
+
+
+def shm_name(prefix: str, cam_id: str) -> str:
+    return f"{prefix}-{cam_id}"
+
+
+def worker_sources(sources: Dict[str, str], prefix: str) -> Dict[str, str]:
+    # The same CAMERAS setting, pointed at the capture process's rings instead of the devices
+    return {cam_id: f"shm:{shm_name(prefix, cam_id)}" for cam_id in sources}
+
+
+class CaptureService:
+    def __init__(
+        self,
+        sources: Dict[str, str],
+        prefix: str = "webcam",
+        slots: int = 8,
+        camera_options: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        self.sources = dict(sources)
+        self.prefix = prefix
+        self.slots = slots
+        self.camera_options = dict(camera_options or {})
+        self.cameras: Dict[str, BaseWebCamera] = {}
+
+    def start(self) -> None:
+        # Every id needs its own source: two ids on one device would try to open it twice
+        for cam_id, source in self.sources.items():
+            camera = self.cameras[cam_id] = BaseWebCamera(source=source, **self.camera_options)
+            camera.share_memory(shm_name(self.prefix, cam_id), slots=self.slots, encoded=True)
+
+    def stop(self) -> None:
+        for camera in self.cameras.values():
+            camera.close()
+        self.cameras = {}
+
+    def get_stats(self) -> Dict:
+        return {cam_id: camera.get_stats() for cam_id, camera in self.cameras.items()}
+
+    def run(self) -> None:
+        stopped = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+        signal.signal(signal.SIGINT, lambda *_: stopped.set())
+        self.start()
+        try:
+            stopped.wait()
+        finally:
+            self.stop()
+
+
+def main() -> None:
+    # Defaults come from the same environment variables as main.py, so both processes can share one config
+    parser = argparse.ArgumentParser(description="Capture cameras into shared memory for HTTP workers")
+    parser.add_argument("--cameras", default=os.getenv("CAMERAS", f"default={os.getenv('CAMERA_SOURCE', '1')}"))
+    parser.add_argument("--prefix", default=os.getenv("CAPTURE_SHM_PREFIX") or "webcam")
+    parser.add_argument("--slots", type=int, default=8)
+    parser.add_argument("--low-latency", action="store_true", default=os.getenv("CAMERA_LOW_LATENCY", "") == "1")
+    parser.add_argument("--encoder", default=os.getenv("JPEG_ENCODER", "opencv"))
+    parser.add_argument("--encode-workers", type=int, default=int(os.getenv("ENCODE_WORKERS", "2")))
+    args = parser.parse_args()
+
+    # The same encoder settings as main.py: the JPEGs in shared memory are the ones workers serve
+    encoder = create_encoder(
+        args.encoder,
+        quality=int(os.getenv("JPEG_QUALITY", "80")),
+        subsampling=os.getenv("JPEG_SUBSAMPLING", "420"),
+        restart_interval=int(os.getenv("JPEG_RESTART_INTERVAL", "0")),
+        fast_dct=os.getenv("JPEG_FAST_DCT", "") == "1",
+    )
+    service = CaptureService(
+        parse_cameras(args.cameras),
+        prefix=args.prefix,
+        slots=args.slots,
+        camera_options={"encoder": encoder, "encode_workers": args.encode_workers, "low_latency": args.low_latency},
+    )
+    service.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,108 @@ import threading
 import time
 import math
 
+from .roi_tracker import CircleTracker
+from .vision_buffers import BufferPool, circle_mask, circle_roi
+
+# Промежуточные изображения переиспользуются между кадрами вместо выделения памяти на каждом кадре
+_buffers = BufferPool()
+
+
+def detect_arrow(image, min_radius=0, max_radius=0):
+    shape = image.shape[:2]
+
+    # Преобразование изображения в оттенки серого
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=_buffers.get("gray", shape))
+
+    # Применение размытия для снижения шума
+    blurred = cv2.GaussianBlur(gray, (5, 5), 0, dst=_buffers.get("blurred", shape))
+
+    # Применение операции Canny для выделения границ
+    edges = cv2.Canny(blurred, 50, 150, edges=_buffers.get("edges", shape))
+
+    # Поиск кругов на изображении с помощью метода HoughCircles
+    circles = cv2.HoughCircles(edges, cv2.HOUGH_GRADIENT, dp=1.2, minDist=100, param1=50, param2=30, minRadius=min_radius, maxRadius=max_radius)
+
+    if circles is not None:
+        circles = np.round(circles[0, :]).astype("int")
+
+        for (x, y, r) in circles:
+            # Ограничить область интереса (ROI) кругом: работаем только с квадратом вокруг круга
+            # и кэшированной маской вместо новой полноразмерной маски для каждого круга
+            x0, y0, x1, y1 = circle_roi((x, y, r), shape, margin=0)
+            roi_shape = (y1 - y0, x1 - x0)
+            masked_edges = np.bitwise_and(
+                edges[y0:y1, x0:x1], circle_mask(int(r), roi_shape, (int(x - x0), int(y - y0))),
+                out=_buffers.get("masked_edges", roi_shape),
+            )
+
+            # Поиск контуров внутри круга (координаты контуров сразу в системе координат кадра)
+            contours, _ = cv2.findContours(masked_edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=(x0, y0))
+
+            if contours:
+                # Находим самый длинный контур
+                longest_contour = max(contours, key=lambda contour: cv2.arcLength(contour, True))
+
+                # Находим ограничивающий прямоугольник для контура
+                bx, by, bw, bh = cv2.boundingRect(longest_contour)
+
+                # Находим центр ограничивающего прямоугольника
+                center = (bx + bw // 2, by + bh // 2)
+
+                # Находим ориентацию контура (fitEllipse требует минимум 5 точек)
+                if len(longest_contour) < 5:
+                    continue
+                angle = cv2.fitEllipse(longest_contour)[-1]
+
+                return center, angle, (int(x), int(y), int(r))
+
+    return None, None, None
+
+
+def track_arrow(image, tracker):
+    # Между полными поисками ищем стрелку только в окрестности последнего найденного круга
+    region = tracker.search_region(image.shape)
+    if region is not None:
+        x0, y0, x1, y1, min_radius, max_radius = region
+        center, angle, circle = detect_arrow(image[y0:y1, x0:x1], min_radius, max_radius)
+        if circle is not None:
+            center = (center[0] + x0, center[1] + y0)
+            circle = (circle[0] + x0, circle[1] + y0, circle[2])
+        if tracker.confirm(circle):
+            return center, angle, tracker.circle
+
+    center, angle, circle = detect_arrow(image)
+    tracker.reset(circle)
+    return center, angle, circle
+
+
+def recognize_value(angle):
+    # Шкала значений на барометре (в градусах)
+    scale_values = {
+        (-90, -45): 'Stormy',
+        (-45, 45): 'Normal',
+        (45, 90): 'Sunny'
+    }
+
+    # Определяем значение на основе угла
+    for (min_angle, max_angle), value in scale_values.items():
+        if min_angle <= angle <= max_angle:
+            return value
+
+    return 'Unknown'
+
+
+_tracker = CircleTracker()
+
+
+def analyze(image):
+    # Функция для конвейера распознавания: ничего не рисует и не открывает окон
+    center, angle, circle = track_arrow(image, _tracker)
+    if angle is None:
+        return {"circle": circle}
+    return {"circle": circle, "needle_center": center, "needle_angle": float(angle), "value": recognize_value(angle)}
+
+
 class RealTimeTextRecognition:
     def __init__(self):
         # Инициализация видеозахвата с веб-камеры
@@ -13,6 +115,7 @@ class RealTimeTextRecognition:
 
         self.running = True
         self.fixed_value = None  # Переменная для фиксации значения
+        self.tracker = CircleTracker()  # Отслеживание барометра между кадрами
 
     def __del__(self):
         # Освобождение ресурсов
@@ -21,65 +124,16 @@ class RealTimeTextRecognition:
         cv2.destroyAllWindows()
 
     def detect_arrow(self, image):
-        # Преобразование изображения в оттенки серого
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-
-        # Применение размытия для снижения шума
-        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-
-        # Применение операции Canny для выделения границ
-        edges = cv2.Canny(blurred, 50, 150)
-
-        # Поиск кругов на изображении с помощью метода HoughCircles
-        circles = cv2.HoughCircles(edges, cv2.HOUGH_GRADIENT, dp=1.2, minDist=100, param1=50, param2=30, minRadius=0, maxRadius=0)
-
-        if circles is not None:
-            circles = np.round(circles[0, :]).astype("int")
-
-            for (x, y, r) in circles:
-                # Нарисовать круг на изображении
-                cv2.circle(image, (x, y), r, (0, 255, 0), 4)
-                cv2.rectangle(image, (x - 5, y - 5), (x + 5, y + 5), (0, 128, 255), -1)
-
-                # Ограничить область интереса (ROI) кругом
-                mask = np.zeros_like(gray)
-                cv2.circle(mask, (x, y), r, 255, -1)
-                masked_edges = cv2.bitwise_and(edges, edges, mask=mask)
-
-                # Поиск контуров внутри круга
-                contours, _ = cv2.findContours(masked_edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-                if contours:
-                    # Находим самый длинный контур
-                    longest_contour = max(contours, key=lambda contour: cv2.arcLength(contour, True))
-
-                    # Находим ограничивающий прямоугольник для контура
-                    bx, by, bw, bh = cv2.boundingRect(longest_contour)
-
-                    # Находим центр ограничивающего прямоугольника
-                    center = (bx + bw // 2, by + bh // 2)
-
-                    # Находим ориентацию контура
-                    angle = cv2.fitEllipse(longest_contour)[-1]
-
-                    return center, angle, (x, y, r)
-
-        return None, None, None
+        center, angle, circle = track_arrow(image, self.tracker)
+        if circle is not None:
+            # Нарисовать круг на изображении
+            x, y, r = circle
+            cv2.circle(image, (x, y), r, (0, 255, 0), 4)
+            cv2.rectangle(image, (x - 5, y - 5), (x + 5, y + 5), (0, 128, 255), -1)
+        return center, angle, circle
 
     def recognize_value(self, angle):
-        # Шкала значений на барометре (в градусах)
-        scale_values = {
-            (-90, -45): 'Stormy',
-            (-45, 45): 'Normal',
-            (45, 90): 'Sunny'
-        }
-
-        # Определяем значение на основе угла
-        for (min_angle, max_angle), value in scale_values.items():
-            if min_angle <= angle <= max_angle:
-                return value
-
-        return 'Unknown'
+        return recognize_value(angle)
 
     def detect_markings(self, image, circle):
         x, y, r = circle
@@ -0,0 +1,215 @@
+from collections import deque
+from typing import TYPE_CHECKING, Any, Deque, Dict, Optional, Sequence, Tuple
+import os
+import subprocess
+import threading
+import time
+import numpy as np
+
+from .frame_buffer import Frame
+from .lazy import lazy_import
+from .metrics import REGISTRY
+from .renditions import RENDITIONS, scaled_size
+
+if TYPE_CHECKING:
+    import cv2
+    import ffmpeg
+
+    from .camera import BaseWebCamera
+    from .recognition import RecognitionResult
+else:
+    cv2 = lazy_import("cv2")
+    ffmpeg = lazy_import("ffmpeg")
+
+
+class MotionDetector:
+    # Compares a small grayscale copy of each frame against a running average background
+    def __init__(self, width: int = 160, alpha: float = 0.05, threshold: float = 25.0, min_area: float = 0.01) -> None:
+        self.width = width
+        self.alpha = alpha
+        self.threshold = threshold
+        self.min_area = min_area
+        self.background: Optional[np.ndarray] = None
+        self._small: Optional[np.ndarray] = None
+        self._gray: Optional[np.ndarray] = None
+        self._diff: Optional[np.ndarray] = None
+
+    def update(self, image: np.ndarray) -> bool:
+        height = max(int(image.shape[0] * self.width / image.shape[1]), 1)
+        if self._small is None or self._small.shape[:2] != (height, self.width):
+            # Scratch buffers are allocated once per resolution
+            self._small = np.empty((height, self.width, 3), dtype=np.uint8)
+            self._gray = np.empty((height, self.width), dtype=np.uint8)
+            self._diff = np.empty((height, self.width), dtype=np.float32)
+            self.background = None
+        cv2.resize(image, (self.width, height), dst=self._small, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(self._small, cv2.COLOR_BGR2GRAY, dst=self._gray)
+
+        if self.background is None:
+            self.background = self._gray.astype(np.float32)
+            return False
+        np.subtract(self._gray, self.background, out=self._diff)
+        # background += alpha * (gray - background)
+        self.background += self.alpha * self._diff
+        np.abs(self._diff, out=self._diff)
+        return np.count_nonzero(self._diff > self.threshold) >= self.min_area * self._diff.size
+
+
+class ClipRecorder:
+    """
+    Writes clips around events: the last pre_seconds of encoded frames are kept in memory and flushed into
+    a new clip when motion (or a recognition event) triggers, which then runs until post_seconds after the
+    last trigger. Frames are the JPEGs already encoded for the live streams, written with ffmpeg -c copy.
+    """
+
+    def __init__(
+        self,
+        camera: "BaseWebCamera",
+        path: str,
+        pre_seconds: float = 5.0,
+        post_seconds: float = 10.0,
+        max_buffer_bytes: int = 64 * 1024 * 1024,
+        motion: Optional[MotionDetector] = None,
+        detect_every: int = 3,
+        event_tasks: Sequence[str] = ("barometer", "gauge"),
+    ) -> None:
+        self.camera = camera
+        self.path = path
+        self.pre_seconds = pre_seconds
+        self.post_seconds = post_seconds
+        self.motion = motion or MotionDetector()
+        self.detect_every = detect_every
+        self.event_tasks = set(event_tasks)
+        # Same key as the top adaptive rendition, mirror included, so clip frames come out of the streams' cache:
+        # clips are flipped exactly when the camera's default streams are
+        self.quality = RENDITIONS[0].quality
+        self.size = scaled_size(RENDITIONS[0].height, camera.width, camera.height)
+        self.mirror = camera.resolve_mirror()[0]
+        # Bounded both in frames and in bytes: memory use never exceeds max_buffer_bytes whatever the scene
+        self.max_buffer_bytes = max_buffer_bytes
+        self.preroll: Deque[Tuple[float, memoryview]] = deque(maxlen=max(int(pre_seconds * (camera.fps or 30)), 1))
+        self.preroll_bytes = 0
+        self.clips = 0
+        self.clip_path: Optional[str] = None
+        self.running = False
+        self._trigger_until = 0.0
+        self._trigger_reason = "manual"
+        self._last_events: Dict[str, Any] = {}
+        self._process: Optional[subprocess.Popen] = None
+        self._thread: Optional[threading.Thread] = None
+        self._clips_total = REGISTRY.counter("clips_recorded_total", "Event clips started").labels(
+            camera=camera.name
+        )
+
+    def start(self) -> None:
+        if self.running:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.running = True
+        self._thread = threading.Thread(target=self._record_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self.running = False
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def trigger(self, reason: str = "manual") -> None:
+        # Safe from any thread: extends the current clip or starts a new one with the next frame
+        self._trigger_until = time.monotonic() + self.post_seconds
+        self._trigger_reason = reason
+
+    def on_recognition(self, result: "RecognitionResult") -> None:
+        # A gauge appearing/disappearing or its reading changing is an event worth a clip
+        if result.task not in self.event_tasks or result.error is not None:
+            return
+        state = (result.circle is not None, result.value)
+        previous = self._last_events.get(result.task)
+        self._last_events[result.task] = state
+        if previous is not None and state != previous:
+            self.trigger(result.task)
+
+    def get_stats(self) -> Dict:
+        return {
+            "clips_recorded": self.clips,
+            "clip_recording": self.clip_path,
+            "clip_preroll_frames": len(self.preroll),
+            "clip_preroll_bytes": self.preroll_bytes,
+        }
+
+    def _record_loop(self) -> None:
+        cursor = self.camera.subscribe()
+        try:
+            while self.running:
+                frame = cursor.read(timeout=1.0)
+                if frame is None:
+                    if cursor.ring.closed:
+                        # The capture ended: no more frames will come, start() subscribes again
+                        break
+                    continue
+                jpeg = self.camera.jpeg_cache.get_jpeg(frame, self.quality, self.size, self.mirror)
+                if frame.seq % self.detect_every == 0 and self.motion.update(frame.image):
+                    self.trigger("motion")
+
+                if time.monotonic() < self._trigger_until:
+                    if self._process is None:
+                        self._open_clip(frame)
+                    self._write(jpeg)
+                else:
+                    if self._process is not None:
+                        self._close_clip()
+                    self._buffer(frame, jpeg)
+        finally:
+            self.running = False
+            self.camera.unsubscribe(cursor)
+            self._close_clip()
+
+    def _buffer(self, frame: Frame, jpeg: memoryview) -> None:
+        if len(self.preroll) == self.preroll.maxlen:
+            self.preroll_bytes -= len(self.preroll[0][1])
+        self.preroll.append((frame.timestamp, jpeg))
+        self.preroll_bytes += len(jpeg)
+        while self.preroll_bytes > self.max_buffer_bytes:
+            self.preroll_bytes -= len(self.preroll.popleft()[1])
+        # Frames older than the pre-roll window are dropped even when the camera runs slower than its nominal fps
+        while self.preroll and frame.timestamp - self.preroll[0][0] > self.pre_seconds:
+            self.preroll_bytes -= len(self.preroll.popleft()[1])
+
+    def _open_clip(self, frame: Frame) -> None:
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(frame.timestamp))
+        self.clip_path = f"{self.path}_{stamp}_{self._trigger_reason}.mkv"
+        self._process = (
+            ffmpeg.input("pipe:", format="mjpeg", framerate=self.camera.fps or 30)
+            .output(self.clip_path, vcodec="copy")
+            .global_args("-loglevel", "error")
+            .overwrite_output()
+            .run_async(pipe_stdin=True)
+        )
+        self.clips += 1
+        self._clips_total.inc()
+        while self.preroll:
+            self._write(self.preroll.popleft()[1])
+        self.preroll_bytes = 0
+
+    def _write(self, jpeg: memoryview) -> None:
+        if self._process is None:
+            return
+        try:
+            self._process.stdin.write(jpeg)  # type: ignore
+        except (BrokenPipeError, OSError):
+            # The clip is lost, the next trigger opens a new one
+            self._close_clip()
+            self._trigger_until = 0.0
+
+    def _close_clip(self) -> None:
+        process, self._process = self._process, None
+        self.clip_path = None
+        if process is None:
+            return
+        try:
+            process.stdin.close()  # type: ignore
+        except OSError:
+            pass
+        process.wait()
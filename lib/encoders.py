@@ -0,0 +1,151 @@
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
+import importlib.util
+import io
+
+import numpy as np
+
+from .lazy import lazy_import
+
+if TYPE_CHECKING:
+    import cv2
+else:
+    cv2 = lazy_import("cv2")
+
+# Chroma subsampling names accepted by every backend
+SUBSAMPLING = ("444", "422", "420")
+
+
+class JpegEncoder(ABC):
+    # Encoders are shared by every stream of a camera and called from the encode pool: encode() must be
+    # thread safe and should release the GIL while compressing
+    name = "base"
+
+    def __init__(
+        self,
+        quality: int = 80,
+        subsampling: str = "420",
+        restart_interval: int = 0,
+        fast_dct: bool = False,
+    ) -> None:
+        if subsampling not in SUBSAMPLING:
+            raise ValueError(f"Unknown chroma subsampling {subsampling!r}, expected one of {', '.join(SUBSAMPLING)}")
+        self.quality = quality
+        self.subsampling = subsampling
+        self.restart_interval = restart_interval
+        self.fast_dct = fast_dct
+
+    @abstractmethod
+    def encode(self, image: np.ndarray, quality: Optional[int] = None) -> bytes:
+        ...
+
+    def get_config(self) -> Dict:
+        return {
+            "encoder": self.name,
+            "quality": self.quality,
+            "subsampling": self.subsampling,
+            "restart_interval": self.restart_interval,
+            "fast_dct": self.fast_dct,
+        }
+
+
+class OpenCVEncoder(JpegEncoder):
+    name = "opencv"
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        if self.fast_dct:
+            raise ValueError("OpenCV does not expose the fast DCT, use the turbojpeg encoder")
+        self._params: List[int] = []
+        # Sampling factor and restart interval flags need OpenCV >= 4.5.5
+        if hasattr(cv2, "IMWRITE_JPEG_SAMPLING_FACTOR"):
+            factor = getattr(cv2, f"IMWRITE_JPEG_SAMPLING_FACTOR_{self.subsampling}")
+            self._params += [cv2.IMWRITE_JPEG_SAMPLING_FACTOR, factor]
+        elif self.subsampling != "420":
+            raise ValueError(f"OpenCV {cv2.__version__} only encodes with 4:2:0 chroma subsampling")
+        if self.restart_interval:
+            if not hasattr(cv2, "IMWRITE_JPEG_RST_INTERVAL"):
+                raise ValueError(f"OpenCV {cv2.__version__} does not support JPEG restart intervals")
+            self._params += [cv2.IMWRITE_JPEG_RST_INTERVAL, self.restart_interval]
+
+    def encode(self, image: np.ndarray, quality: Optional[int] = None) -> bytes:
+        params = [cv2.IMWRITE_JPEG_QUALITY, quality or self.quality, *self._params]
+        ok, buffer = cv2.imencode(".jpg", image, params)
+        if not ok:
+            raise RuntimeError("cv2.imencode failed")
+        return buffer.tobytes()
+
+
+class TurboJpegEncoder(JpegEncoder):
+    # libjpeg-turbo through PyTurboJPEG: the ctypes call releases the GIL, fast_dct trades a little
+    # accuracy for a noticeably cheaper DCT
+    name = "turbojpeg"
+
+    def __init__(self, *args, library_path: Optional[str] = None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        if self.restart_interval:
+            raise ValueError("PyTurboJPEG does not expose JPEG restart intervals, use the opencv or pillow encoder")
+        import turbojpeg  # pylint: disable=import-outside-toplevel
+
+        self._turbo = turbojpeg.TurboJPEG(library_path)
+        self._pixel_format = turbojpeg.TJPF_BGR
+        self._subsample = {"444": turbojpeg.TJSAMP_444, "422": turbojpeg.TJSAMP_422, "420": turbojpeg.TJSAMP_420}[
+            self.subsampling
+        ]
+        self._flags = turbojpeg.TJFLAG_FASTDCT if self.fast_dct else 0
+
+    def encode(self, image: np.ndarray, quality: Optional[int] = None) -> bytes:
+        return self._turbo.encode(
+            image,
+            quality=quality or self.quality,
+            pixel_format=self._pixel_format,
+            jpeg_subsample=self._subsample,
+            flags=self._flags,
+        )
+
+
+class PillowEncoder(JpegEncoder):
+    # Pillow or the PIL-SIMD drop-in (same "PIL" package), the latter is the one worth deploying
+    name = "pillow"
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        if self.fast_dct:
+            raise ValueError("Pillow does not expose the fast DCT, use the turbojpeg encoder")
+        from PIL import Image  # pylint: disable=import-outside-toplevel
+
+        self._image = Image
+        self._options: Dict = {"subsampling": {"444": 0, "422": 1, "420": 2}[self.subsampling]}
+        if self.restart_interval:
+            # Pillow >= 11.1, in MCU blocks like the OpenCV flag
+            self._options["restart_marker_blocks"] = self.restart_interval
+
+    def encode(self, image: np.ndarray, quality: Optional[int] = None) -> bytes:
+        rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        output = io.BytesIO()
+        self._image.fromarray(rgb).save(output, format="JPEG", quality=quality or self.quality, **self._options)
+        return output.getvalue()
+
+
+ENCODERS: Dict[str, Callable[..., JpegEncoder]] = {
+    OpenCVEncoder.name: OpenCVEncoder,
+    TurboJpegEncoder.name: TurboJpegEncoder,
+    PillowEncoder.name: PillowEncoder,
+}
+_ALIASES = {"cv2": "opencv", "turbo": "turbojpeg", "pil": "pillow", "pil-simd": "pillow"}
+_MODULES = {"opencv": "cv2", "turbojpeg": "turbojpeg", "pillow": "PIL"}
+
+
+def available_encoders() -> List[str]:
+    return [name for name in ENCODERS if importlib.util.find_spec(_MODULES[name]) is not None]
+
+
+def create_encoder(name: str = "opencv", **options) -> JpegEncoder:
+    """
+    Build a JPEG encoder backend by name: "opencv", "turbojpeg" or "pillow" (PIL-SIMD when installed).
+    options are quality, subsampling ("444", "422", "420"), restart_interval and fast_dct.
+    """
+    backend = ENCODERS.get(_ALIASES.get(name, name))
+    if backend is None:
+        raise ValueError(f"Unknown JPEG encoder {name!r}, expected one of {', '.join(ENCODERS)}")
+    return backend(**options)
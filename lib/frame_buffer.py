@@ -0,0 +1,131 @@
+from typing import TYPE_CHECKING, Callable, List, Optional
+import itertools
+import threading
+import time
+
+import numpy as np
+
+from .lazy import lazy_import
+from .metrics import Counter
+
+if TYPE_CHECKING:
+    import cv2
+else:
+    cv2 = lazy_import("cv2")
+
+_cursor_ids = itertools.count()
+
+
+class Frame:
+    __slots__ = ("seq", "timestamp", "jpeg", "_image", "_decode_lock")
+
+    def __init__(self, seq: int, timestamp: float, image: Optional[np.ndarray], jpeg: Optional[bytes] = None) -> None:
+        self.seq = seq
+        self.timestamp = timestamp
+        # Camera-native JPEG for pass-through sources, pixels are only decoded if a consumer asks for them
+        self.jpeg = jpeg
+        self._image = image
+        self._decode_lock = threading.Lock() if image is None else None
+
+    @property
+    def image(self) -> np.ndarray:
+        if self._image is None:
+            with self._decode_lock:  # type: ignore
+                if self._image is None:
+                    self._image = cv2.imdecode(np.frombuffer(self.jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+        return self._image
+
+
+class FrameRing:
+    def __init__(self, capacity: int = 16) -> None:
+        self.capacity = capacity
+        self._slots: List[Optional[Frame]] = [None] * capacity
+        self._last_seq = -1
+        self._closed = False
+        self._cond = threading.Condition()
+        self._listeners: List[Callable[[Frame], None]] = []
+
+    @property
+    def last_seq(self) -> int:
+        return self._last_seq
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def publish(
+        self, image: Optional[np.ndarray], timestamp: Optional[float] = None, jpeg: Optional[bytes] = None
+    ) -> Frame:
+        with self._cond:
+            seq = self._last_seq + 1
+            frame = Frame(seq, time.time() if timestamp is None else timestamp, image, jpeg)
+            self._slots[seq % self.capacity] = frame
+            self._last_seq = seq
+            self._cond.notify_all()
+        for listener in self._listeners:
+            listener(frame)
+        return frame
+
+    def add_listener(self, listener: Callable[[Frame], None]) -> None:
+        self._listeners = [*self._listeners, listener]
+
+    def remove_listener(self, listener: Callable[[Frame], None]) -> None:
+        self._listeners = [item for item in self._listeners if item != listener]
+
+    def get(self, seq: int) -> Optional[Frame]:
+        frame = self._slots[seq % self.capacity]
+        if frame is None or frame.seq != seq:
+            return None
+        return frame
+
+    def latest(self) -> Optional[Frame]:
+        return self.get(self._last_seq) if self._last_seq >= 0 else None
+
+    def wait_for(self, seq: int, timeout: Optional[float] = None) -> bool:
+        with self._cond:
+            return self._cond.wait_for(lambda: self._last_seq >= seq or self._closed, timeout) and not self._closed
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def reopen(self) -> None:
+        with self._cond:
+            self._closed = False
+
+
+class FrameCursor:
+    def __init__(self, ring: FrameRing, dropped_counter: Optional[Counter] = None) -> None:
+        self.ring = ring
+        self.client_id = next(_cursor_ids)
+        self.next_seq = ring.last_seq + 1
+        self.dropped = 0
+        self.dropped_counter = dropped_counter
+
+    @property
+    def lag(self) -> int:
+        return max(self.ring.last_seq + 1 - self.next_seq, 0)
+
+    def read(self, timeout: Optional[float] = None, latest: bool = False) -> Optional[Frame]:
+        if not self.ring.wait_for(self.next_seq, timeout):
+            return None
+
+        while True:
+            last_seq = self.ring.last_seq
+            if latest:
+                seq = last_seq
+            else:
+                # Keep one slot of margin so the writer can't overwrite the slot we are about to read
+                seq = max(self.next_seq, last_seq - self.ring.capacity + 2)
+            frame = self.ring.get(seq)
+            if frame is not None:
+                break
+
+        skipped = seq - self.next_seq
+        if skipped:
+            self.dropped += skipped
+            if self.dropped_counter is not None:
+                self.dropped_counter.inc(skipped)
+        self.next_seq = seq + 1
+        return frame
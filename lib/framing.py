@@ -0,0 +1,49 @@
+from typing import NamedTuple, Union
+import struct
+
+import numpy as np
+
+# Length-prefixed binary frames for the /frames and /ws transports: a fixed 32 byte header, then the payload.
+# magic, version, payload kind, flags, seq, capture timestamp, width, height, payload length
+FRAME_HEADER = struct.Struct("<4sBBHqdHHI")
+FRAME_MAGIC = b"SWVB"
+FRAME_VERSION = 1
+FRAMES_MEDIA_TYPE = "application/x-webcam-frames"
+
+KIND_JPEG = 0
+# BGR24, height * width * 3 bytes
+KIND_RAW = 1
+
+# The client should mirror the frame for display
+FLAG_MIRROR = 1
+
+
+class FrameHeader(NamedTuple):
+    kind: int
+    flags: int
+    seq: int
+    timestamp: float
+    width: int
+    height: int
+    length: int
+
+
+def pack_frame(
+    kind: int, seq: int, timestamp: float, width: int, height: int, payload: Union[bytes, memoryview], flags: int = 0
+) -> bytes:
+    # nbytes, not len(): for an image's memoryview len() is the number of rows
+    length = memoryview(payload).nbytes
+    header = FRAME_HEADER.pack(FRAME_MAGIC, FRAME_VERSION, kind, flags, seq, timestamp, width, height, length)
+    return b"".join((header, payload))
+
+
+def pack_image(seq: int, timestamp: float, image: np.ndarray, flags: int = 0) -> bytes:
+    height, width = image.shape[:2]
+    return pack_frame(KIND_RAW, seq, timestamp, width, height, image.data, flags)
+
+
+def unpack_header(data: Union[bytes, bytearray, memoryview], offset: int = 0) -> FrameHeader:
+    magic, version, *fields = FRAME_HEADER.unpack_from(data, offset)
+    if magic != FRAME_MAGIC or version != FRAME_VERSION:
+        raise ValueError(f"Not a version {FRAME_VERSION} webcam frame: magic {magic!r}, version {version}")
+    return FrameHeader(*fields)
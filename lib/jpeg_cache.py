@@ -0,0 +1,134 @@
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+import threading
+import time
+
+from .encoders import JpegEncoder, OpenCVEncoder
+from .frame_buffer import Frame
+from .lazy import lazy_import
+from .metrics import Histogram
+
+if TYPE_CHECKING:
+    import cv2
+else:
+    cv2 = lazy_import("cv2")
+
+# Length, then the frame's sequence number and capture timestamp so clients can measure end-to-end latency
+PART_HEADER: bytes = (
+    b"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\nX-Frame-Seq: %d\r\nX-Frame-Timestamp: %.6f\r\n\r\n"
+)
+
+CacheKey = Tuple[int, Optional[int], Optional[Tuple[int, int]], bool]
+
+
+class _Entry:
+    __slots__ = ("ready", "chunk", "error")
+
+    def __init__(self) -> None:
+        self.ready = threading.Event()
+        self.chunk: Optional[bytes] = None
+        self.error: Optional[BaseException] = None
+
+
+class JpegCache:
+    def __init__(
+        self,
+        capacity: int = 32,
+        encoder: Optional[JpegEncoder] = None,
+        encode_seconds: Optional[Histogram] = None,
+        encoded_bytes: Optional[Histogram] = None,
+    ) -> None:
+        self.capacity = capacity
+        self.encoder = encoder or OpenCVEncoder()
+        self.encode_seconds = encode_seconds
+        self.encoded_bytes = encoded_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[CacheKey, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def get_chunk(
+        self,
+        frame: Frame,
+        quality: Optional[int] = None,
+        size: Optional[Tuple[int, int]] = None,
+        mirror: bool = False,
+    ) -> bytes:
+        key = (frame.seq, quality, size, mirror)
+        with self._lock:
+            entry = self._entries.get(key)
+            owner = entry is None
+            if owner:
+                entry = self._entries[key] = _Entry()
+                while len(self._entries) > self.capacity:
+                    self._entries.popitem(last=False)
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if owner:
+            try:
+                started = time.perf_counter()
+                jpeg = self.encode(frame, quality, size, mirror)
+                if self.encode_seconds is not None:
+                    self.encode_seconds.observe(time.perf_counter() - started)
+                if self.encoded_bytes is not None:
+                    self.encoded_bytes.observe(len(jpeg))
+                entry.chunk = b"".join((PART_HEADER % (len(jpeg), frame.seq, frame.timestamp), jpeg, b"\r\n"))
+            except BaseException as error:
+                entry.error = error
+                with self._lock:
+                    self._entries.pop(key, None)
+                raise
+            finally:
+                entry.ready.set()
+        else:
+            # Another subscriber is already encoding this frame, wait for its result instead of encoding again
+            entry.ready.wait()
+            if entry.error is not None:
+                raise entry.error
+        return entry.chunk  # type: ignore
+
+    def get_jpeg(
+        self,
+        frame: Frame,
+        quality: Optional[int] = None,
+        size: Optional[Tuple[int, int]] = None,
+        mirror: bool = False,
+    ) -> memoryview:
+        # The bare JPEG inside the cached multipart chunk, shared with the streams instead of encoding again
+        chunk = self.get_chunk(frame, quality, size, mirror)
+        return memoryview(chunk)[chunk.index(b"\r\n\r\n") + 4 : -2]
+
+    def get_stats(self) -> Dict:
+        return {
+            "jpeg_cache_hits": self.hits,
+            "jpeg_cache_misses": self.misses,
+            "jpeg_cache_hit_ratio": round(self.hit_ratio, 4),
+            **self.encoder.get_config(),
+        }
+
+    def encode(
+        self,
+        frame: Frame,
+        quality: Optional[int] = None,
+        size: Optional[Tuple[int, int]] = None,
+        mirror: bool = False,
+    ) -> bytes:
+        if frame.jpeg is not None and size is None and not mirror:
+            # Native size straight from an MJPEG camera: forward its own JPEG, the requested quality can't be improved
+            return frame.jpeg
+        image = frame.image
+        if size is not None and (image.shape[1], image.shape[0]) != size:
+            image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+            if mirror:
+                # The resized copy is ours, flip it in place instead of allocating another one
+                cv2.flip(image, 1, dst=image)
+        elif mirror:
+            image = cv2.flip(image, 1)
+        return self.encoder.encode(image, quality)
@@ -0,0 +1,32 @@
+from typing import Any
+import importlib
+import threading
+import types
+
+
+class LazyModule(types.ModuleType):
+    # Stands in for a module until an attribute is first used, then takes over its namespace so later
+    # lookups are plain attribute reads
+    def __init__(self, name: str) -> None:
+        super().__init__(name)
+        self.__dict__["_lock"] = threading.Lock()
+
+    def __getattr__(self, attr: str) -> Any:
+        with self.__dict__["_lock"]:
+            module = importlib.import_module(self.__name__)
+            self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+
+def lazy_import(name: str) -> Any:
+    """
+    Import a heavy module (cv2, ffmpeg, requests...) on first use instead of at import time, so importing lib
+    and main stays cheap and a missing optional dependency only fails the feature that needs it.
+    Pair it with a TYPE_CHECKING import for type checkers:
+
+        if TYPE_CHECKING:
+            import cv2
+        else:
+            cv2 = lazy_import("cv2")
+    """
+    return LazyModule(name)
@@ -0,0 +1,167 @@
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple, Union
+import threading
+
+# Metrics are updated from the capture, encode and event loop threads without locks: a lost increment under
+# contention is an acceptable price for keeping the hot path to a couple of list/attribute operations.
+
+Labels = Tuple[Tuple[str, str], ...]
+
+LATENCY_BUCKETS: Tuple[float, ...] = (0.001, 0.0025, 0.005, 0.01, 0.02, 0.035, 0.05, 0.075, 0.1, 0.25, 0.5, 1.0, 2.5)
+SIZE_BUCKETS: Tuple[float, ...] = (10e3, 25e3, 50e3, 100e3, 200e3, 400e3, 800e3, 1.6e6, 3.2e6, 6.4e6)
+
+
+def _format_labels(labels: Labels, extra: Labels = ()) -> str:
+    items = labels + extra
+    if not items:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in items)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(items, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0
+
+    def inc(self, amount: Union[int, float] = 1) -> None:
+        self.value += amount
+
+
+class Gauge:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        self.buckets = tuple(buckets)
+        # Preallocated, one slot per bucket plus +Inf: observe() never allocates
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+Metric = Union[Counter, Gauge, Histogram]
+
+
+class MetricFamily:
+    def __init__(self, name: str, kind: str, documentation: str, factory: Callable[[], Metric]) -> None:
+        self.name = name
+        self.kind = kind
+        self.documentation = documentation
+        self.factory = factory
+        self.children: Dict[Labels, Metric] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, **labels: str) -> Metric:
+        # Resolve the child once, outside the hot path, and keep a reference to it
+        key = tuple(sorted((name, str(value)) for name, value in labels.items()))
+        with self._lock:
+            child = self.children.get(key)
+            if child is None:
+                child = self.children[key] = self.factory()
+        return child
+
+    def remove(self, **labels: str) -> None:
+        key = tuple(sorted((name, str(value)) for name, value in labels.items()))
+        with self._lock:
+            self.children.pop(key, None)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for labels, child in list(self.children.items()):
+            if isinstance(child, Histogram):
+                cumulative = 0
+                for bound, count in zip(child.buckets + (float("inf"),), list(child.counts)):
+                    cumulative += count
+                    bucket_labels = _format_labels(labels, (("le", _format_value(bound)),))
+                    lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(child.sum)}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {child.count}")
+            else:
+                lines.append(f"{self.name}{_format_labels(labels)} {_format_value(child.value)}")
+        return lines
+
+
+class CollectorFamily:
+    # Values computed at scrape time, for state that already lives elsewhere (queue sizes, subscriber lists)
+    def __init__(self, name: str, kind: str, documentation: str) -> None:
+        self.name = name
+        self.kind = kind
+        self.documentation = documentation
+        self.collectors: List[Callable[[], Iterable[Tuple[Dict[str, str], float]]]] = []
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for collector in list(self.collectors):
+            for labels, value in collector():
+                key = tuple(sorted((name, str(label)) for name, label in labels.items()))
+                lines.append(f"{self.name}{_format_labels(key)} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self.families: Dict[str, Union[MetricFamily, CollectorFamily]] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, documentation: str) -> MetricFamily:
+        return self._family(name, "counter", documentation, Counter)
+
+    def gauge(self, name: str, documentation: str) -> MetricFamily:
+        return self._family(name, "gauge", documentation, Gauge)
+
+    def histogram(self, name: str, documentation: str, buckets: Sequence[float] = LATENCY_BUCKETS) -> MetricFamily:
+        return self._family(name, "histogram", documentation, lambda: Histogram(buckets))
+
+    def collector(
+        self,
+        name: str,
+        documentation: str,
+        collect: Callable[[], Iterable[Tuple[Dict[str, str], float]]],
+        kind: str = "gauge",
+    ) -> Callable[[], None]:
+        with self._lock:
+            family = self.families.get(name)
+            if family is None:
+                family = self.families[name] = CollectorFamily(name, kind, documentation)
+        assert isinstance(family, CollectorFamily)
+        family.collectors.append(collect)
+        return lambda: family.collectors.remove(collect)  # type: ignore
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for family in list(self.families.values()):
+            lines.extend(family.render())
+        return "\n".join(lines) + "\n"
+
+    def _family(self, name: str, kind: str, documentation: str, factory: Callable[[], Metric]) -> MetricFamily:
+        with self._lock:
+            family = self.families.get(name)
+            if family is None:
+                family = self.families[name] = MetricFamily(name, kind, documentation, factory)
+        assert isinstance(family, MetricFamily)
+        return family
+
+
+REGISTRY = MetricsRegistry()
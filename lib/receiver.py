@@ -1,56 +1,471 @@
-from typing import Generator
-import cv2
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Deque, Dict, Generator, Mapping, Optional, Sequence, Tuple, Union
 import numpy as np
-import requests  # type: ignore
 import math
-import ffmpeg
+import threading
+import time
 
-from .singleton import Singleton
+from .framing import FLAG_MIRROR, FRAME_HEADER, FRAMES_MEDIA_TYPE, KIND_JPEG, unpack_header
+from .lazy import lazy_import
+from .shm_transport import SharedFrameReader
 
+if TYPE_CHECKING:
+    import cv2
+    import ffmpeg
+    import requests  # type: ignore
+else:
+    cv2 = lazy_import("cv2")
+    ffmpeg = lazy_import("ffmpeg")
+    requests = lazy_import("requests")
 
-class ClientReceiver(metaclass=Singleton):
-    def __init__(self, url: str = "http://localhost:8000") -> None:
+
+class MultipartParser:
+    # Payloads are yielded as views into a reused buffer: they are only valid until the next iteration
+    def __init__(self, boundary: bytes = b"frame", buffer_size: int = 1024 * 1024) -> None:
+        self.delimiter = b"--" + boundary
+        self.separator = b"\r\n" + self.delimiter
+        self.buffer = bytearray(buffer_size)
+        self.headers: Dict[str, str] = {}
+        self._start = 0
+        self._end = 0
+        self._scan = 0
+        self._payload_start = -1
+        self._payload_length = -1
+
+    def feed(self, chunk: bytes) -> Generator[memoryview, None, None]:
+        self._append(chunk)
+        buffer = self.buffer
+        view = memoryview(buffer)
+        while True:
+            if self._payload_start < 0:
+                boundary = buffer.find(self.delimiter, self._scan, self._end)
+                if boundary < 0:
+                    self._start = self._scan = max(self._start, self._end - len(self.delimiter) + 1)
+                    return
+                self._start = boundary
+                header_end = buffer.find(b"\r\n\r\n", boundary, self._end)
+                if header_end < 0:
+                    self._scan = boundary
+                    return
+                self.headers = self._parse_headers(buffer[boundary + len(self.delimiter) : header_end])
+                self._payload_start = self._scan = header_end + 4
+                self._payload_length = int(self.headers.get("content-length", -1))
+
+            if self._payload_length >= 0:
+                payload_end = self._payload_start + self._payload_length
+                if payload_end > self._end:
+                    return
+            else:
+                # No Content-Length: scan for the next boundary, resuming where the previous chunk stopped
+                payload_end = buffer.find(self.separator, self._scan, self._end)
+                if payload_end < 0:
+                    self._scan = max(self._payload_start, self._end - len(self.separator) + 1)
+                    return
+
+            yield view[self._payload_start : payload_end]
+            self._start = self._scan = payload_end
+            self._payload_start = -1
+
+    def _append(self, chunk: bytes) -> None:
+        size = len(chunk)
+        if self._end + size > len(self.buffer):
+            self._compact()
+        if self._end + size > len(self.buffer):
+            grown = bytearray(max(len(self.buffer) * 2, self._end + size))
+            grown[: self._end] = memoryview(self.buffer)[: self._end]
+            self.buffer = grown
+        self.buffer[self._end : self._end + size] = chunk
+        self._end += size
+
+    def _compact(self) -> None:
+        if not self._start:
+            return
+        shift, remaining = self._start, self._end - self._start
+        self.buffer[:remaining] = self.buffer[shift : self._end]
+        self._start, self._end, self._scan = 0, remaining, self._scan - shift
+        if self._payload_start >= 0:
+            self._payload_start -= shift
+
+    @staticmethod
+    def _parse_headers(block: bytes) -> Dict[str, str]:
+        headers = {}
+        for line in bytes(block).split(b"\r\n"):
+            name, _, value = line.partition(b":")
+            if value:
+                headers[name.strip().lower().decode()] = value.strip().decode()
+        return headers
+
+
+class RawFrameParser:
+    # Reassembles fixed-size raw frames; the yielded view is overwritten by the next frame
+    def __init__(self, frame_size: int) -> None:
+        self.buffer = bytearray(frame_size)
+        self.filled = 0
+        # Raw frames carry no per-frame headers
+        self.headers: Dict[str, str] = {}
+
+    def feed(self, chunk: bytes) -> Generator[memoryview, None, None]:
+        data = memoryview(chunk)
+        frame_size = len(self.buffer)
+        while data:
+            size = min(len(data), frame_size - self.filled)
+            self.buffer[self.filled : self.filled + size] = data[:size]
+            self.filled += size
+            data = data[size:]
+            if self.filled == frame_size:
+                self.filled = 0
+                yield memoryview(self.buffer)
+
+
+class BinaryFrameParser:
+    # Length-prefixed frames (see framing.py): yields header + payload views into a reused buffer, nothing is scanned
+    def __init__(self, buffer_size: int = 1024 * 1024) -> None:
+        self.buffer = bytearray(buffer_size)
+        self._start = 0
+        self._end = 0
+
+    def feed(self, chunk: bytes) -> Generator[memoryview, None, None]:
+        self._append(chunk)
+        view = memoryview(self.buffer)
+        while self._end - self._start >= FRAME_HEADER.size:
+            frame_end = self._start + FRAME_HEADER.size + unpack_header(self.buffer, self._start).length
+            if frame_end > self._end:
+                return
+            yield view[self._start : frame_end]
+            self._start = frame_end
+
+    def _append(self, chunk: bytes) -> None:
+        size = len(chunk)
+        if self._end + size > len(self.buffer) and self._start:
+            remaining = self._end - self._start
+            self.buffer[:remaining] = self.buffer[self._start : self._end]
+            self._start, self._end = 0, remaining
+        if self._end + size > len(self.buffer):
+            grown = bytearray(max(len(self.buffer) * 2, self._end + size))
+            grown[: self._end] = memoryview(self.buffer)[: self._end]
+            self.buffer = grown
+        self.buffer[self._end : self._end + size] = chunk
+        self._end += size
+
+
+def _percentile_ms(ordered: Sequence[float], fraction: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return round(ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] * 1000, 2)
+
+
+class LatestFrameBuffer:
+    # Hand-off between decode threads and the consumer: bounded, the oldest frame is dropped when it is full
+    REORDER_WINDOW = 64
+
+    def __init__(self, size: int = 2) -> None:
+        self.size = size
+        self.frames: Deque[Tuple[int, float, np.ndarray]] = deque()
+        self.last_seq = -1
+        self.dropped = 0
+        self.closed = False
+        self._cond = threading.Condition()
+
+    def put(self, seq: int, timestamp: float, image: np.ndarray) -> None:
+        with self._cond:
+            # Decodes can finish out of order: never hand out a frame older than one already queued.
+            # A much lower seq means the server restarted its numbering after a reconnect.
+            if 0 <= self.last_seq - seq < self.REORDER_WINDOW:
+                self.dropped += 1
+                return
+            self.last_seq = seq
+            if len(self.frames) >= self.size:
+                self.frames.popleft()
+                self.dropped += 1
+            self.frames.append((seq, timestamp, image))
+            self._cond.notify()
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Tuple[int, float, np.ndarray]]:
+        with self._cond:
+            self._cond.wait_for(lambda: self.frames or self.closed, timeout)
+            return self.frames.popleft() if self.frames else None
+
+    def close(self) -> None:
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+class ClientReceiver:
+    # Reconnect delay doubles after every failed attempt, up to the maximum
+    RECONNECT_MIN_S = 0.5
+    RECONNECT_MAX_S = 10.0
+
+    def __init__(
+        self,
+        url: str = "http://localhost:8000",
+        shm_name: Optional[str] = None,
+        reconnect: bool = True,
+        session: Optional["requests.Session"] = None,
+    ) -> None:
+        # Receivers for several cameras of one server can pass the same session to share its connection pool
         self.url = url
-        self.metadata = self._metadata()
+        self.reconnect = reconnect
+        self.reconnects = 0
+        self.session = session or requests.Session()
+        self.content_type = ""
+        # Set from the server's Mirror header: frames arrive unmirrored and are flipped for display only
+        self.mirror = False
+        # Same-host mode: map frames straight out of the server's shared memory ring instead of HTTP
+        self.shm_reader = SharedFrameReader(shm_name) if shm_name else None
+        # Filled in-band from the stream response headers on every (re)connection, no extra round trip
+        self.metadata = self._metadata({})
+        self.skipped = 0
+        self.dropped = 0
+        self.latencies: Deque[float] = deque(maxlen=300)
+        self._parser: Union[MultipartParser, RawFrameParser, BinaryFrameParser, None] = None
+        self._closed = threading.Event()
+        self._response: Optional["requests.Response"] = None
+
+    def close(self) -> None:
+        # Safe from any thread: stops reconnecting and aborts the stream being read, its generator then ends
+        self._closed.set()
+        response = self._response
+        if response is not None:
+            response.close()
+        self.session.close()
+
+    def is_current(self, seq: int) -> bool:
+        # Shared memory mode: whether frame seq is still intact in its slot, i.e. a view of it was read consistently
+        return self.shm_reader is not None and self.shm_reader.is_current(seq)
 
     def display_video(self):
-        for chunk in self._get_bytes():
-            try:
-                frame = np.frombuffer(chunk, dtype=np.uint8).reshape(*self.metadata["screen_size"])  # or 480, 640, 3)
-            except:
-                buffer = np.frombuffer(chunk[37:], dtype=np.uint8)
-                frame = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
-            cv2.imshow("", frame)
+        for _, _, frame in self.frames():
+            cv2.imshow("", cv2.flip(frame, 1) if self.mirror else frame)
             cv2.waitKey(1)
 
+    def frames(
+        self, decode_workers: int = 2, buffer_size: int = 2, copy: bool = True
+    ) -> Generator[Tuple[int, float, np.ndarray], None, None]:
+        """
+        Yields (seq, capture timestamp, frame). Receiving and JPEG decoding run on background threads, so network
+        jitter and decode time overlap with the consumer; frames it is too slow for are skipped, never queued up.
+        In shared memory mode copy=False yields raw frames as views into the ring slot instead of copying them out:
+        a view is only valid while is_current(seq) holds, check it after using the frame and discard what was
+        computed from it otherwise.
+        """
+        if self.shm_reader is not None:
+            while not self._closed.is_set():
+                result = self.shm_reader.read(timeout=1.0)
+                if result is None:
+                    continue
+                seq, timestamp, data = result
+                if data.ndim == 1:
+                    # Encoded ring written by a capture process (python -m lib.capture)
+                    image = cv2.imdecode(data, cv2.IMREAD_COLOR)
+                elif copy:
+                    image = data.copy()
+                else:
+                    image = data
+                # Decoded or copied out of the slot, then kept only if the writer didn't reuse it meanwhile: the
+                # caller owns the frame and never sees a torn one. Views are checked again by the caller.
+                if image is not data and not self.shm_reader.is_current(seq):
+                    self.skipped += 1
+                    continue
+                self.latencies.append(time.time() - timestamp)
+                yield seq, timestamp, image
+            return
+
+        buffer = LatestFrameBuffer(buffer_size)
+        stop = threading.Event()
+        receiver = threading.Thread(target=self._receive_loop, args=(buffer, stop, decode_workers), daemon=True)
+        receiver.start()
+        try:
+            while True:
+                item = buffer.get(timeout=1.0)
+                if item is None:
+                    if buffer.closed:
+                        break
+                    continue
+                # Capture timestamps come from the server clock: cross-host numbers assume synchronised clocks
+                self.latencies.append(time.time() - item[1])
+                yield item
+        finally:
+            stop.set()
+            self.dropped += buffer.dropped
+
+    def jpeg_frames(self) -> Generator[Tuple[int, float, memoryview], None, None]:
+        """
+        Yields (seq, capture timestamp, JPEG) as received, without decoding, to relay a multipart or binary JPEG
+        stream. The JPEG is a view into the parser's buffer and only valid until the next iteration.
+        """
+        for seq, timestamp, payload in self._get_parts():
+            if self._binary:
+                if unpack_header(payload).kind != KIND_JPEG:
+                    raise ValueError(f"{self.url} sends raw frames, relaying needs payload=jpeg")
+                payload = payload[FRAME_HEADER.size :]
+            elif not self.content_type.startswith("multipart/"):
+                raise ValueError(f"{self.url} is a raw stream, relaying needs JPEG frames")
+            yield seq, timestamp, payload
+
+    def get_stats(self) -> Dict:
+        latencies = sorted(self.latencies)
+        return {
+            "skipped_frames": self.skipped,
+            "dropped_frames": self.dropped,
+            "latency_p50_ms": _percentile_ms(latencies, 0.5),
+            "latency_p95_ms": _percentile_ms(latencies, 0.95),
+        }
+
     def record_video(self, video_name: str = "output"):
+        payloads = self._get_payloads()
+        first_payload = next(payloads)
+        fps = self.metadata.get("fps") or 30
+        skip, jpeg = 0, self.content_type.startswith("multipart/")
+        if self._binary:
+            # Binary frames are recorded without their headers
+            header = unpack_header(first_payload)
+            skip, jpeg, size = FRAME_HEADER.size, header.kind == KIND_JPEG, (header.width, header.height)
+        else:
+            size = tuple(self.metadata["screen_size"][1::-1])
+        # The input format has to be explicit, ffmpeg can't probe a pipe
+        if jpeg:
+            stream = ffmpeg.input("pipe:", format="mjpeg", framerate=fps)
+        else:
+            stream = ffmpeg.input("pipe:", format="rawvideo", pix_fmt="bgr24", s="%dx%d" % size, framerate=fps)
         ffmpeg_process = (
-            ffmpeg.input("pipe:", framerate=self.metadata["fps"] or 30)
-            .output(f"./{video_name}.mp4", vcodec="libx264")
-            .overwrite_output()
-            .run_async(pipe_stdin=True)
+            stream.output(f"./{video_name}.mp4", vcodec="libx264").overwrite_output().run_async(pipe_stdin=True)
         )
 
-        for chunk in self._get_bytes():
+        try:
+            ffmpeg_process.stdin.write(first_payload[skip:])
+            for payload in payloads:
+                ffmpeg_process.stdin.write(payload[skip:])
+        except (BrokenPipeError, OSError):
+            pass
+        finally:
+            ffmpeg_process.stdin.close()
+            ffmpeg_process.wait()
+
+    def _receive_loop(self, buffer: LatestFrameBuffer, stop: threading.Event, workers: int) -> None:
+        # A frame is only handed to the pool when a decoder is free: a busy pool means newer frames are coming
+        free = threading.Semaphore(workers)
+        try:
+            with ThreadPoolExecutor(workers, thread_name_prefix="decode") as pool:
+                for seq, timestamp, payload in self._get_parts():
+                    if stop.is_set():
+                        break
+                    if not free.acquire(blocking=False):
+                        self.skipped += 1
+                        continue
+                    # The payload view is reused by the parser, the copy is what the decoder owns
+                    future = pool.submit(self._decode_into, buffer, seq, timestamp, bytes(payload))
+                    future.add_done_callback(lambda _: free.release())
+        finally:
+            buffer.close()
+
+    def _decode_into(self, buffer: LatestFrameBuffer, seq: int, timestamp: float, payload: bytes) -> None:
+        image = self._decode(payload)
+        if image is not None:
+            buffer.put(seq, timestamp, image)
+
+    def _get_parts(self) -> Generator[Tuple[int, float, memoryview], None, None]:
+        # Frames without server headers (raw streams, older servers) are numbered and stamped on arrival
+        for local_seq, payload in enumerate(self._get_payloads()):
+            if self._binary:
+                header = unpack_header(payload)
+                yield header.seq, header.timestamp, payload
+                continue
+            headers = self._parser.headers if self._parser is not None else {}
+            seq = int(headers.get("x-frame-seq", local_seq))
+            timestamp = float(headers.get("x-frame-timestamp", 0)) or time.time()
+            yield seq, timestamp, payload
+
+    def refresh_metadata(self) -> dict:
+        # HEAD only returns the stream headers on the server, it doesn't start a stream
+        try:
+            response = self.session.head(self.url, timeout=5.0)
+            response.raise_for_status()
+        except requests.RequestException:
+            return self.metadata
+        self.metadata = self._metadata(response.headers)
+        return self.metadata
+
+    def _connections(self) -> Generator["requests.Response", None, None]:
+        delay = self.RECONNECT_MIN_S
+        while not self._closed.is_set():
             try:
-                ffmpeg_process.stdin.write(chunk)
-            except:
-                ffmpeg_process.stdin.close()
-                ffmpeg_process.wait()
-
-    def _get_bytes(self) -> Generator[bytes, None, None]:
-        with requests.get(url=self.url, stream=True) as res:
-            res.raise_for_status()
-            for chunk in res.iter_content(chunk_size=self.metadata["chunk_size"] or 1024 * 1024):
-                yield chunk
-
-    def _metadata(self) -> dict:
+                response = self.session.get(self.url, stream=True, timeout=(5.0, 30.0))
+                response.raise_for_status()
+            except requests.RequestException:
+                if not self.reconnect or self._closed.is_set():
+                    raise
+                self._closed.wait(delay)
+                delay = min(delay * 2, self.RECONNECT_MAX_S)
+                self.reconnects += 1
+                continue
+            delay = self.RECONNECT_MIN_S
+            self.content_type = response.headers.get("content-type", "")
+            self.mirror = response.headers.get("mirror") == "1"
+            self.metadata = self._metadata(response.headers)
+            self._response = response
+            yield response
+            self._response = None
+            if not self.reconnect or self._closed.is_set():
+                return
+            # The server ended the stream (camera closed or reconfigured): come back with fresh metadata
+            self.reconnects += 1
+            self._closed.wait(self.RECONNECT_MIN_S)
+
+    def _get_payloads(self) -> Generator[memoryview, None, None]:
+        for response in self._connections():
+            with response:
+                # A fresh parser per connection: a dropped connection leaves a partial part behind
+                parser: Union[MultipartParser, RawFrameParser, BinaryFrameParser]
+                if self._binary:
+                    parser = BinaryFrameParser()
+                elif self.content_type.startswith("multipart/"):
+                    boundary = self.content_type.partition("boundary=")[2].strip('"') or "frame"
+                    parser = MultipartParser(boundary.encode())
+                else:
+                    if not self.metadata["screen_size"]:
+                        raise ValueError(f"{self.url} sent a raw stream without a Frame-Transform header")
+                    parser = RawFrameParser(math.prod(self.metadata["screen_size"]))
+                self._parser = parser
+                try:
+                    for chunk in response.iter_content(chunk_size=self.metadata["chunk_size"] or 1024 * 1024):
+                        yield from parser.feed(chunk)
+                except requests.RequestException:
+                    if not self.reconnect:
+                        raise
+                except (AttributeError, OSError):
+                    # close() shut the response while it was being read
+                    if not self._closed.is_set():
+                        raise
+                    return
+
+    @property
+    def _binary(self) -> bool:
+        return self.content_type.startswith(FRAMES_MEDIA_TYPE)
+
+    def _decode(self, payload: Union[bytes, memoryview]) -> np.ndarray:
+        if self._binary:
+            header = unpack_header(payload)
+            self.mirror = bool(header.flags & FLAG_MIRROR)
+            data = np.frombuffer(payload, dtype=np.uint8, offset=FRAME_HEADER.size)
+            if header.kind == KIND_JPEG:
+                return cv2.imdecode(data, cv2.IMREAD_COLOR)
+            return data.reshape(header.height, header.width, 3)
+        buffer = np.frombuffer(payload, dtype=np.uint8)
+        if self.content_type.startswith("multipart/"):
+            return cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+        return buffer.reshape(*self.metadata["screen_size"])  # or 480, 640, 3)
+
+    @staticmethod
+    def _metadata(headers: Mapping[str, str]) -> dict:
+        # Missing or malformed headers fall back to defaults instead of leaving keys out
+        metadata: dict = dict(screen_size=[], chunk_size=0, fps=0)
+        headers = {name.lower(): value for name, value in headers.items()}
         try:
-            res = requests.head(self.url)
-            return dict(
-                screen_size=list(map(int, res.headers["frame-transform"].split(","))),
-                chunk_size=math.prod(list(map(int, res.headers["chunk-size"].split(",")))),
-                fps=int(res.headers["fps"]),
-            )
-        except:
-            return {}
+            metadata["screen_size"] = list(map(int, headers["frame-transform"].split(",")))
+            metadata["chunk_size"] = math.prod(list(map(int, headers["chunk-size"].split(","))))
+            metadata["fps"] = int(float(headers["fps"]))
+        except (KeyError, ValueError):
+            pass
+        return metadata
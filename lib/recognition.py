@@ -0,0 +1,211 @@
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+import importlib
+import multiprocessing
+import queue
+import threading
+import time
+
+import numpy as np
+
+from .frame_buffer import Frame
+from .metrics import REGISTRY
+from .shm_transport import SharedFrameReader
+
+if TYPE_CHECKING:
+    from .camera import BaseWebCamera
+
+# Recognition task name -> module providing a pure analyze(image) -> dict function
+TASKS: Dict[str, str] = {
+    "barometer": ".barometer_recognition",
+    "gauge": ".circle_division",
+    "text": ".text_recognition",
+}
+
+FrameRef = Union[np.ndarray, Tuple[str, int]]
+
+
+@dataclass
+class RecognitionResult:
+    task: str
+    seq: int
+    timestamp: float
+    latency: float
+    duration: float
+    circle: Optional[Tuple[int, int, int]] = None
+    needle_angle: Optional[float] = None
+    value: Optional[str] = None
+    text: Optional[str] = None
+    data: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+
+
+_readers: Dict[str, SharedFrameReader] = {}
+
+
+def _process_frame(tasks: Sequence[str], seq: int, frame_ref: FrameRef) -> List[Dict]:
+    # Runs inside a worker process
+    if isinstance(frame_ref, tuple):
+        name, _ = frame_ref
+        reader = _readers.get(name)
+        if reader is None:
+            reader = _readers[name] = SharedFrameReader(name)
+        slot = reader.read_slot(seq)
+        if slot is None:
+            return []
+        image = slot[2]
+    else:
+        image = frame_ref
+
+    results = []
+    for task in tasks:
+        start = time.perf_counter()
+        try:
+            data, error = importlib.import_module(TASKS[task], __package__).analyze(image), None
+        except Exception as exc:  # pylint: disable=broad-except
+            data, error = {}, repr(exc)
+        results.append({"task": task, "data": data, "error": error, "duration": time.perf_counter() - start})
+
+    if isinstance(frame_ref, tuple) and not reader.is_current(seq):
+        # The capture side reused the slot while we were reading it
+        return []
+    return results
+
+
+class RecognitionPipeline:
+    def __init__(
+        self, camera: "BaseWebCamera", tasks: Sequence[str] = ("gauge",), workers: int = 2, results_size: int = 64
+    ) -> None:
+        unknown = set(tasks) - set(TASKS)
+        if unknown:
+            raise ValueError(f"Unknown recognition tasks: {', '.join(sorted(unknown))}")
+        self.camera = camera
+        self.tasks = tuple(tasks)
+        self.workers = workers
+        self.results: "queue.Queue[RecognitionResult]" = queue.Queue(maxsize=results_size)
+        self.latest: Dict[str, RecognitionResult] = {}
+        self.processed = 0
+        self.in_flight = 0
+        self.dropped = 0
+        self.running = False
+        self._listeners: List[Callable[[RecognitionResult], None]] = []
+        self._slots = threading.Semaphore(workers)
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._thread: Optional[threading.Thread] = None
+        latency = REGISTRY.histogram("recognition_latency_seconds", "Capture to recognition result time")
+        duration = REGISTRY.histogram("recognition_duration_seconds", "Time spent in analyze()")
+        self._latency = {task: latency.labels(task=task) for task in self.tasks}
+        self._duration = {task: duration.labels(task=task) for task in self.tasks}
+        self._unregister_collectors = [
+            REGISTRY.collector(
+                "recognition_queue_depth", "Undelivered recognition results", lambda: [({}, self.results.qsize())]
+            ),
+            REGISTRY.collector("recognition_in_flight", "Frames being analyzed", lambda: [({}, self.in_flight)]),
+        ]
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self.running = True
+        if self._executor is not None:
+            # Left over from a dispatch loop that ended with the capture, frames already submitted still finish
+            self._executor.shutdown(wait=False)
+        self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        self._thread = threading.Thread(target=self._dispatch_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self.running = False
+        if self._thread is not None:
+            self._thread.join()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        for unregister in self._unregister_collectors:
+            unregister()
+        self._unregister_collectors = []
+
+    def add_listener(self, listener: Callable[[RecognitionResult], None]) -> None:
+        # Called from the pool's result thread for every result, keep it short
+        self._listeners = [*self._listeners, listener]
+
+    def get_latest(self) -> Dict[str, RecognitionResult]:
+        return dict(self.latest)
+
+    def get_stats(self) -> Dict:
+        return {
+            "recognition_in_flight": self.in_flight,
+            "recognition_processed": self.processed,
+            "recognition_dropped_frames": self.dropped,
+            "recognition_queue_depth": self.results.qsize(),
+        }
+
+    def _dispatch_loop(self) -> None:
+        cursor = self.camera.subscribe()
+        try:
+            while self.running:
+                # Wait for a free worker first, then take the newest frame: stale frames are never queued
+                if not self._slots.acquire(timeout=1.0):
+                    continue
+                frame = cursor.read(timeout=1.0, latest=True)
+                self.dropped = cursor.dropped
+                if frame is None:
+                    self._slots.release()
+                    if cursor.ring.closed:
+                        # The capture ended: no more frames will come, start() subscribes again
+                        break
+                    continue
+
+                writer = self.camera.shm_writer
+                # Workers map raw rings directly, encoded ones hold JPEGs meant for HTTP workers
+                shared = writer is not None and not writer.encoded
+                frame_ref: FrameRef = (writer.shm.name, frame.seq) if shared else frame.image  # type: ignore
+                with self._lock:
+                    self.in_flight += 1
+                future = self._executor.submit(_process_frame, self.tasks, frame.seq, frame_ref)  # type: ignore
+                future.add_done_callback(partial(self._on_done, frame))
+        finally:
+            self.running = False
+            self.camera.unsubscribe(cursor)
+
+    def _on_done(self, frame: Frame, future: "Future[List[Dict]]") -> None:
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+        if future.cancelled() or future.exception() is not None:
+            return
+
+        now = time.time()
+        for item in future.result():
+            data = item["data"]
+            result = RecognitionResult(
+                task=item["task"],
+                seq=frame.seq,
+                timestamp=frame.timestamp,
+                latency=now - frame.timestamp,
+                duration=item["duration"],
+                circle=data.get("circle"),
+                needle_angle=data.get("needle_angle"),
+                value=data.get("value"),
+                text=data.get("text"),
+                data=data,
+                error=item["error"],
+            )
+            self._latency[result.task].observe(result.latency)
+            self._duration[result.task].observe(result.duration)
+            self.latest[result.task] = result
+            self.processed += 1
+            for listener in self._listeners:
+                listener(result)
+            while True:
+                try:
+                    self.results.put_nowait(result)
+                    break
+                except queue.Full:
+                    # Consumers that fall behind lose the oldest results, never the newest
+                    try:
+                        self.results.get_nowait()
+                    except queue.Empty:
+                        pass
@@ -0,0 +1,193 @@
+from typing import TYPE_CHECKING, Dict, List, Optional
+import glob
+import os
+import queue
+import subprocess
+import threading
+import time
+
+from .frame_buffer import Frame
+from .lazy import lazy_import
+from .metrics import REGISTRY
+
+if TYPE_CHECKING:
+    import ffmpeg
+
+    from .camera import BaseWebCamera
+else:
+    ffmpeg = lazy_import("ffmpeg")
+
+
+class VideoRecorder:
+    """
+    Records a camera's shared frame feed into time-based segments through an ffmpeg subprocess.
+    Frames are handed over on the capture thread through a bounded queue: when ffmpeg falls behind,
+    frames are dropped and counted, capture and live streams never wait for the recorder.
+    """
+
+    def __init__(
+        self,
+        camera: "BaseWebCamera",
+        path: str,
+        segment_seconds: int = 300,
+        retention: int = 288,
+        queue_size: int = 60,
+        codec: str = "libx264",
+    ) -> None:
+        # codec "copy" stores an MJPEG camera's own frames in Matroska segments without encoding them
+        self.camera = camera
+        self.path = path
+        self.segment_seconds = segment_seconds
+        self.retention = retention
+        self.codec = codec
+        self.extension = ".mkv" if codec == "copy" else ".mp4"
+        self.written = 0
+        self.dropped = 0
+        self.restarts = 0
+        self.running = False
+        self._queue: "queue.Queue[Optional[Frame]]" = queue.Queue(maxsize=queue_size)
+        self._process: Optional[subprocess.Popen] = None
+        self._passthrough = False
+        self._thread: Optional[threading.Thread] = None
+        labels = {"camera": camera.name}
+        self._written_total = REGISTRY.counter("recorder_frames_written_total", "Frames written to ffmpeg").labels(
+            **labels
+        )
+        self._dropped_total = REGISTRY.counter(
+            "recorder_dropped_frames_total", "Frames dropped because the recorder fell behind"
+        ).labels(**labels)
+
+    @property
+    def pattern(self) -> str:
+        return f"{self.path}_%Y%m%d-%H%M%S{self.extension}"
+
+    def start(self) -> None:
+        if self.running:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.running = True
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._thread.start()
+        self.camera.frames.add_listener(self._on_frame)
+        self.camera.start()
+
+    def stop(self) -> None:
+        if not self.running:
+            return
+        self.running = False
+        self.camera.frames.remove_listener(self._on_frame)
+        while True:
+            # Make room for the sentinel, frames still queued are lost with the recording being stopped
+            try:
+                self._queue.put_nowait(None)
+                break
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    pass
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def segments(self) -> List[str]:
+        # Timestamped names sort chronologically
+        return sorted(glob.glob(f"{glob.escape(self.path)}_*{self.extension}"))
+
+    def get_stats(self) -> Dict:
+        return {
+            "recorder_written_frames": self.written,
+            "recorder_dropped_frames": self.dropped,
+            "recorder_queue_depth": self._queue.qsize(),
+            "recorder_restarts": self.restarts,
+        }
+
+    def _on_frame(self, frame: Frame) -> None:
+        # Runs on the capture thread: never block it
+        try:
+            self._queue.put_nowait(frame)
+        except queue.Full:
+            self.dropped += 1
+            self._dropped_total.inc()
+
+    def _spawn(self, frame: Frame) -> subprocess.Popen:
+        # Wall clock timestamps keep the recording in real time even when frames were dropped
+        fps = self.camera.fps or 30
+        self._passthrough = self.codec == "copy" and frame.jpeg is not None
+        if self._passthrough:
+            stream = ffmpeg.input("pipe:", format="mjpeg", framerate=fps, use_wallclock_as_timestamps=1)
+        else:
+            height, width = frame.image.shape[:2]
+            stream = ffmpeg.input(
+                "pipe:",
+                format="rawvideo",
+                pix_fmt="bgr24",
+                s=f"{width}x{height}",
+                framerate=fps,
+                use_wallclock_as_timestamps=1,
+            )
+        # "copy" on a source without native JPEG frames falls back to libx264
+        codec = "copy" if self._passthrough else "libx264" if self.codec == "copy" else self.codec
+        # bgr24 input would otherwise be encoded as 4:4:4, which most browsers and hardware decoders can't play
+        encode_args = {"vcodec": codec, "preset": "veryfast", "pix_fmt": "yuv420p"}
+        codec_args = {"vcodec": codec} if codec == "copy" else encode_args
+        return (
+            stream.output(
+                self.pattern,
+                format="segment",
+                segment_time=self.segment_seconds,
+                reset_timestamps=1,
+                strftime=1,
+                **codec_args,
+            )
+            .global_args("-loglevel", "error")
+            .run_async(pipe_stdin=True)
+        )
+
+    def _write_loop(self) -> None:
+        last_cleanup = time.monotonic()
+        try:
+            while True:
+                frame = self._queue.get()
+                if frame is None:
+                    break
+                if self._process is None:
+                    self._process = self._spawn(frame)
+                payload = frame.jpeg if self._passthrough else frame.image.data
+                try:
+                    self._process.stdin.write(payload)  # type: ignore
+                except (BrokenPipeError, OSError):
+                    # ffmpeg died (disk full, killed...): start a fresh segment with the next frame
+                    self._close_process()
+                    self.restarts += 1
+                    continue
+                self.written += 1
+                self._written_total.inc()
+
+                if time.monotonic() - last_cleanup >= self.segment_seconds:
+                    self._apply_retention()
+                    last_cleanup = time.monotonic()
+        finally:
+            self._close_process()
+            self._apply_retention()
+
+    def _close_process(self) -> None:
+        process, self._process = self._process, None
+        if process is None:
+            return
+        try:
+            process.stdin.close()  # type: ignore
+        except OSError:
+            pass
+        process.wait()
+
+    def _apply_retention(self) -> None:
+        # Keep the newest `retention` segments, the one being written is always among them
+        if not self.retention:
+            return
+        for segment in self.segments()[: -self.retention]:
+            try:
+                os.remove(segment)
+            except OSError:
+                pass
@@ -0,0 +1,131 @@
+from typing import Any, Callable, Dict, List, Optional
+import threading
+import time
+
+from .camera import WebCameraStream
+from .encoders import JpegEncoder
+
+
+class CameraRegistry:
+    # One WebCameraStream per source: opened on first use, closed after idle_timeout seconds without subscribers
+    def __init__(
+        self,
+        sources: Optional[Dict[str, str]] = None,
+        idle_timeout: float = 30.0,
+        camera_options: Optional[Dict[str, Any]] = None,
+        encoder_factory: Optional[Callable[[], JpegEncoder]] = None,
+    ) -> None:
+        self.sources = dict(sources or {})
+        self.idle_timeout = idle_timeout
+        # Extra WebCameraStream arguments shared by every camera, e.g. the JPEG encoder
+        self.camera_options = dict(camera_options or {})
+        # Builds the shared encoder when the first camera opens: encoder backends load cv2/libjpeg-turbo,
+        # which importing the server shouldn't pay for
+        self.encoder_factory = encoder_factory
+        self._cameras: Dict[str, WebCameraStream] = {}
+        self._idle_since: Dict[str, float] = {}
+        # Sources being opened right now: concurrent requests for one wait on its event, other lookups don't wait
+        self._opening: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self._encoder_lock = threading.Lock()
+        self._reaper: Optional[threading.Thread] = None
+
+    @property
+    def default_id(self) -> str:
+        return next(iter(self.sources), "0")
+
+    def ids(self) -> List[str]:
+        return list(self.sources)
+
+    def opened(self) -> List[str]:
+        # The ids the routes accept for the open cameras, not the source specs they are keyed by
+        opened = set(self._cameras)
+        ids = [cam_id for cam_id, source in self.sources.items() if source in opened]
+        configured = set(self.sources.values())
+        return ids + [source for source in opened if source.isdigit() and source not in configured]
+
+    def resolve(self, cam_id: str) -> str:
+        # Configured ids map to a source spec, bare numbers are device indexes.
+        # Cameras are keyed by the spec so two ids for the same device share one capture thread.
+        if cam_id in self.sources:
+            return self.sources[cam_id]
+        if cam_id.isdigit():
+            return cam_id
+        raise KeyError(cam_id)
+
+    def get(self, cam_id: Optional[str] = None) -> WebCameraStream:
+        source = self.resolve(cam_id or self.default_id)
+        while True:
+            with self._lock:
+                camera = self._cameras.get(source)
+                if camera is not None:
+                    self._idle_since.pop(source, None)
+                    return camera
+                opening = self._opening.get(source)
+                if opening is None:
+                    opening = self._opening[source] = threading.Event()
+                    break
+            # Someone else is opening this source; if that failed, the next pass tries again
+            opening.wait()
+
+        # Opening a device, waiting for a capture process's ring or connecting a relay can take seconds:
+        # it happens outside the lock so other cameras and the reaper carry on meanwhile
+        camera = None
+        try:
+            camera = WebCameraStream(source=source, **self._options())
+        finally:
+            with self._lock:
+                del self._opening[source]
+                if camera is not None:
+                    self._cameras[source] = camera
+                    self._start_reaper()
+            opening.set()
+        return camera
+
+    def _options(self) -> Dict[str, Any]:
+        with self._encoder_lock:
+            if self.encoder_factory is not None:
+                self.camera_options["encoder"] = self.encoder_factory()
+                self.encoder_factory = None
+            return self.camera_options
+
+    def close(self, source: str) -> None:
+        with self._lock:
+            camera = self._cameras.pop(source, None)
+            self._idle_since.pop(source, None)
+        if camera is not None:
+            camera.close()
+
+    def close_all(self) -> None:
+        for source in list(self._cameras):
+            self.close(source)
+
+    def _start_reaper(self) -> None:
+        if self._reaper is None or not self._reaper.is_alive():
+            self._reaper = threading.Thread(target=self._reap_idle, daemon=True)
+            self._reaper.start()
+
+    def _reap_idle(self) -> None:
+        while self._cameras:
+            time.sleep(min(self.idle_timeout / 2, 1.0))
+            now = time.monotonic()
+            idle = []
+            with self._lock:
+                for source, camera in list(self._cameras.items()):
+                    if camera.active:
+                        self._idle_since.pop(source, None)
+                    elif now - self._idle_since.setdefault(source, now) >= self.idle_timeout:
+                        idle.append(self._cameras.pop(source))
+                        del self._idle_since[source]
+            # Releasing the device stops its capture thread and frees the USB bandwidth
+            for camera in idle:
+                camera.close()
+
+
+def parse_cameras(spec: str) -> Dict[str, str]:
+    # "front=1,back=2,test=synthetic:640x480@15" -> {"front": "1", ...}; a bare entry uses itself as the id
+    sources = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        cam_id, _, source = item.partition("=")
+        sources[cam_id] = source or cam_id
+    return sources
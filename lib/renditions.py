@@ -0,0 +1,30 @@
+from typing import NamedTuple, Optional, Tuple
+
+
+class Rendition(NamedTuple):
+    name: str
+    height: int
+    quality: int
+
+
+# Ordered from best to cheapest: adaptive clients step down this ladder when they can't keep up
+RENDITIONS: Tuple[Rendition, ...] = (
+    Rendition("1080p", 1080, 80),
+    Rendition("720p", 720, 70),
+    Rendition("360p", 360, 60),
+)
+
+
+def scaled_size(height: Optional[int], frame_width: int, frame_height: int) -> Optional[Tuple[int, int]]:
+    # None keeps the native resolution: never upscale, and keep the camera aspect ratio with even dimensions
+    if height is None or not frame_height or height >= frame_height:
+        return None
+    width = int(round(frame_width * height / frame_height / 2)) * 2
+    return width, height - height % 2
+
+
+def find_rendition(name: str) -> int:
+    for index, rendition in enumerate(RENDITIONS):
+        if rendition.name == name:
+            return index
+    raise ValueError(f"Unknown rendition {name!r}, expected one of {', '.join(r.name for r in RENDITIONS)}")
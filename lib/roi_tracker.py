@@ -0,0 +1,58 @@
+from typing import Optional, Sequence, Tuple
+import math
+
+Circle = Tuple[int, int, int]
+# x0, y0, x1, y1, min radius, max radius
+SearchRegion = Tuple[int, int, int, int, int, int]
+
+
+class CircleTracker:
+    def __init__(
+        self, redetect_every: int = 30, padding: float = 0.3, max_shift: float = 0.25, max_radius_change: float = 0.15
+    ) -> None:
+        self.redetect_every = redetect_every
+        self.padding = padding
+        self.max_shift = max_shift
+        self.max_radius_change = max_radius_change
+        self.circle: Optional[Circle] = None
+        self.frames_since_full = 0
+        self.full_searches = 0
+        self.roi_searches = 0
+        self.fallbacks = 0
+
+    def search_region(self, shape: Sequence[int]) -> Optional[SearchRegion]:
+        # None means a full-frame search is due: start-up, after a loss or every redetect_every frames
+        if self.circle is None or self.frames_since_full >= self.redetect_every:
+            return None
+        x, y, r = self.circle
+        height, width = shape[:2]
+        pad = int(r * (1 + self.padding))
+        self.frames_since_full += 1
+        self.roi_searches += 1
+        return (
+            max(x - pad, 0),
+            max(y - pad, 0),
+            min(x + pad, width),
+            min(y + pad, height),
+            max(int(r * (1 - self.max_radius_change)), 1),
+            int(r * (1 + self.max_radius_change)) + 1,
+        )
+
+    def confirm(self, circle: Optional[Sequence[int]]) -> bool:
+        # Accept an ROI detection only if it stayed close to the tracked circle, otherwise force a full search
+        if circle is None or self.circle is None:
+            self.fallbacks += 1
+            return False
+        x, y, r = self.circle
+        cx, cy, cr = circle[:3]
+        if math.hypot(cx - x, cy - y) > self.max_shift * r or abs(cr - r) > self.max_radius_change * r:
+            self.fallbacks += 1
+            return False
+        self.circle = (int(cx), int(cy), int(cr))
+        return True
+
+    def reset(self, circle: Optional[Sequence[int]]) -> Optional[Circle]:
+        self.full_searches += 1
+        self.frames_since_full = 0
+        self.circle = (int(circle[0]), int(circle[1]), int(circle[2])) if circle is not None else None
+        return self.circle
@@ -0,0 +1,169 @@
+from multiprocessing import resource_tracker, shared_memory
+from typing import Optional, Tuple, Union
+import struct
+import threading
+import time
+
+import numpy as np
+
+from .frame_buffer import Frame
+
+MAGIC = b"SWVF"
+# magic, slot count, slot payload size, capture fps, last published sequence
+RING_HEADER = struct.Struct("<4sIQIq")
+# write sequence, commit sequence, capture timestamp, height, width, channels, dtype, payload length
+SLOT_HEADER = struct.Struct("<qqdIII8sQ")
+RING_HEADER_SIZE = 64
+SLOT_HEADER_SIZE = 64
+# dtype of slots holding a JPEG instead of pixels, read back as a 1-D uint8 array
+JPEG_DTYPE = b"jpeg"
+# Bounds of the readers' polling interval, and the interval for rings of unknown fps
+MIN_POLL_S = 0.001
+MAX_POLL_S = 0.05
+DEFAULT_POLL_S = 0.005
+
+
+# Held while shared memory is created or attached in this process, see _attach()
+_tracker_lock = threading.Lock()
+
+
+def _slot_offset(index: int, slot_size: int) -> int:
+    return RING_HEADER_SIZE + index * (SLOT_HEADER_SIZE + slot_size)
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    # Only the writer registers the segment with the resource tracker. Python < 3.13 registers every attach, and
+    # unregistering afterwards would also drop the writer's registration when both share a tracker, as the
+    # recognition pool's spawned workers do: registration is skipped for the attach instead.
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # type: ignore
+    except TypeError:
+        pass
+    with _tracker_lock:
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+
+class SharedFrameWriter:
+    def __init__(
+        self, name: str, slot_size: int = 1920 * 1080 * 3, slots: int = 8, fps: int = 0, encoded: bool = False
+    ) -> None:
+        self.slots = slots
+        self.slot_size = slot_size
+        # Encoded rings are written with write_jpeg(), raw ones with write()
+        self.encoded = encoded
+        size = _slot_offset(slots, slot_size)
+        with _tracker_lock:
+            try:
+                self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            except FileExistsError:
+                # Left over from a previous run that didn't shut down cleanly
+                stale = shared_memory.SharedMemory(name=name)
+                stale.close()
+                stale.unlink()
+                self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        RING_HEADER.pack_into(self.shm.buf, 0, MAGIC, slots, slot_size, fps, -1)
+        for index in range(slots):
+            SLOT_HEADER.pack_into(self.shm.buf, _slot_offset(index, slot_size), -1, -1, 0.0, 0, 0, 0, b"", 0)
+
+    def write(self, frame: Frame) -> None:
+        image = frame.image
+        if image.nbytes > self.slot_size:
+            return
+        offset = _slot_offset(frame.seq % self.slots, self.slot_size)
+        height, width = image.shape[:2]
+        channels = image.shape[2] if image.ndim == 3 else 1
+
+        # Seqlock: readers compare both sequence numbers to detect a slot rewritten under them
+        struct.pack_into("<q", self.shm.buf, offset, frame.seq)
+        target = np.ndarray(image.shape, dtype=image.dtype, buffer=self.shm.buf, offset=offset + SLOT_HEADER_SIZE)
+        np.copyto(target, image)
+        del target
+        self._commit(offset, frame, height, width, channels, image.dtype.str.encode(), image.nbytes)
+
+    def write_jpeg(self, frame: Frame, jpeg: Union[bytes, memoryview], size: Tuple[int, int]) -> None:
+        # size is the (width, height) the JPEG was encoded at
+        if len(jpeg) > self.slot_size:
+            return
+        offset = _slot_offset(frame.seq % self.slots, self.slot_size)
+        struct.pack_into("<q", self.shm.buf, offset, frame.seq)
+        start = offset + SLOT_HEADER_SIZE
+        self.shm.buf[start : start + len(jpeg)] = jpeg
+        self._commit(offset, frame, size[1], size[0], 3, JPEG_DTYPE, len(jpeg))
+
+    def _commit(
+        self, offset: int, frame: Frame, height: int, width: int, channels: int, dtype: bytes, length: int
+    ) -> None:
+        SLOT_HEADER.pack_into(
+            self.shm.buf, offset, frame.seq, frame.seq, frame.timestamp, height, width, channels, dtype, length
+        )
+        struct.pack_into("<q", self.shm.buf, RING_HEADER.size - 8, frame.seq)
+
+    def close(self) -> None:
+        self.shm.close()
+        self.shm.unlink()
+
+
+class SharedFrameReader:
+    def __init__(self, name: str) -> None:
+        self.shm = _attach(name)
+        magic, self.slots, self.slot_size, self.fps, _ = RING_HEADER.unpack_from(self.shm.buf, 0)
+        if magic != MAGIC:
+            self.shm.close()
+            raise ValueError(f"Shared memory {name} is not a frame ring")
+        self.next_seq = self.last_seq + 1
+        self.dropped = 0
+        # Half a frame interval: every worker polls every ring, a tighter loop only burns CPU between frames
+        self.poll_interval = min(max(0.5 / self.fps, MIN_POLL_S), MAX_POLL_S) if self.fps else DEFAULT_POLL_S
+
+    @property
+    def last_seq(self) -> int:
+        return struct.unpack_from("<q", self.shm.buf, RING_HEADER.size - 8)[0]
+
+    def read(
+        self, timeout: Optional[float] = None, latest: bool = True, poll_interval: Optional[float] = None
+    ) -> Optional[Tuple[int, float, np.ndarray]]:
+        # Returns a view into shared memory: check is_current(seq) after use if the data must not have been replaced
+        if poll_interval is None:
+            poll_interval = self.poll_interval
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            last_seq = self.last_seq
+            if last_seq >= self.next_seq:
+                seq = last_seq if latest else max(self.next_seq, last_seq - self.slots + 2)
+                result = self.read_slot(seq)
+                if result is not None:
+                    self.dropped += seq - self.next_seq
+                    self.next_seq = seq + 1
+                    return result
+                continue
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(poll_interval)
+
+    def is_current(self, seq: int) -> bool:
+        offset = _slot_offset(seq % self.slots, self.slot_size)
+        write_seq, commit_seq = struct.unpack_from("<qq", self.shm.buf, offset)
+        return write_seq == commit_seq == seq
+
+    def close(self) -> None:
+        self.shm.close()
+
+    def read_slot(self, seq: int) -> Optional[Tuple[int, float, np.ndarray]]:
+        offset = _slot_offset(seq % self.slots, self.slot_size)
+        write_seq, commit_seq, timestamp, height, width, channels, dtype, length = SLOT_HEADER.unpack_from(
+            self.shm.buf, offset
+        )
+        if write_seq != seq or commit_seq != seq:
+            return None
+        dtype = dtype.rstrip(b"\0")
+        if dtype == JPEG_DTYPE:
+            image = np.ndarray((length,), dtype=np.uint8, buffer=self.shm.buf, offset=offset + SLOT_HEADER_SIZE)
+            return seq, timestamp, image
+        shape = (height, width, channels) if channels > 1 else (height, width)
+        image = np.ndarray(shape, dtype=np.dtype(dtype.decode()), buffer=self.shm.buf, offset=offset + SLOT_HEADER_SIZE)
+        return seq, timestamp, image
@@ -0,0 +1,493 @@
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, Generator, List, Optional, Tuple, Union
+import os
+import threading
+import time
+import numpy as np
+
+from .lazy import lazy_import
+from .receiver import ClientReceiver
+from .shm_transport import SharedFrameReader
+
+if TYPE_CHECKING:
+    import cv2
+else:
+    cv2 = lazy_import("cv2")
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+class FrameSource(ABC):
+    width: int = 0
+    height: int = 0
+    fps: int = 0
+    # True when read_jpeg() hands out the camera's own JPEG frames
+    compressed: bool = False
+    # Wall clock time the last grabbed frame was captured
+    timestamp: float = 0.0
+    _grabbed: Tuple[bool, Optional[np.ndarray]] = (False, None)
+
+    @abstractmethod
+    def isOpened(self) -> bool:  # pylint: disable=invalid-name
+        ...
+
+    @abstractmethod
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        ...
+
+    def read_jpeg(self) -> Tuple[bool, Optional[bytes]]:
+        # Only compressed sources have JPEGs of their own, the others decode nothing and hand out pixels
+        return False, None
+
+    def grab(self) -> bool:
+        # Sources without a separate grab step read the whole frame here, retrieve() hands it out
+        self._grabbed = self.read()
+        self.timestamp = time.time()
+        return self._grabbed[0] and self._grabbed[1] is not None
+
+    def retrieve(self) -> Tuple[bool, Optional[np.ndarray]]:
+        grabbed, self._grabbed = self._grabbed, (False, None)
+        return grabbed
+
+    def retrieve_jpeg(self) -> Tuple[bool, Optional[bytes]]:
+        return False, None
+
+    def reopen(self) -> bool:
+        # False when the source can't come back (end of a file), capture then stops
+        return False
+
+    def release(self) -> None:
+        pass
+
+
+class _Pacer:
+    def __init__(self, fps: float) -> None:
+        self.interval = 1.0 / fps if fps > 0 else 0.0
+        self.deadline = time.monotonic()
+
+    def wait(self) -> None:
+        if not self.interval:
+            return
+        self.deadline += self.interval
+        delay = self.deadline - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            # Fell behind: don't try to catch up with a burst of frames
+            self.deadline = time.monotonic()
+
+
+class DeviceSource(FrameSource):
+    """
+    A local camera. low_latency keeps the driver queue to a single buffer and drains frames that were queued
+    while the consumer was busy: grab() is cheap (no decode), so stale frames are skipped and only the newest
+    one is retrieved and decoded.
+    """
+
+    def __init__(
+        self,
+        cam_id: int = 0,
+        width: int = 1920,
+        height: int = 1080,
+        fourcc: str = "MJPG",
+        passthrough: bool = False,
+        low_latency: bool = False,
+        max_drain: int = 4,
+    ) -> None:
+        self.cam_id = cam_id
+        self.fourcc = fourcc
+        self.passthrough = passthrough
+        self.low_latency = low_latency
+        self.max_drain = max_drain
+        self.drained = 0
+        self.requested_size = (width, height)
+        self._open()
+        if not self.cap.isOpened():
+            # Only the first open fails: a device that goes away later is reopened by the capture loop
+            self.cap.release()
+            raise OSError(f"Failed to open camera device {cam_id}")
+
+    def _open(self) -> None:
+        cap = cv2.VideoCapture(self.cam_id)
+        cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*self.fourcc))
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.requested_size[0])
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.requested_size[1])
+        if self.low_latency:
+            # Honoured by V4L2 and DirectShow, other backends ignore it and rely on draining in grab()
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self.cap = cap
+        self.width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.fps = int(cap.get(cv2.CAP_PROP_FPS))
+        self.compressed = self.passthrough and self.fourcc == "MJPG" and self._enable_passthrough()
+
+    def _enable_passthrough(self) -> bool:
+        # With RGB conversion off, backends that support it (V4L2, MSMF) return the MJPEG buffer as one row of bytes
+        self.cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+        ret, buffer = self.cap.read()
+        if ret and buffer is not None and buffer.ndim == 2 and buffer.shape[0] == 1:
+            if buffer[0, :2].tobytes() == b"\xff\xd8":
+                return True
+        self.cap.set(cv2.CAP_PROP_CONVERT_RGB, 1)
+        return False
+
+    def isOpened(self) -> bool:  # pylint: disable=invalid-name
+        return self.cap.isOpened()
+
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+
+    def read_jpeg(self) -> Tuple[bool, Optional[bytes]]:
+        if not self.grab():
+            return False, None
+        return self.retrieve_jpeg()
+
+    def grab(self) -> bool:
+        # A grab that returns well within a frame interval came out of the driver queue: the frame is stale,
+        # grab again (bounded, a camera reporting no fps is never drained)
+        interval = 0.5 / self.fps if self.low_latency and self.fps > 0 else 0.0
+        for drained in range(self.max_drain + 1):
+            started = time.perf_counter()
+            if not self.cap.grab():
+                return False
+            self.timestamp = time.time()
+            if drained == self.max_drain or time.perf_counter() - started >= interval:
+                break
+            self.drained += 1
+        return True
+
+    def retrieve(self) -> Tuple[bool, Optional[np.ndarray]]:
+        if not self.compressed:
+            ret, frame = self.cap.retrieve()
+            return (True, frame) if ret and frame is not None else (False, None)
+        ret, jpeg = self.retrieve_jpeg()
+        if not ret:
+            return False, None
+        return True, cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)  # type: ignore
+
+    def retrieve_jpeg(self) -> Tuple[bool, Optional[bytes]]:
+        ret, buffer = self.cap.retrieve()
+        return (True, buffer.tobytes()) if ret and buffer is not None else (False, None)
+
+    def reopen(self) -> bool:
+        # Unplugged or stalled devices (USB resets, suspended drivers) usually come back after a fresh open
+        self.cap.release()
+        self._open()
+        return True
+
+    def release(self) -> None:
+        self.cap.release()
+
+
+class FileSource(FrameSource):
+    def __init__(self, path: str, fps: Optional[int] = None, loop: bool = True) -> None:
+        self.path = path
+        self.loop = loop
+        self.cap: Optional[cv2.VideoCapture] = None
+        self.images: List[np.ndarray] = []
+        self.index = 0
+
+        if os.path.isdir(path):
+            names = sorted(name for name in os.listdir(path) if name.lower().endswith(IMAGE_EXTENSIONS))
+            # Decode once up front so pacing isn't skewed by disk and decoder time
+            for name in names:
+                image = cv2.imread(os.path.join(path, name), cv2.IMREAD_COLOR)
+                if image is None:
+                    # Unreadable or not really an image despite its extension
+                    raise ValueError(f"Failed to decode image {os.path.join(path, name)}")
+                self.images.append(image)
+            if not self.images:
+                raise ValueError(f"No images found in {path}")
+            self.height, self.width = self.images[0].shape[:2]
+            self.fps = fps or 30
+        else:
+            self.cap = cv2.VideoCapture(path)
+            if not self.cap.isOpened():
+                raise OSError(f"Failed to open video file {path}")
+            self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            self.fps = fps or int(self.cap.get(cv2.CAP_PROP_FPS)) or 30
+        self.pacer = _Pacer(self.fps)
+        self.opened = True
+
+    def isOpened(self) -> bool:  # pylint: disable=invalid-name
+        return self.opened
+
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        if not self.opened:
+            return False, None
+        self.pacer.wait()
+
+        if self.cap is None:
+            if self.index >= len(self.images):
+                if not self.loop:
+                    self.opened = False
+                    return False, None
+                self.index = 0
+            frame = self.images[self.index].copy()
+            self.index += 1
+            return True, frame
+
+        ret, frame = self.cap.read()
+        if not ret and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.cap.read()
+        if not ret:
+            self.opened = False
+        return ret, frame
+
+    def release(self) -> None:
+        self.opened = False
+        if self.cap is not None:
+            self.cap.release()
+
+
+class SyntheticSource(FrameSource):
+    def __init__(self, width: int = 1920, height: int = 1080, fps: int = 30, pattern: str = "gradient") -> None:
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.pattern = pattern
+        self.seq = 0
+        self.pacer = _Pacer(fps)
+        self.opened = True
+
+        if pattern == "gradient":
+            x = np.linspace(0, 255, width, dtype=np.float32)
+            y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+            self.base = np.dstack(
+                [np.broadcast_to(x, (height, width)), np.broadcast_to(y, (height, width)), (x + y) / 2]
+            ).astype(np.uint8)
+        elif pattern == "noise":
+            rng = np.random.default_rng(0)
+            self.base = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+        else:
+            raise ValueError(f"Unknown synthetic pattern {pattern!r}")
+
+    def isOpened(self) -> bool:  # pylint: disable=invalid-name
+        return self.opened
+
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        if not self.opened:
+            return False, None
+        self.pacer.wait()
+
+        # Shift the pattern and move a block across it so consecutive frames differ like a real scene
+        frame = np.roll(self.base, self.seq * 4, axis=1)
+        size = max(self.height // 8, 1)
+        x = (self.seq * 8) % max(self.width - size, 1)
+        y = (self.seq * 4) % max(self.height - size, 1)
+        frame[y : y + size, x : x + size] = 255
+        self.seq += 1
+        return True, frame
+
+    def release(self) -> None:
+        self.opened = False
+
+
+class SharedMemorySource(FrameSource):
+    """
+    Frames published by a capture process (python -m lib.capture) into a shared memory ring, so several HTTP
+    workers serve one camera without opening the device. Encoded rings hand out the capture process's JPEGs as
+    they are: workers serve the top rendition without encoding anything.
+    """
+
+    def __init__(self, name: str, timeout: float = 10.0) -> None:
+        self.name = name
+        self.reader: Optional[SharedFrameReader] = SharedFrameReader(name)
+        self.fps = self.reader.fps
+        self._payload: Union[bytes, np.ndarray, None] = None
+        # The first frame tells the resolution, and whether the ring carries JPEGs or pixels
+        deadline = time.monotonic() + timeout
+        while not self.grab():
+            if time.monotonic() >= deadline:
+                self.release()
+                raise OSError(f"No frames in shared memory {name} after {timeout} s, is the capture process running?")
+        self.compressed = isinstance(self._payload, bytes)
+        _, image = self.retrieve()
+        self.height, self.width = image.shape[:2]  # type: ignore
+
+    def isOpened(self) -> bool:  # pylint: disable=invalid-name
+        return self.reader is not None
+
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        return self.retrieve() if self.grab() else (False, None)
+
+    def read_jpeg(self) -> Tuple[bool, Optional[bytes]]:
+        return self.retrieve_jpeg() if self.grab() else (False, None)
+
+    def grab(self) -> bool:
+        result = self.reader.read(timeout=1.0) if self.reader is not None else None
+        if result is None:
+            return False
+        seq, timestamp, data = result
+        # Copy out of the slot, then make sure the capture process didn't reuse it meanwhile
+        payload = data.tobytes() if data.ndim == 1 else data.copy()
+        if not self.reader.is_current(seq):  # type: ignore
+            return False
+        self._payload, self.timestamp = payload, timestamp
+        return True
+
+    def retrieve(self) -> Tuple[bool, Optional[np.ndarray]]:
+        payload, self._payload = self._payload, None
+        if payload is None:
+            return False, None
+        if isinstance(payload, bytes):
+            return True, cv2.imdecode(np.frombuffer(payload, dtype=np.uint8), cv2.IMREAD_COLOR)
+        return True, payload
+
+    def retrieve_jpeg(self) -> Tuple[bool, Optional[bytes]]:
+        payload, self._payload = self._payload, None
+        return (True, payload) if isinstance(payload, bytes) else (False, None)
+
+    def reopen(self) -> bool:
+        # A restarted capture process creates a fresh segment under the same name
+        self.release()
+        try:
+            self.reader = SharedFrameReader(self.name)
+        except FileNotFoundError:
+            pass
+        return True
+
+    def release(self) -> None:
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+
+
+class RelaySource(FrameSource):
+    """
+    Another server's JPEG stream re-served locally: an edge node keeps one upstream connection per camera and
+    fans it out to its own clients. Pin the upstream rendition, e.g.
+    relay:http://origin:8000/cams/default/frames?rendition=1080p, so the relayed resolution doesn't adapt.
+    """
+
+    compressed = True
+
+    def __init__(self, url: str, timeout: float = 1.0) -> None:
+        self.url = url
+        # How long grab() waits for the next frame: the capture loop checks for stop() in between
+        self.timeout = timeout
+        # Fail fast when the upstream is unreachable, reconnect with backoff once it has been seen
+        self.receiver = ClientReceiver(url, reconnect=False)
+        self._frames = self.receiver.jpeg_frames()
+        item = next(self._frames, None)
+        if item is None:
+            raise OSError(f"No frames from {url}")
+        self.receiver.reconnect = True
+        self.fps = self.receiver.metadata["fps"]
+        self.timestamp, self._jpeg = item[1], bytes(item[2])
+        image = cv2.imdecode(np.frombuffer(self._jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+        self.height, self.width = image.shape[:2]
+        # The upstream is read on its own thread, so a stalled or reconnecting upstream never blocks grab()
+        self._latest: Optional[Tuple[float, bytes]] = None
+        self._error: Optional[Exception] = None
+        self._cond = threading.Condition()
+        self.opened = True
+        self._thread = self._start_receiving()
+
+    def isOpened(self) -> bool:  # pylint: disable=invalid-name
+        return self.opened
+
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        return self.retrieve() if self.grab() else (False, None)
+
+    def read_jpeg(self) -> Tuple[bool, Optional[bytes]]:
+        return self.retrieve_jpeg() if self.grab() else (False, None)
+
+    def grab(self) -> bool:
+        with self._cond:
+            self._cond.wait_for(lambda: self._latest is not None or self._error is not None, self.timeout)
+            error, self._error = self._error, None
+            latest, self._latest = self._latest, None
+        if error is not None:
+            raise error
+        if latest is None:
+            return False
+        self.timestamp, self._jpeg = latest
+        return True
+
+    def retrieve(self) -> Tuple[bool, Optional[np.ndarray]]:
+        ret, jpeg = self.retrieve_jpeg()
+        if not ret:
+            return False, None
+        return True, cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)  # type: ignore
+
+    def retrieve_jpeg(self) -> Tuple[bool, Optional[bytes]]:
+        jpeg, self._jpeg = self._jpeg, None
+        return (True, jpeg) if jpeg is not None else (False, None)
+
+    def reopen(self) -> bool:
+        if not self.opened:
+            return False
+        if not self._thread.is_alive():
+            self._frames = self.receiver.jpeg_frames()
+            self._thread = self._start_receiving()
+        return True
+
+    def release(self) -> None:
+        self.opened = False
+        # Ends the reconnect backoff and the current connection, the receiving thread then exits
+        self.receiver.close()
+        with self._cond:
+            self._cond.notify_all()
+
+    def _start_receiving(self) -> threading.Thread:
+        thread = threading.Thread(target=self._receive, args=(self._frames,), daemon=True)
+        thread.start()
+        return thread
+
+    def _receive(self, frames: Generator[Tuple[int, float, memoryview], None, None]) -> None:
+        try:
+            for _, timestamp, jpeg in frames:
+                if not self.opened:
+                    break
+                # The parser reuses its buffer for the next frame
+                with self._cond:
+                    self._latest = (timestamp, bytes(jpeg))
+                    self._cond.notify_all()
+        except Exception as error:  # pylint: disable=broad-except
+            if self.opened:
+                with self._cond:
+                    self._error = error
+                    self._cond.notify_all()
+        finally:
+            frames.close()
+
+
+def create_source(spec: Union[int, str], low_latency: bool = False) -> FrameSource:
+    """
+    Build a source from "1", "device:1", "mjpeg:1", "file:<path>[@fps]", "synthetic[:WxH[@fps][:pattern]]",
+    "shm:<name>" or "relay:<url>".
+    "mjpeg:N" forwards the camera's own MJPEG frames to viewers without a decode/re-encode round trip,
+    "shm:<name>" serves a capture process's ring and "relay:<url>" another server's JPEG stream.
+    low_latency applies to devices: a one frame driver queue, stale frames drained before each retrieve.
+    """
+    if isinstance(spec, int) or spec.isdigit():
+        return DeviceSource(int(spec), low_latency=low_latency)
+
+    kind, _, args = spec.partition(":")
+    if kind == "device":
+        return DeviceSource(int(args or 0), low_latency=low_latency)
+    if kind == "mjpeg":
+        return DeviceSource(int(args or 0), passthrough=True, low_latency=low_latency)
+    if kind == "file":
+        # Only a numeric suffix is a frame rate, "@" may also be part of the path
+        path, _, fps = args.rpartition("@")
+        if not fps.isdigit():
+            path, fps = args, ""
+        return FileSource(path, fps=int(fps) if fps else None)
+    if kind == "shm":
+        return SharedMemorySource(args)
+    if kind == "relay":
+        return RelaySource(args)
+    if kind == "synthetic":
+        resolution, _, pattern = args.partition(":")
+        resolution, _, fps = resolution.partition("@")
+        width, _, height = resolution.partition("x")
+        return SyntheticSource(
+            width=int(width or 1920), height=int(height or 1080), fps=int(fps or 30), pattern=pattern or "gradient"
+        )
+    raise ValueError(f"Unknown frame source {spec!r}")
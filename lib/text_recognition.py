@@ -1,10 +1,290 @@
-import cv2
-import pytesseract
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import lru_cache
+from typing import TYPE_CHECKING, Deque, Dict, List, Optional, Sequence, Tuple
+import importlib.util
+import multiprocessing
+import os
 import threading
-import time
+
+import numpy as np
+
+from .lazy import lazy_import
+from .vision_buffers import BufferPool
+
+if TYPE_CHECKING:
+    import cv2
+    import pytesseract
+else:
+    cv2 = lazy_import("cv2")
+    pytesseract = lazy_import("pytesseract")
+
+TESSERACT_CONFIG = "--oem 3 --psm 6"
+# Fixed text regions "x,y,w,h;x,y,w,h" in frame pixels, used instead of detecting them on every frame
+TEXT_ROIS = os.getenv("TEXT_ROIS", "")
+
+# x0, y0, x1, y1 with a top-left origin
+Box = Tuple[int, int, int, int]
+# text, confidence, box
+Word = Tuple[str, float, Box]
+
+# Characters are joined into lines horizontally, lines are kept apart vertically
+GRADIENT_KERNEL_SIZE = (3, 3)
+LINE_KERNEL_SIZE = (15, 3)
+# White gap between stacked regions, so tesseract never reads two regions as one line
+STACK_GAP = 16
+
+_buffers = BufferPool()
+
+
+@lru_cache(maxsize=1)
+def _kernels() -> Tuple[np.ndarray, np.ndarray]:
+    # Built on first use: importing the module doesn't load cv2
+    gradient = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, GRADIENT_KERNEL_SIZE)
+    return gradient, cv2.getStructuringElement(cv2.MORPH_RECT, LINE_KERNEL_SIZE)
+
+
+def perceptual_hash(gray: np.ndarray) -> int:
+    # dHash: brightness gradients of a 9x8 thumbnail, stable under sensor noise and compression, not under new text
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    return int.from_bytes(np.packbits(small[:, 1:] > small[:, :-1]).tobytes(), "big")
+
+
+def hash_distance(first: int, second: int) -> int:
+    return bin(first ^ second).count("1")
+
+
+def region_thumbnail(gray: np.ndarray, box: Box, height: int = 8, max_width: int = 64) -> np.ndarray:
+    # About two columns per character height, enough for a changed digit to move whole cells
+    x0, y0, x1, y1 = box
+    width = min(max(height * (x1 - x0) // max(y1 - y0, 1), height), max_width)
+    return cv2.resize(gray[y0:y1, x0:x1], (width, height), interpolation=cv2.INTER_AREA)
+
+
+def parse_rois(spec: str) -> List[Box]:
+    rois = []
+    for item in filter(None, spec.split(";")):
+        x, y, w, h = (int(value) for value in item.split(","))
+        rois.append((x, y, x + w, y + h))
+    return rois
+
+
+def find_text_regions(gray: np.ndarray, max_regions: int = 16, min_height: int = 8) -> List[Box]:
+    # Text is dense in strong gradients: binarise the gradient, join characters into lines, keep line-shaped blobs
+    shape = gray.shape[:2]
+    gradient_kernel, line_kernel = _kernels()
+    gradient = cv2.morphologyEx(gray, cv2.MORPH_GRADIENT, gradient_kernel, dst=_buffers.get("gradient", shape))
+    binary = cv2.threshold(gradient, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU, dst=_buffers.get("binary", shape))[1]
+    lines = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, line_kernel, dst=_buffers.get("lines", shape))
+    contours, _ = cv2.findContours(lines, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    height, width = shape
+    regions = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        # Too small to hold a character, taller than wide, or mostly empty (outlines of objects, not text)
+        if h < min_height or w < h or h > height // 3 or cv2.countNonZero(lines[y : y + h, x : x + w]) < 0.5 * w * h:
+            continue
+        pad = max(h // 4, 2)
+        regions.append((max(x - pad, 0), max(y - pad, 0), min(x + w + pad, width), min(y + h + pad, height)))
+    regions.sort(key=lambda box: (box[2] - box[0]) * (box[3] - box[1]), reverse=True)
+    # Reading order for the kept regions: top to bottom, then left to right
+    return sorted(regions[:max_regions], key=lambda box: (box[1], box[0]))
+
+
+def stack_regions(gray: np.ndarray, regions: Sequence[Box]) -> Tuple[np.ndarray, List[int]]:
+    # All regions one under the other on a white canvas: a single OCR call per frame reads every region
+    width = max(x1 - x0 for x0, _, x1, _ in regions)
+    height = sum(y1 - y0 for _, y0, _, y1 in regions) + STACK_GAP * (len(regions) + 1)
+    canvas = np.full((height, width + 2 * STACK_GAP), 255, dtype=np.uint8)
+    offsets = []
+    top = STACK_GAP
+    for x0, y0, x1, y1 in regions:
+        canvas[top : top + y1 - y0, STACK_GAP : STACK_GAP + x1 - x0] = gray[y0:y1, x0:x1]
+        offsets.append(top)
+        top += y1 - y0 + STACK_GAP
+    return canvas, offsets
+
+
+class PytesseractEngine:
+    # One tesseract process per call: text, confidences and word boxes all come from a single image_to_data run
+    name = "pytesseract"
+
+    def __init__(self, config: str = TESSERACT_CONFIG) -> None:
+        self.config = config
+
+    def read(self, image: np.ndarray) -> List[Word]:
+        data = pytesseract.image_to_data(image, config=self.config, output_type=pytesseract.Output.DICT)
+        words = []
+        for text, conf, left, top, width, height in zip(
+            data["text"], data["conf"], data["left"], data["top"], data["width"], data["height"]
+        ):
+            # Page, block, paragraph and line rows carry no text and a confidence of -1
+            if not text.strip() or float(conf) < 0:
+                continue
+            words.append((text.strip(), float(conf), (left, top, left + width, top + height)))
+        return words
+
+
+class TesserocrEngine:
+    # Tesseract linked into the process and initialised once: no process spawn and no model load per call
+    name = "tesserocr"
+
+    def __init__(self, lang: str = "eng") -> None:
+        import tesserocr  # pylint: disable=import-outside-toplevel
+
+        self._tesserocr = tesserocr
+        self._api = tesserocr.PyTessBaseAPI(lang=lang, psm=tesserocr.PSM.SINGLE_BLOCK, oem=tesserocr.OEM.DEFAULT)
+
+    def read(self, image: np.ndarray) -> List[Word]:
+        image = np.ascontiguousarray(image)
+        height, width = image.shape[:2]
+        self._api.SetImageBytes(image.tobytes(), width, height, 1, width)
+        self._api.Recognize()
+        iterator = self._api.GetIterator()
+        if iterator is None:
+            return []
+        level = self._tesserocr.RIL.WORD
+        words = []
+        for word in self._tesserocr.iterate_level(iterator, level):
+            text, box = word.GetUTF8Text(level), word.BoundingBox(level)
+            if text and text.strip() and box:
+                words.append((text.strip(), float(word.Confidence(level)), tuple(box)))
+        return words
+
+
+def create_engine():
+    # tesserocr keeps one tesseract instance alive per process; pytesseract is the fallback that needs no build
+    if importlib.util.find_spec("tesserocr") is not None:
+        return TesserocrEngine()
+    return PytesseractEngine()
+
+
+class TextRecognizer:
+    """
+    OCR stage for a stream of frames. A frame is skipped and reuses the last result while its perceptual hash stays
+    within hash_threshold bits of the reference frame (the last one OCRed, or handed to an OCR worker) and no text
+    region's thumbnail moved by more than
+    pixel_threshold grey levels; the hash catches the camera or scene moving, the thumbnails catch a digit changing,
+    which a whole-frame hash is too coarse to see. A full pass is still forced every refresh_every frames. Changed
+    frames are OCRed in one call over the text regions only, either the fixed rois or those find_text_regions finds.
+    """
+
+    def __init__(
+        self,
+        engine=None,
+        rois: Sequence[Box] = (),
+        hash_threshold: int = 4,
+        pixel_threshold: int = 24,
+        refresh_every: int = 30,
+        min_confidence: float = 30.0,
+    ) -> None:
+        self.engine = engine
+        self.rois = list(rois)
+        self.hash_threshold = hash_threshold
+        self.pixel_threshold = pixel_threshold
+        self.refresh_every = refresh_every
+        self.min_confidence = min_confidence
+        self.last_shape: Optional[Tuple[int, ...]] = None
+        self.last_hash = 0
+        self.last_regions: List[Box] = []
+        self.last_thumbnails: List[np.ndarray] = []
+        self.last_result: Optional[Dict] = None
+        self.frames_since_ocr = 0
+        self.ocr_runs = 0
+        self.skipped_frames = 0
+
+    def unchanged(self, gray: np.ndarray, frame_hash: int) -> bool:
+        # True when the frame shows the same text as the reference frame; counts it as skipped
+        if (
+            self.last_shape != gray.shape
+            or self.frames_since_ocr >= self.refresh_every
+            or hash_distance(frame_hash, self.last_hash) > self.hash_threshold
+        ):
+            return False
+        for box, thumbnail in zip(self.last_regions, self.last_thumbnails):
+            if cv2.absdiff(region_thumbnail(gray, box), thumbnail).max() > self.pixel_threshold:
+                return False
+        self.frames_since_ocr += 1
+        self.skipped_frames += 1
+        return True
+
+    def mark(self, gray: np.ndarray, frame_hash: int, regions: Optional[Sequence[Box]] = None) -> None:
+        # Make the frame the reference, over the given text regions or those of the previous reference
+        self.last_shape = gray.shape
+        self.last_hash = frame_hash
+        if regions is not None:
+            self.last_regions = list(regions)
+        self.last_thumbnails = [region_thumbnail(gray, box) for box in self.last_regions]
+        self.frames_since_ocr = 0
+
+    def recognize(self, image: np.ndarray) -> Dict:
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=_buffers.get("gray", image.shape[:2]))
+        frame_hash = perceptual_hash(gray)
+        if self.last_result is not None and self.unchanged(gray, frame_hash):
+            return {**self.last_result, "cached": True}
+        result = self.last_result = self.read_text(gray)
+        self.mark(gray, frame_hash, result["regions"])
+        return {**result, "cached": False}
+
+    def regions(self, gray: np.ndarray) -> List[Box]:
+        if not self.rois:
+            return find_text_regions(gray)
+        height, width = gray.shape[:2]
+        clipped = [(max(x0, 0), max(y0, 0), min(x1, width), min(y1, height)) for x0, y0, x1, y1 in self.rois]
+        return [box for box in clipped if box[2] > box[0] and box[3] > box[1]]
+
+    def read_text(self, gray: np.ndarray) -> Dict:
+        regions = self.regions(gray)
+        if not regions:
+            return {"text": "", "boxes": [], "regions": []}
+        if self.engine is None:
+            self.engine = create_engine()
+        canvas, offsets = stack_regions(gray, regions)
+        self.ocr_runs += 1
+
+        # Map every word from the canvas back into frame coordinates through the strip it was read from
+        lines: List[List[str]] = [[] for _ in regions]
+        boxes = []
+        for text, conf, (x0, y0, x1, y1) in self.engine.read(canvas):
+            if conf < self.min_confidence:
+                continue
+            index = max(bisect_right(offsets, (y0 + y1) // 2) - 1, 0)
+            left, top = regions[index][0] - STACK_GAP, regions[index][1] - offsets[index]
+            lines[index].append(text)
+            boxes.append((x0 + left, y0 + top, x1 + left, y1 + top))
+        text = "\n".join(" ".join(words) for words in lines if words)
+        return {"text": text, "boxes": boxes, "regions": regions}
+
+
+_recognizer: Optional[TextRecognizer] = None
+
+
+def _get_recognizer() -> TextRecognizer:
+    # One per process: recognition workers are long-lived, so the tesseract instance and the last hash persist
+    global _recognizer  # pylint: disable=global-statement
+    if _recognizer is None:
+        _recognizer = TextRecognizer(rois=parse_rois(TEXT_ROIS))
+    return _recognizer
+
+
+def analyze(image):
+    # Pure function for the recognition pipeline: no drawing, no windows
+    return _get_recognizer().recognize(image)
+
+
+def read_text(gray):
+    # Runs inside an OCR worker process
+    return _get_recognizer().read_text(gray)
+
+
+def _init_worker(tesseract_cmd_path):
+    pytesseract.pytesseract.tesseract_cmd = tesseract_cmd_path
+
 
 class RealTimeTextRecognition:
-    def __init__(self, tesseract_cmd_path):
+    def __init__(self, tesseract_cmd_path, workers=2):
         # Provide the path to the Tesseract executable
         pytesseract.pytesseract.tesseract_cmd = tesseract_cmd_path
         # Initializing video capture from a webcam
@@ -14,11 +294,23 @@ class RealTimeTextRecognition:
 
         self.running = True
         self.prev_text = None
+        self.boxes = []
+        # Persistent OCR workers, each with its own tesseract instance; capture and display never wait for OCR
+        self.workers = workers
+        self.pool = ProcessPoolExecutor(
+            workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(tesseract_cmd_path,),
+        )
+        self.recognizer = TextRecognizer()
+        self.pending: Deque[Tuple[Future, np.ndarray, int]] = deque()
 
     def __del__(self):
         # Freeing up webcam resource
         if self.cap.isOpened():
             self.cap.release()
+        self.pool.shutdown(wait=False, cancel_futures=True)
         cv2.destroyAllWindows()
 
     def capture_and_process_image(self):
@@ -31,26 +323,24 @@ class RealTimeTextRecognition:
             # Converting an Image to Grayscale
             gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
 
-            # Using Tesseract for OCR
-            text = pytesseract.image_to_string(gray, config='--oem 3 --psm 6')
-            boxes = pytesseract.image_to_boxes(gray, config='--oem 3 --psm 6')
+            # OCR only frames that changed since the last submitted one, and only while a worker is free
+            frame_hash = perceptual_hash(gray)
+            if len(self.pending) < self.workers and not self.recognizer.unchanged(gray, frame_hash):
+                self.recognizer.mark(gray, frame_hash)
+                self.pending.append((self.pool.submit(read_text, gray), gray, frame_hash))
+
+            # Results are applied in submission order as they complete
+            while self.pending and self.pending[0][0].done():
+                future, ocr_gray, ocr_hash = self.pending.popleft()
+                result = future.result()
+                if not self.pending:
+                    # The newest submitted frame stays the reference, now over the text regions OCR found in it
+                    self.recognizer.mark(ocr_gray, ocr_hash, result["regions"])
+                self.show_result(result)
 
             # Drawing rectangles around text
-            h, w = gray.shape
-            for b in boxes.splitlines():
-                b = b.split(' ')
-                x, y, x2, y2 = int(b[1]), int(b[2]), int(b[3]), int(b[4])
-                # Converting coordinates for display on an image
-                cv2.rectangle(frame, (x, h - y), (x2, h - y2), (0, 255, 0), 2)
-
-            # Checking if the current text matches the previous one
-            if text.strip() == self.prev_text:
-                continue
-            # Saving the current text for the next iteration
-            self.prev_text = text.strip()
-            
-            # Output of recognized text
-            print(f"Recognized text: {text.strip()}")
+            for x0, y0, x1, y1 in self.boxes:
+                cv2.rectangle(frame, (x0, y0), (x1, y1), (0, 255, 0), 2)
 
             # Image display
             cv2.imshow('Camera', frame)
@@ -59,9 +349,17 @@ class RealTimeTextRecognition:
             if cv2.waitKey(1) & 0xFF == ord('q'):
                 self.running = False
                 break
-            
-            # Adding delay
-            time.sleep(0.5)
+
+    def show_result(self, result):
+        self.boxes = result["boxes"]
+        # Checking if the current text matches the previous one
+        if result["text"] == self.prev_text:
+            return
+        # Saving the current text for the next iteration
+        self.prev_text = result["text"]
+
+        # Output of recognized text
+        print(f"Recognized text: {result['text']}")
 
     def start(self):
         # Starting a thread to process images
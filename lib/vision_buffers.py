@@ -0,0 +1,50 @@
+from collections import OrderedDict
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, Sequence, Tuple
+import numpy as np
+
+from .lazy import lazy_import
+
+if TYPE_CHECKING:
+    import cv2
+else:
+    cv2 = lazy_import("cv2")
+
+CLOSE_KERNEL = np.ones((3, 3), np.uint8)
+
+
+class BufferPool:
+    # Scratch images reused across frames, one per (name, shape, dtype); contents are only valid until the next call
+    def __init__(self, shapes_per_name: int = 4) -> None:
+        self.shapes_per_name = shapes_per_name
+        # Least recently used first
+        self._buffers: "OrderedDict[Tuple[str, Tuple[int, ...], str], np.ndarray]" = OrderedDict()
+
+    def get(self, name: str, shape: Sequence[int], dtype: type = np.uint8) -> np.ndarray:
+        key = (name, tuple(shape), np.dtype(dtype).str)
+        buffer = self._buffers.get(key)
+        if buffer is not None:
+            self._buffers.move_to_end(key)
+            return buffer
+        # A few shapes are kept per name, so alternating full-frame and ROI searches reuse their buffers, while the
+        # least recently used ones are dropped so a resolution change doesn't leak memory
+        same_name = [item for item in self._buffers if item[0] == name]
+        for stale in same_name[: max(len(same_name) - self.shapes_per_name + 1, 0)]:
+            del self._buffers[stale]
+        buffer = self._buffers[key] = np.empty(shape, dtype=dtype)
+        return buffer
+
+
+@lru_cache(maxsize=64)
+def circle_mask(r: int, shape: Tuple[int, int], center: Tuple[int, int]) -> np.ndarray:
+    mask = np.zeros(shape, dtype=np.uint8)
+    cv2.circle(mask, center, r, 255, -1)
+    mask.setflags(write=False)
+    return mask
+
+
+def circle_roi(circle: Sequence[int], shape: Sequence[int], margin: int = 3) -> Tuple[int, int, int, int]:
+    x, y, r = circle[:3]
+    height, width = shape[:2]
+    pad = r + margin
+    return max(x - pad, 0), max(y - pad, 0), min(x + pad + 1, width), min(y + pad + 1, height)
@@ -1,10 +1,64 @@
-from fastapi import FastAPI
+from dataclasses import asdict
+from functools import partial
+from typing import AsyncGenerator, Optional
+import os
+
+from fastapi import FastAPI, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 
-from lib import camera
+from lib import camera, capture, clips, encoders, recognition, registry
+from lib.framing import FLAG_MIRROR, FRAMES_MEDIA_TYPE
+from lib.metrics import REGISTRY
 
 MEDIA_TYPE: str = "multipart/x-mixed-replace; boundary=frame"
+RAW_MEDIA_TYPE: str = "application/octet-stream"
+# e.g. "synthetic:1280x720@30" or "file:./samples@25" to run without a webcam,
+# "mjpeg:1" forwards the camera's own JPEG frames
+CAMERA_SOURCE: str = os.getenv("CAMERA_SOURCE", "1")
+# Several cameras per box: "front=1,back=2,test=synthetic:640x480@15", the first one is served on /
+CAMERAS: str = os.getenv("CAMERAS", f"default={CAMERA_SOURCE}")
+# Serve the cameras from the shared memory rings of a capture process (python -m lib.capture) started with the same
+# prefix instead of opening them: this is what lets uvicorn run with --workers N
+CAPTURE_SHM_PREFIX: str = os.getenv("CAPTURE_SHM_PREFIX", "")
+# Seconds without subscribers after which a camera is released
+CAMERA_IDLE_TIMEOUT: float = float(os.getenv("CAMERA_IDLE_TIMEOUT", "30"))
+# Name of the shared memory ring local consumers attach to, e.g. ClientReceiver(shm_name="webcam")
+CAMERA_SHM: str = os.getenv("CAMERA_SHM", "")
+# Keep the device queue at one frame and drain stale ones, so streams show the newest frame instead of a backlog
+CAMERA_LOW_LATENCY: bool = os.getenv("CAMERA_LOW_LATENCY", "") == "1"
+# Comma separated camera ids opened by the startup hook instead of on their first request, e.g. "default,front"
+CAMERA_PRELOAD: str = os.getenv("CAMERA_PRELOAD", "")
+# Seconds without a frame after which a device is reopened
+CAMERA_STALL_TIMEOUT: float = float(os.getenv("CAMERA_STALL_TIMEOUT", "2"))
+# Comma separated recognition tasks run on the shared camera feed, e.g. "gauge,barometer"
+RECOGNITION_TASKS: str = os.getenv("RECOGNITION_TASKS", "")
+RECOGNITION_WORKERS: int = int(os.getenv("RECOGNITION_WORKERS", "2"))
+# JPEG backend: "opencv", "turbojpeg" or "pillow" (PIL-SIMD), compare them with `python -m benchmarks.pipeline`
+JPEG_ENCODER: str = os.getenv("JPEG_ENCODER", "opencv")
+JPEG_QUALITY: int = int(os.getenv("JPEG_QUALITY", "80"))
+# Chroma subsampling "444", "422" or "420"
+JPEG_SUBSAMPLING: str = os.getenv("JPEG_SUBSAMPLING", "420")
+# Restart markers every N MCU blocks (0 disables) let a decoder resync after a corrupted chunk
+JPEG_RESTART_INTERVAL: int = int(os.getenv("JPEG_RESTART_INTERVAL", "0"))
+# Faster, slightly less accurate DCT, turbojpeg encoder only
+JPEG_FAST_DCT: bool = os.getenv("JPEG_FAST_DCT", "") == "1"
+ENCODE_WORKERS: int = int(os.getenv("ENCODE_WORKERS", "2"))
+# Selfie-view mirroring of the JPEG streams: "encode" on the server, "client" via a Mirror header, or "none";
+# "auto" leaves JPEG passthrough sources (mjpeg:N, CAPTURE_SHM_PREFIX workers, relays) to the client
+STREAM_MIRROR: str = os.getenv("STREAM_MIRROR", "auto")
+# Continuous recording of the default camera into RECORD_PATH_<timestamp>.mp4 segments, e.g. "./recordings/cam"
+RECORD_PATH: str = os.getenv("RECORD_PATH", "")
+RECORD_SEGMENT_SECONDS: int = int(os.getenv("RECORD_SEGMENT_SECONDS", "300"))
+# Number of segments kept on disk, older ones are deleted
+RECORD_RETENTION: int = int(os.getenv("RECORD_RETENTION", "288"))
+# "libx264", or "copy" to store an MJPEG camera's frames without encoding
+RECORD_CODEC: str = os.getenv("RECORD_CODEC", "libx264")
+# Motion/recognition triggered clips of the default camera into CLIP_PATH_<timestamp>_<reason>.mkv
+CLIP_PATH: str = os.getenv("CLIP_PATH", "")
+CLIP_PRE_SECONDS: float = float(os.getenv("CLIP_PRE_SECONDS", "5"))
+CLIP_POST_SECONDS: float = float(os.getenv("CLIP_POST_SECONDS", "10"))
 
 app = FastAPI()
 app.add_middleware(
@@ -15,8 +69,251 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Importing main opens nothing and loads neither cv2 nor ffmpeg: cameras (and the encoder they share) are created
+# on their first request or by CAMERA_PRELOAD
+camera_sources = registry.parse_cameras(CAMERAS)
+if CAPTURE_SHM_PREFIX:
+    camera_sources = capture.worker_sources(camera_sources, CAPTURE_SHM_PREFIX)
+cameras = registry.CameraRegistry(
+    camera_sources,
+    idle_timeout=CAMERA_IDLE_TIMEOUT,
+    encoder_factory=partial(
+        encoders.create_encoder,
+        JPEG_ENCODER,
+        quality=JPEG_QUALITY,
+        subsampling=JPEG_SUBSAMPLING,
+        restart_interval=JPEG_RESTART_INTERVAL,
+        fast_dct=JPEG_FAST_DCT,
+    ),
+    camera_options={
+        "encode_workers": ENCODE_WORKERS,
+        "mirror": STREAM_MIRROR,
+        "low_latency": CAMERA_LOW_LATENCY,
+        "stall_timeout": CAMERA_STALL_TIMEOUT,
+    },
+)
+recognizer: Optional[recognition.RecognitionPipeline] = None
+clip_recorder: Optional[clips.ClipRecorder] = None
+
+
+def get_camera(cam_id: Optional[str] = None) -> camera.WebCameraStream:
+    try:
+        return cameras.get(cam_id)
+    except KeyError as exc:
+        raise HTTPException(status_code=404, detail=f"Unknown camera {cam_id}") from exc
+    except OSError as exc:
+        # A bare device index that doesn't open names no camera, a configured source is only unavailable for now
+        configured = cam_id is None or cam_id in cameras.sources
+        raise HTTPException(status_code=503 if configured else 404, detail=str(exc)) from exc
+
+
+@app.on_event("startup")
+def open_cameras():
+    # Unknown ids or a bad encoder configuration fail the startup here rather than the first viewer
+    for cam_id in filter(None, CAMERA_PRELOAD.split(",")):
+        cameras.get(cam_id)
+
+
+@app.on_event("startup")
+def share_frames():
+    global recognizer, clip_recorder  # pylint: disable=global-statement
+    if CAMERA_SHM:
+        get_camera().share_memory(CAMERA_SHM)
+    if RECORD_PATH:
+        get_camera().record(
+            RECORD_PATH, segment_seconds=RECORD_SEGMENT_SECONDS, retention=RECORD_RETENTION, codec=RECORD_CODEC
+        )
+    if RECOGNITION_TASKS:
+        recognizer = recognition.RecognitionPipeline(
+            get_camera(), tasks=RECOGNITION_TASKS.split(","), workers=RECOGNITION_WORKERS
+        )
+        recognizer.start()
+    if CLIP_PATH:
+        clip_recorder = clips.ClipRecorder(
+            get_camera(), CLIP_PATH, pre_seconds=CLIP_PRE_SECONDS, post_seconds=CLIP_POST_SECONDS
+        )
+        if recognizer is not None:
+            recognizer.add_listener(clip_recorder.on_recognition)
+        clip_recorder.start()
+
+
+@app.on_event("shutdown")
+def release_camera():
+    if recognizer is not None:
+        recognizer.stop()
+    if clip_recorder is not None:
+        clip_recorder.stop()
+    cameras.close_all()
+
+
+async def stream_response(
+    request: Request,
+    cam_id: Optional[str],
+    rendition: Optional[str],
+    quality: Optional[int],
+    height: Optional[int],
+    mirror: Optional[bool],
+) -> Response:
+    stream = await run_in_threadpool(get_camera, cam_id)
+    flip, client_flip = stream.resolve_mirror(mirror)
+    if request.method == "HEAD":
+        # Headers only: don't subscribe or start the capture just to describe the stream
+        return Response(headers=stream.get_metadata(mirror=client_flip), media_type=MEDIA_TYPE)
+    try:
+        chunks = stream.stream_img_bytes_async(rendition=rendition, quality=quality, height=height, mirror=flip)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return StreamingResponse(chunks, headers=stream.get_metadata(mirror=client_flip), media_type=MEDIA_TYPE)
+
 
 @app.api_route("/", methods=["GET", "HEAD"])
-def stream_webcam():
-    stream = camera.WebCameraStream(cam_id=1)
-    return StreamingResponse(stream.stream_img_bytes(), headers=stream.get_metadata(), media_type=MEDIA_TYPE)
+async def stream_webcam(
+    request: Request,
+    rendition: Optional[str] = None,
+    quality: Optional[int] = Query(None, ge=1, le=100),
+    height: Optional[int] = Query(None, ge=16),
+    mirror: Optional[bool] = None,
+):
+    # Without parameters the client gets an adaptive rendition, e.g. /?rendition=720p or /?quality=50&height=480 pin one
+    return await stream_response(request, None, rendition, quality, height, mirror)
+
+
+@app.get("/cams")
+def list_cameras():
+    return {"cameras": cameras.ids(), "opened": cameras.opened()}
+
+
+@app.api_route("/cams/{cam_id}/stream", methods=["GET", "HEAD"])
+async def stream_camera(
+    request: Request,
+    cam_id: str,
+    rendition: Optional[str] = None,
+    quality: Optional[int] = Query(None, ge=1, le=100),
+    height: Optional[int] = Query(None, ge=16),
+    mirror: Optional[bool] = None,
+):
+    return await stream_response(request, cam_id, rendition, quality, height, mirror)
+
+
+@app.api_route("/cams/{cam_id}/raw", methods=["GET", "HEAD"])
+def stream_camera_raw(request: Request, cam_id: str):
+    # Raw frames are the capture buffers as they are, the client mirrors them if the camera asks for it
+    stream = get_camera(cam_id)
+    headers = stream.get_metadata(mirror=stream.mirror != "none")
+    if request.method == "HEAD":
+        return Response(headers=headers, media_type=RAW_MEDIA_TYPE)
+    return StreamingResponse(stream.stream_frame_bytes(), headers=headers, media_type=RAW_MEDIA_TYPE)
+
+
+def open_frames(
+    stream: camera.WebCameraStream,
+    payload: str,
+    rendition: Optional[str],
+    quality: Optional[int],
+    height: Optional[int],
+    mirror: Optional[bool],
+) -> AsyncGenerator[bytes, None]:
+    flip, client_flip = stream.resolve_mirror(mirror)
+    if payload == "raw":
+        # Raw frames are never flipped on the server
+        flip, client_flip = False, stream.mirror != "none"
+    return stream.stream_img_bytes_async(
+        rendition=rendition,
+        quality=quality,
+        height=height,
+        mirror=flip,
+        framing=payload,
+        flags=FLAG_MIRROR if client_flip else 0,
+    )
+
+
+@app.api_route("/cams/{cam_id}/frames", methods=["GET", "HEAD"])
+async def stream_camera_frames(
+    request: Request,
+    cam_id: str,
+    payload: str = Query("jpeg", regex="^(jpeg|raw)$"),
+    rendition: Optional[str] = None,
+    quality: Optional[int] = Query(None, ge=1, le=100),
+    height: Optional[int] = Query(None, ge=16),
+    mirror: Optional[bool] = None,
+):
+    # Length-prefixed binary frames (lib/framing.py): nothing to scan for, each frame carries seq, timestamp and shape
+    stream = await run_in_threadpool(get_camera, cam_id)
+    headers = stream.get_metadata()
+    if request.method == "HEAD":
+        return Response(headers=headers, media_type=FRAMES_MEDIA_TYPE)
+    try:
+        chunks = open_frames(stream, payload, rendition, quality, height, mirror)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return StreamingResponse(chunks, headers=headers, media_type=FRAMES_MEDIA_TYPE)
+
+
+@app.websocket("/cams/{cam_id}/ws")
+async def stream_camera_websocket(
+    websocket: WebSocket,
+    cam_id: str,
+    payload: str = "jpeg",
+    rendition: Optional[str] = None,
+    quality: Optional[int] = None,
+    height: Optional[int] = None,
+    mirror: Optional[bool] = None,
+):
+    # Same binary frames as /frames, one per WebSocket message
+    try:
+        stream = await run_in_threadpool(cameras.get, cam_id)
+        chunks = open_frames(stream, payload, rendition, quality, height, mirror)
+    except (KeyError, ValueError):
+        await websocket.close(code=1008)
+        return
+    except OSError:
+        # Try again later: the source didn't open
+        await websocket.close(code=1013)
+        return
+    await websocket.accept()
+    try:
+        async for chunk in chunks:
+            # send_bytes waits for the transport; meanwhile the hub keeps only the newest frames for this client
+            await websocket.send_bytes(chunk)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await chunks.aclose()  # type: ignore
+
+
+@app.get("/metadata")
+def default_metadata():
+    # Same fields as the stream response headers, without opening a stream
+    return get_camera().get_metadata()
+
+
+@app.get("/cams/{cam_id}/metadata")
+def camera_metadata(cam_id: str):
+    return get_camera(cam_id).get_metadata()
+
+
+@app.get("/cams/{cam_id}/stats")
+def camera_stats(cam_id: str):
+    return get_camera(cam_id).get_stats()
+
+
+@app.get("/stats")
+def stream_stats():
+    stats = get_camera().get_stats()
+    if recognizer is not None:
+        stats.update(recognizer.get_stats())
+    if clip_recorder is not None:
+        stats.update(clip_recorder.get_stats())
+    return stats
+
+
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/recognition")
+def recognition_results():
+    if recognizer is None:
+        return {}
+    return {task: asdict(result) for task, result in recognizer.get_latest().items()}
@@ -0,0 +1,96 @@
+import threading
+import time
+
+import numpy as np
+
+from lib.frame_buffer import FrameCursor, FrameRing
+
+
+def image(value: int = 0) -> np.ndarray:
+    return np.full((4, 4, 3), value, dtype=np.uint8)
+
+
+def test_cursor_reads_frames_in_order():
+    ring = FrameRing(4)
+    cursor = FrameCursor(ring)
+    ring.publish(image(1))
+    ring.publish(image(2))
+    assert [cursor.read(timeout=0).seq, cursor.read(timeout=0).seq] == [0, 1]
+    assert cursor.read(timeout=0) is None
+    assert cursor.dropped == 0
+
+
+def test_cursor_starts_at_the_next_frame():
+    ring = FrameRing(4)
+    ring.publish(image())
+    cursor = FrameCursor(ring)
+    assert cursor.read(timeout=0) is None
+    ring.publish(image())
+    assert cursor.read(timeout=0).seq == 1
+
+
+def test_slow_cursor_skips_overwritten_frames():
+    ring = FrameRing(4)
+    cursor = FrameCursor(ring)
+    for value in range(10):
+        ring.publish(image(value))
+    assert cursor.lag == 10
+    # One slot of margin: the oldest frame still safe to read is last_seq - capacity + 2
+    assert cursor.read(timeout=0).seq == 7
+    assert cursor.dropped == 7
+
+
+def test_latest_read_jumps_to_the_newest_frame():
+    ring = FrameRing(4)
+    cursor = FrameCursor(ring)
+    for value in range(3):
+        ring.publish(image(value))
+    assert cursor.read(timeout=0, latest=True).seq == 2
+    assert cursor.dropped == 2
+    assert ring.latest().seq == 2
+
+
+def test_read_waits_for_the_next_frame():
+    ring = FrameRing(4)
+    cursor = FrameCursor(ring)
+    threading.Timer(0.05, ring.publish, args=(image(),)).start()
+    frame = cursor.read(timeout=2.0)
+    assert frame is not None and frame.seq == 0
+
+
+def test_close_wakes_waiting_readers():
+    ring = FrameRing(4)
+    cursor = FrameCursor(ring)
+    threading.Timer(0.05, ring.close).start()
+    started = time.monotonic()
+    assert cursor.read(timeout=5.0) is None
+    assert time.monotonic() - started < 1.0
+
+
+def test_reads_on_a_closed_ring_return_at_once():
+    # Consumers must check ring.closed themselves: read() never blocks on a closed ring
+    ring = FrameRing(4)
+    cursor = FrameCursor(ring)
+    ring.publish(image())
+    ring.close()
+    assert ring.closed
+    started = time.monotonic()
+    assert cursor.read(timeout=5.0) is None
+    assert time.monotonic() - started < 0.5
+    ring.reopen()
+    assert cursor.read(timeout=0).seq == 0
+
+
+def test_listeners_see_every_published_frame():
+    ring = FrameRing(4)
+    seen = []
+
+    def listener(frame):
+        seen.append(frame.seq)
+
+    ring.add_listener(listener)
+    ring.publish(image())
+    ring.publish(image())
+    ring.remove_listener(listener)
+    ring.publish(image())
+    assert seen == [0, 1]
@@ -0,0 +1,20 @@
+import numpy as np
+
+from lib.framing import FLAG_MIRROR, FRAME_HEADER, KIND_JPEG, KIND_RAW, pack_frame, pack_image, unpack_header
+
+
+def test_raw_frame_round_trip():
+    image = np.random.default_rng(0).integers(0, 256, (240, 320, 3), dtype=np.uint8)
+    data = pack_image(7, 123.5, image, FLAG_MIRROR)
+    header = unpack_header(data)
+    assert header == (KIND_RAW, FLAG_MIRROR, 7, 123.5, 320, 240, image.nbytes)
+    assert len(data) == FRAME_HEADER.size + image.nbytes
+    payload = np.frombuffer(data, dtype=np.uint8, offset=FRAME_HEADER.size).reshape(240, 320, 3)
+    assert np.array_equal(payload, image)
+
+
+def test_jpeg_frame_round_trip():
+    jpeg = memoryview(b"\xff\xd8jpeg\xff\xd9")
+    data = pack_frame(KIND_JPEG, 1, 0.0, 640, 480, jpeg)
+    assert unpack_header(data).length == len(jpeg)
+    assert data[FRAME_HEADER.size :] == jpeg
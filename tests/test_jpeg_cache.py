@@ -0,0 +1,116 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+import numpy as np
+
+from lib.encoders import JpegEncoder
+from lib.frame_buffer import Frame
+from lib.jpeg_cache import JpegCache
+
+
+class CountingEncoder(JpegEncoder):
+    name = "counting"
+
+    def __init__(self, delay: float = 0.0, fail: bool = False) -> None:
+        super().__init__()
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def encode(self, image, quality=None):
+        with self._lock:
+            self.calls += 1
+        # Long enough for every other subscriber to ask for the same frame meanwhile
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("encoder failed")
+        return b"\xff\xd8" + image.tobytes()[:8] + b"\xff\xd9"
+
+
+def frame(seq: int = 0) -> Frame:
+    return Frame(seq, 1.5, np.zeros((8, 8, 3), dtype=np.uint8))
+
+
+def test_concurrent_subscribers_share_one_encode():
+    encoder = CountingEncoder(delay=0.1)
+    cache = JpegCache(encoder=encoder)
+    shared = frame()
+    with ThreadPoolExecutor(16) as pool:
+        chunks = list(pool.map(lambda _: cache.get_chunk(shared, 80), range(16)))
+    assert encoder.calls == 1
+    assert all(chunk is chunks[0] for chunk in chunks)
+    assert (cache.misses, cache.hits) == (1, 15)
+
+
+def test_every_rendition_is_encoded_once():
+    encoder = CountingEncoder()
+    cache = JpegCache(encoder=encoder)
+    shared = frame()
+    for _ in range(3):
+        cache.get_chunk(shared, 80)
+        cache.get_chunk(shared, 50)
+        cache.get_chunk(shared, 80, mirror=True)
+    assert encoder.calls == 3
+
+
+def test_chunk_carries_the_frame_headers_around_the_jpeg():
+    cache = JpegCache(encoder=CountingEncoder())
+    chunk = cache.get_chunk(frame(7), 80)
+    jpeg = cache.get_jpeg(frame(7), 80)
+    assert chunk.startswith(b"--frame\r\n") and chunk.endswith(b"\r\n")
+    assert b"X-Frame-Seq: 7\r\n" in chunk
+    assert f"Content-Length: {len(jpeg)}\r\n".encode() in chunk
+    assert bytes(jpeg).startswith(b"\xff\xd8") and bytes(jpeg).endswith(b"\xff\xd9")
+
+
+def test_native_jpeg_is_forwarded_without_encoding():
+    encoder = CountingEncoder()
+    cache = JpegCache(encoder=encoder)
+    native = Frame(0, 0.0, None, jpeg=b"\xff\xd8native\xff\xd9")
+    assert bytes(cache.get_jpeg(native, 80)) == native.jpeg
+    assert encoder.calls == 0
+
+
+def test_failed_encode_reaches_every_waiter_and_is_retried():
+    encoder = CountingEncoder(delay=0.1, fail=True)
+    cache = JpegCache(encoder=encoder)
+    shared = frame()
+
+    def get():
+        try:
+            cache.get_chunk(shared, 80)
+        except RuntimeError as error:
+            return error
+        return None
+
+    with ThreadPoolExecutor(4) as pool:
+        errors = list(pool.map(lambda _: get(), range(4)))
+    assert all(isinstance(error, RuntimeError) for error in errors)
+    assert encoder.calls == 1
+    # The failed entry isn't cached: the next request encodes again
+    encoder.fail = False
+    cache.get_chunk(shared, 80)
+    assert encoder.calls == 2
+
+
+def test_capacity_evicts_the_oldest_frames():
+    encoder = CountingEncoder()
+    cache = JpegCache(capacity=2, encoder=encoder)
+    frames = [frame(seq) for seq in range(3)]
+    for item in frames:
+        cache.get_chunk(item, 80)
+    cache.get_chunk(frames[2], 80)
+    assert encoder.calls == 3
+    cache.get_chunk(frames[0], 80)
+    assert encoder.calls == 4
+
+
+def test_sizes_are_separate_entries():
+    encoder = CountingEncoder()
+    cache = JpegCache(encoder=encoder)
+    shared = frame()
+    for size in (None, (4, 4), (2, 2), (4, 4)):
+        cache.get_chunk(shared, 80, size)
+    assert encoder.calls == 3
@@ -0,0 +1,59 @@
+import pytest
+
+from lib.metrics import Histogram, MetricsRegistry
+
+
+def test_values_on_a_bound_fall_into_that_bucket():
+    # Prometheus buckets are "less than or equal": le="0.01" counts an observation of exactly 0.01
+    histogram = Histogram((0.01, 0.1, 1.0))
+    for value in (0.0, 0.01, 0.011, 0.1, 1.0, 5.0):
+        histogram.observe(value)
+    assert histogram.counts == [2, 2, 1, 1]
+    assert histogram.count == 6
+    assert histogram.sum == pytest.approx(6.121)
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry()
+    child = registry.histogram("encode_seconds", "JPEG encode time", buckets=(0.01, 0.1)).labels(camera="0")
+    for value in (0.005, 0.05, 0.05, 3.0):
+        child.observe(value)
+    assert registry.render().splitlines() == [
+        "# HELP encode_seconds JPEG encode time",
+        "# TYPE encode_seconds histogram",
+        'encode_seconds_bucket{camera="0",le="0.01"} 1',
+        'encode_seconds_bucket{camera="0",le="0.1"} 3',
+        'encode_seconds_bucket{camera="0",le="+Inf"} 4',
+        'encode_seconds_sum{camera="0"} 3.105',
+        'encode_seconds_count{camera="0"} 4',
+    ]
+
+
+def test_counters_gauges_and_collectors_render_one_line_per_child():
+    registry = MetricsRegistry()
+    frames = registry.counter("frames_total", "Captured frames")
+    frames.labels(camera="front").inc(3)
+    frames.labels(camera="back").inc()
+    registry.gauge("capture_fps", "Capture rate").labels(camera="front").set(29.5)
+    unregister = registry.collector("subscribers", "Active subscribers", lambda: [({"camera": "front"}, 2)])
+    lines = registry.render().splitlines()
+    assert 'frames_total{camera="front"} 3' in lines
+    assert 'frames_total{camera="back"} 1' in lines
+    assert "# TYPE frames_total counter" in lines
+    assert 'capture_fps{camera="front"} 29.5' in lines
+    assert 'subscribers{camera="front"} 2' in lines
+    unregister()
+    assert not any(line.startswith("subscribers{") for line in registry.render().splitlines())
+
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry()
+    registry.counter("opened_total", "Opened sources").labels(source='file:"a\\b"\n').inc()
+    assert 'opened_total{source="file:\\"a\\\\b\\"\\n"} 1' in registry.render().splitlines()
+
+
+def test_labels_resolve_to_the_same_child_in_any_order():
+    registry = MetricsRegistry()
+    family = registry.counter("reads_total", "Reads")
+    assert family.labels(camera="0", task="gauge") is family.labels(task="gauge", camera="0")
+    assert registry.counter("reads_total", "Reads") is family
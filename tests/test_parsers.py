@@ -0,0 +1,72 @@
+from typing import Iterable, List
+
+import pytest
+
+from lib.jpeg_cache import PART_HEADER
+from lib.receiver import MultipartParser, RawFrameParser
+
+PAYLOADS = [b"\xff\xd8first\xff\xd9", b"\xff\xd8" + bytes(range(256)) * 4 + b"\xff\xd9", b"\xff\xd8--fram\r\n\xff\xd9"]
+
+
+def multipart(payloads: Iterable[bytes], content_length: bool = True) -> bytes:
+    parts = []
+    for seq, payload in enumerate(payloads):
+        if content_length:
+            header = PART_HEADER % (len(payload), seq, 1.5)
+        else:
+            header = b"--frame\r\nContent-Type: image/jpeg\r\nX-Frame-Seq: %d\r\n\r\n" % seq
+        parts.append(header + payload + b"\r\n")
+    if not content_length:
+        # Without Content-Length a part only ends at the next boundary
+        parts.append(b"--frame\r\n")
+    return b"".join(parts)
+
+
+def split(data: bytes, size: int) -> List[bytes]:
+    return [data[offset : offset + size] for offset in range(0, len(data), size)]
+
+
+def feed_all(parser, chunks: Iterable[bytes]) -> List[bytes]:
+    # Payloads are views into the parser's buffer, copy them before the next chunk
+    return [bytes(payload) for chunk in chunks for payload in parser.feed(chunk)]
+
+
+@pytest.mark.parametrize("content_length", [True, False])
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64, 4096])
+def test_multipart_payloads_survive_any_split(content_length, chunk_size):
+    data = multipart(PAYLOADS, content_length)
+    assert feed_all(MultipartParser(buffer_size=64), split(data, chunk_size)) == PAYLOADS
+
+
+def test_multipart_split_inside_the_boundary():
+    data = multipart(PAYLOADS, content_length=False)
+    boundary = data.index(b"\r\n--frame", len(PAYLOADS[0]))
+    for cut in range(boundary, boundary + len(b"\r\n--frame") + 1):
+        assert feed_all(MultipartParser(), [data[:cut], data[cut:]]) == PAYLOADS
+
+
+def test_multipart_headers_belong_to_the_current_part():
+    parser = MultipartParser()
+    seqs = []
+    for _ in parser.feed(multipart(PAYLOADS)):
+        seqs.append(int(parser.headers["x-frame-seq"]))
+    assert seqs == [0, 1, 2]
+    assert parser.headers["content-length"] == str(len(PAYLOADS[-1]))
+
+
+def test_multipart_skips_a_preamble():
+    data = b"garbage before the first part\r\n" + multipart(PAYLOADS)
+    assert feed_all(MultipartParser(), split(data, 5)) == PAYLOADS
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 12, 13, 100])
+def test_raw_frames_survive_any_split(chunk_size):
+    frames = [bytes([value]) * 12 for value in range(4)]
+    assert feed_all(RawFrameParser(12), split(b"".join(frames), chunk_size)) == frames
+
+
+def test_raw_parser_keeps_a_partial_frame():
+    parser = RawFrameParser(4)
+    assert feed_all(parser, [b"abcdef"]) == [b"abcd"]
+    assert parser.filled == 2
+    assert feed_all(parser, [b"gh"]) == [b"efgh"]
@@ -0,0 +1,68 @@
+import time
+
+import pytest
+
+from lib.registry import CameraRegistry, parse_cameras
+
+SOURCES = {"front": "synthetic:64x48@30", "alias": "synthetic:64x48@30", "missing": "file:/nonexistent/video.mp4"}
+
+
+@pytest.fixture
+def registry():
+    cameras = CameraRegistry(SOURCES, idle_timeout=0.2)
+    yield cameras
+    cameras.close_all()
+
+
+def wait_for(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+def test_parse_cameras():
+    assert parse_cameras("front=1, back=synthetic:640x480@15,2") == {
+        "front": "1",
+        "back": "synthetic:640x480@15",
+        "2": "2",
+    }
+
+
+def test_ids_for_one_source_share_a_camera(registry):
+    assert registry.get("front") is registry.get("alias")
+    assert registry.opened() == ["front", "alias"]
+
+
+def test_unknown_ids_raise_key_error(registry):
+    with pytest.raises(KeyError):
+        registry.get("nope")
+
+
+def test_failed_open_is_not_registered(registry):
+    with pytest.raises(OSError):
+        registry.get("missing")
+    assert registry.opened() == []
+    # The next request tries again instead of waiting on the failed attempt
+    with pytest.raises(OSError):
+        registry.get("missing")
+
+
+def test_idle_camera_is_closed_by_the_reaper(registry):
+    camera = registry.get("front")
+    camera.start()
+    assert wait_for(lambda: camera.capturing)
+    assert wait_for(lambda: not registry.opened())
+    assert not camera.capturing
+    assert registry.get("front") is not camera
+
+
+def test_camera_with_subscribers_is_kept(registry):
+    camera = registry.get("front")
+    cursor = camera.subscribe()
+    time.sleep(0.6)
+    assert registry.opened() == ["front", "alias"]
+    camera.unsubscribe(cursor)
+    assert wait_for(lambda: not registry.opened())
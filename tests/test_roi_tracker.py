@@ -0,0 +1,51 @@
+from lib.roi_tracker import CircleTracker
+
+SHAPE = (720, 1280, 3)
+
+
+def test_full_search_until_a_circle_is_found():
+    tracker = CircleTracker()
+    assert tracker.search_region(SHAPE) is None
+    assert tracker.reset(None) is None
+    assert tracker.search_region(SHAPE) is None
+    assert tracker.full_searches == 1
+
+
+def test_roi_is_padded_around_the_tracked_circle():
+    tracker = CircleTracker(padding=0.5, max_radius_change=0.2)
+    tracker.reset((400, 300, 100))
+    assert tracker.search_region(SHAPE) == (250, 150, 550, 450, 80, 121)
+    assert tracker.roi_searches == 1
+
+
+def test_roi_is_clipped_to_the_frame():
+    tracker = CircleTracker(padding=0.5)
+    tracker.reset((50, 700, 100))
+    x0, y0, x1, y1, _, _ = tracker.search_region(SHAPE)
+    assert (x0, y0, x1, y1) == (0, 550, 200, 720)
+
+
+def test_full_search_is_forced_every_redetect_every_frames():
+    tracker = CircleTracker(redetect_every=3)
+    tracker.reset((400, 300, 100))
+    regions = [tracker.search_region(SHAPE) for _ in range(4)]
+    assert [region is not None for region in regions] == [True, True, True, False]
+    tracker.reset((400, 300, 100))
+    assert tracker.search_region(SHAPE) is not None
+
+
+def test_nearby_detection_updates_the_circle():
+    tracker = CircleTracker()
+    tracker.reset((400, 300, 100))
+    assert tracker.confirm((410, 295, 105))
+    assert tracker.circle == (410, 295, 105)
+
+
+def test_jumps_and_losses_fall_back_to_a_full_search():
+    tracker = CircleTracker(max_shift=0.25, max_radius_change=0.15)
+    tracker.reset((400, 300, 100))
+    assert not tracker.confirm(None)
+    assert not tracker.confirm((430, 300, 100))
+    assert not tracker.confirm((400, 300, 120))
+    assert tracker.fallbacks == 3
+    assert tracker.circle == (400, 300, 100)
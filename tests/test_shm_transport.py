@@ -0,0 +1,102 @@
+import os
+import struct
+import threading
+
+import numpy as np
+import pytest
+
+from lib.frame_buffer import Frame
+from lib.receiver import ClientReceiver
+from lib.shm_transport import RING_HEADER, SharedFrameReader, SharedFrameWriter, _slot_offset
+
+SHAPE = (4, 6, 3)
+
+
+@pytest.fixture
+def ring(request):
+    writer = SharedFrameWriter(f"test_{os.getpid()}_{request.node.name}"[:30], slot_size=72, slots=4, fps=20)
+    reader = SharedFrameReader(writer.shm.name)
+    yield writer, reader
+    reader.close()
+    writer.close()
+
+
+def frame(seq: int) -> Frame:
+    return Frame(seq, 100.0 + seq, np.full(SHAPE, seq, dtype=np.uint8))
+
+
+def begin_write(writer: SharedFrameWriter, seq: int) -> None:
+    # What a writer interrupted mid-copy leaves behind: the write sequence bumped, the commit sequence not yet
+    struct.pack_into("<q", writer.shm.buf, _slot_offset(seq % writer.slots, writer.slot_size), seq)
+
+
+def test_reader_gets_the_committed_frame(ring):
+    writer, reader = ring
+    writer.write(frame(0))
+    seq, timestamp, image = reader.read(timeout=1.0)
+    assert (seq, timestamp) == (0, 100.0)
+    assert image.shape == SHAPE and (image == 0).all()
+    assert reader.is_current(0)
+
+
+def test_poll_interval_is_half_a_frame(ring):
+    _, reader = ring
+    assert reader.poll_interval == pytest.approx(0.025)
+
+
+def test_slot_being_written_is_not_handed_out(ring):
+    writer, reader = ring
+    writer.write(frame(0))
+    reader.read(timeout=1.0)
+    begin_write(writer, 4)
+    assert reader.read_slot(4) is None
+    # The frame previously in that slot is gone as well
+    assert not reader.is_current(0)
+    assert reader.read(timeout=0.05) is None
+
+
+def test_reader_retries_until_the_slot_is_committed(ring):
+    writer, reader = ring
+    writer.write(frame(0))
+    reader.read(timeout=1.0)
+    begin_write(writer, 1)
+    # The ring already announces seq 1 while its slot is still being written
+    struct.pack_into("<q", writer.shm.buf, RING_HEADER.size - 8, 1)
+    threading.Timer(0.05, writer.write, args=(frame(1),)).start()
+    seq, _, image = reader.read(timeout=1.0)
+    assert seq == 1 and (image == 1).all()
+
+
+def test_view_is_detected_as_replaced(ring):
+    writer, reader = ring
+    writer.write(frame(0))
+    seq, _, image = reader.read(timeout=1.0)
+    writer.write(frame(4))
+    # The view now shows the newer frame: is_current tells the caller to discard it
+    assert (image == 4).all()
+    assert not reader.is_current(seq)
+
+
+def test_oldest_readable_frame_after_falling_behind(ring):
+    writer, reader = ring
+    for seq in range(10):
+        writer.write(frame(seq))
+    seq, _, image = reader.read(timeout=1.0, latest=False)
+    # One slot of margin behind the writer, like FrameCursor
+    assert seq == 7 and (image == 7).all()
+    assert reader.dropped == 7
+
+
+def test_receiver_yields_views_and_stops_on_close(ring):
+    writer, _ = ring
+    receiver = ClientReceiver(shm_name=writer.shm.name)
+    writer.write(frame(0))
+    frames = receiver.frames(copy=False)
+    seq, _, image = next(frames)
+    assert seq == 0 and receiver.is_current(seq)
+    # Not a copy: the slot's next frame shows through
+    writer.write(frame(4))
+    assert (image == 4).all() and not receiver.is_current(seq)
+    receiver.close()
+    assert next(frames, None) is None
+    receiver.shm_reader.close()
@@ -0,0 +1,97 @@
+import cv2
+import numpy as np
+
+from lib.text_recognition import (
+    STACK_GAP,
+    TextRecognizer,
+    find_text_regions,
+    hash_distance,
+    parse_rois,
+    perceptual_hash,
+    stack_regions,
+)
+
+
+class FakeEngine:
+    # Reads one word per call at a fixed spot of the canvas, and counts the calls
+    name = "fake"
+
+    def __init__(self) -> None:
+        self.calls = 0
+
+    def read(self, image):
+        self.calls += 1
+        return [(f"word{self.calls}", 90.0, (STACK_GAP, STACK_GAP, STACK_GAP + 10, STACK_GAP + 8))]
+
+
+def display(value: int, noise_seed: int = 0) -> np.ndarray:
+    image = np.full((360, 640, 3), 200, dtype=np.uint8)
+    cv2.putText(image, f"PRESSURE {value}", (40, 120), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (20, 20, 20), 3)
+    cv2.circle(image, (480, 250), 60, (50, 50, 50), 3)
+    noise = np.random.default_rng(noise_seed).integers(-6, 7, image.shape, dtype=np.int16)
+    return np.clip(image.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+
+def gray(image: np.ndarray) -> np.ndarray:
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+def test_hash_ignores_sensor_noise():
+    assert hash_distance(perceptual_hash(gray(display(1013, 1))), perceptual_hash(gray(display(1013, 2)))) <= 4
+
+
+def test_text_regions_skip_the_gauge_outline():
+    regions = find_text_regions(gray(display(1013)))
+    assert len(regions) == 1
+    x0, y0, x1, y1 = regions[0]
+    assert x0 < 60 and x1 > 250 and y0 < 100 < 120 < y1
+
+
+def test_static_scene_is_read_once():
+    engine = FakeEngine()
+    recognizer = TextRecognizer(engine=engine)
+    results = [recognizer.recognize(display(1013, seed)) for seed in range(10)]
+    assert engine.calls == 1
+    assert [result["cached"] for result in results] == [False] + [True] * 9
+    assert all(result["text"] == "word1" for result in results)
+    assert recognizer.skipped_frames == 9
+
+
+def test_changed_digit_is_read_again():
+    # A single digit barely moves the whole-frame hash, the region thumbnails catch it
+    engine = FakeEngine()
+    recognizer = TextRecognizer(engine=engine)
+    recognizer.recognize(display(1013))
+    assert hash_distance(perceptual_hash(gray(display(1013))), perceptual_hash(gray(display(1018)))) <= 4
+    result = recognizer.recognize(display(1018))
+    assert engine.calls == 2 and not result["cached"]
+
+
+def test_full_pass_is_forced_every_refresh_every_frames():
+    engine = FakeEngine()
+    recognizer = TextRecognizer(engine=engine, refresh_every=3)
+    for seed in range(8):
+        recognizer.recognize(display(1013, seed))
+    assert engine.calls == 2
+
+
+def test_low_confidence_words_are_dropped():
+    recognizer = TextRecognizer(engine=FakeEngine(), min_confidence=95.0)
+    assert recognizer.recognize(display(1013))["text"] == ""
+
+
+def test_boxes_map_back_to_frame_coordinates():
+    recognizer = TextRecognizer(engine=FakeEngine(), rois=parse_rois("100,50,200,40;0,200,120,30"))
+    result = recognizer.recognize(display(1013))
+    assert result["regions"] == [(100, 50, 300, 90), (0, 200, 120, 230)]
+    # The fake word sits at the top left of the first stacked region
+    assert result["boxes"] == [(100, 50, 110, 58)]
+
+
+def test_stacked_regions_are_separated_by_white_gaps():
+    image = np.zeros((100, 100), dtype=np.uint8)
+    canvas, offsets = stack_regions(image, [(0, 0, 40, 10), (10, 20, 30, 50)])
+    assert offsets == [STACK_GAP, 2 * STACK_GAP + 10]
+    assert canvas.shape == (10 + 30 + 3 * STACK_GAP, 40 + 2 * STACK_GAP)
+    assert (canvas[:STACK_GAP] == 255).all()
+    assert (canvas[offsets[1] : offsets[1] + 30, STACK_GAP : STACK_GAP + 20] == 0).all()
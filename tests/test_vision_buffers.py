@@ -0,0 +1,37 @@
+import numpy as np
+
+from lib.vision_buffers import BufferPool, circle_roi
+
+FULL = (720, 1280)
+ROI = (260, 260)
+
+
+def test_alternating_shapes_reuse_their_buffers():
+    # A tracker switching between full-frame and ROI searches must not reallocate on every switch
+    pool = BufferPool()
+    full, roi = pool.get("gray", FULL), pool.get("gray", ROI)
+    for _ in range(3):
+        assert pool.get("gray", FULL) is full
+        assert pool.get("gray", ROI) is roi
+
+
+def test_least_recently_used_shapes_are_dropped():
+    pool = BufferPool(shapes_per_name=2)
+    first = pool.get("gray", (10, 10))
+    pool.get("gray", (20, 20))
+    pool.get("gray", (10, 10))
+    pool.get("gray", (30, 30))
+    assert pool.get("gray", (10, 10)) is first
+    assert len(pool._buffers) == 2  # pylint: disable=protected-access
+
+
+def test_names_and_dtypes_are_separate_buffers():
+    pool = BufferPool()
+    gray = pool.get("gray", ROI)
+    assert pool.get("blurred", ROI) is not gray
+    assert pool.get("gray", ROI, np.float32).dtype == np.float32
+
+
+def test_circle_roi_is_clipped_to_the_frame():
+    assert circle_roi((100, 100, 50), FULL) == (47, 47, 154, 154)
+    assert circle_roi((10, 700, 50), FULL) == (0, 647, 64, 720)